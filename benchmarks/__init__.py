@@ -0,0 +1,15 @@
+"""
+БЕНЧМАРКИ
+Замеры бота на книгах разного размера без Telegram и без Яндекс.Диска:
+
+    python -m benchmarks.generate --rows 100000 -o budget.xlsx
+    python -m benchmarks.run --rows 1000,10000,100000 -o report.json
+    python -m benchmarks.run --rows 10000 --server --latency-ms 300 --error-rate 0.2
+    python -m benchmarks.loadtest --rows 10000 --users 20 --iterations 10
+
+generate — синтетическая книга с настоящей раскладкой листов,
+disk_stub — Яндекс.Диск в памяти процесса,
+fake_yandex — он же как HTTP-стенд со сбоями (YANDEX_API_BASE),
+run — замеры записи, удаления и статистики; отчёт в JSON для сравнения версий,
+loadtest — одновременные пользователи в обработчиках бота с Telegram-заглушкой
+"""
@@ -0,0 +1,190 @@
+"""
+ЯНДЕКС.ДИСК В ПАМЯТИ
+Те запросы REST API, которые делает бот: метаданные и скачивание публичного
+файла, метаданные, список, скачивание и загрузка по пути, создание папки.
+install() подменяет транспорт общих HTTP-клиентов из http_pool,
+поэтому код хранилища работает как обычно, но без сети
+"""
+
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+
+PUBLIC_PATH = "/Финансы/budget.xlsx"  # файл, на который указывает PUBLIC_KEY
+FILE_ENDPOINT = "/_stub/file"
+UPLOAD_ENDPOINT = "/_stub/upload"
+
+
+class DiskStub:
+    """Файлы и папки диска; handle() отвечает на запрос как cloud-api.yandex.net"""
+
+    def __init__(self, base_url="https://cloud-api.yandex.net"):
+        self.base_url = base_url.rstrip("/")
+        self._lock = threading.Lock()
+        self.files = {}            # путь → bytes
+        self.meta = {}             # путь → метаданные
+        self.folders = {"/"}
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    # ----- содержимое -----
+
+    def put_file(self, path, data):
+        with self._lock:
+            self.files[path] = bytes(data)
+            revision = self.meta.get(path, {}).get("revision", 0) + 1
+            self.meta[path] = {
+                "md5": hashlib.md5(data).hexdigest(),
+                "revision": revision,
+                "modified": datetime.now(timezone.utc).isoformat(),
+                "size": len(data)
+            }
+            folder = path.rsplit("/", 1)[0] or "/"
+            while folder and folder not in self.folders:
+                self.folders.add(folder)
+                folder = folder.rsplit("/", 1)[0] or "/"
+
+    def get_file(self, path):
+        with self._lock:
+            return self.files.get(path)
+
+    # ----- запросы -----
+
+    def handle(self, method, url, headers, body):
+        """(статус, заголовки, тело) ответа на запрос"""
+        parts = urlsplit(url)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        route = parts.path
+        with self._lock:
+            self.requests += 1
+            self.bytes_in += len(body or b"")
+
+        if route.endswith("/public/resources") and method == "GET":
+            return self._meta(PUBLIC_PATH)
+        if route.endswith("/public/resources/download") and method == "GET":
+            return self._href(FILE_ENDPOINT, PUBLIC_PATH)
+        if route.endswith("/resources/download") and method == "GET":
+            return self._href(FILE_ENDPOINT, params.get("path"))
+        if route.endswith("/resources/upload") and method == "GET":
+            return self._json(200, {"href": self._link(UPLOAD_ENDPOINT, params.get("path")), "method": "PUT"})
+        if route.endswith("/resources") and method == "PUT":
+            return self._make_folder(params.get("path"))
+        if route.endswith("/resources") and method == "GET":
+            path = params.get("path")
+            if path in self.folders:
+                return self._listing(path)
+            return self._meta(path)
+        if route == FILE_ENDPOINT and method == "GET":
+            data = self.get_file(params.get("path"))
+            if data is None:
+                return self._error(404, "DiskNotFoundError")
+            with self._lock:
+                self.bytes_out += len(data)
+            return 200, {"Content-Type": "application/octet-stream"}, data
+        if route == UPLOAD_ENDPOINT and method == "PUT":
+            self.put_file(params.get("path"), _file_from_body(headers, body))
+            return 201, {}, b""
+        return self._error(404, "NotFound")
+
+    def _link(self, endpoint, path):
+        return f"{self.base_url}{endpoint}?{urlencode({'path': path})}"
+
+    def _href(self, endpoint, path):
+        if self.get_file(path) is None:
+            return self._error(404, "DiskNotFoundError")
+        return self._json(200, {"href": self._link(endpoint, path), "method": "GET"})
+
+    def _meta(self, path):
+        with self._lock:
+            meta = self.meta.get(path)
+        if meta is None:
+            return self._error(404, "DiskNotFoundError")
+        return self._json(200, dict(meta, path=f"disk:{path}", type="file", name=path.rsplit("/", 1)[-1]))
+
+    def _listing(self, path):
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            names = sorted({
+                entry[len(prefix):].split("/", 1)[0]
+                for entry in self.folders | set(self.files) if entry.startswith(prefix) and entry != prefix
+            })
+            items = [{"name": name, "type": "dir" if prefix + name in self.folders else "file"} for name in names]
+        return self._json(200, {"path": f"disk:{path}", "type": "dir", "_embedded": {"items": items}})
+
+    def _make_folder(self, path):
+        with self._lock:
+            if path in self.folders:
+                return self._error(409, "DiskPathPointsToExistentDirectoryError")
+            self.folders.add(path)
+        return self._json(201, {"href": self._link("/v1/disk/resources", path)})
+
+    @staticmethod
+    def _json(status, payload):
+        return status, {"Content-Type": "application/json"}, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _error(self, status, error):
+        return self._json(status, {"error": error, "description": error})
+
+
+def _file_from_body(headers, body):
+    """Содержимое загрузки: тело запроса или первая часть multipart/form-data"""
+    content_type = next((value for key, value in headers.items() if key.lower() == "content-type"), "")
+    if not content_type.startswith("multipart/form-data"):
+        return body
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+    for part in body.split(b"--" + boundary)[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, content = part.partition(b"\r\n\r\n")
+        return content[:-2] if content.endswith(b"\r\n") else content
+    return b""
+
+
+# ========== ПОДМЕНА ТРАНСПОРТА ==========
+
+class StubAdapter(BaseAdapter):
+    """Транспорт requests, который отвечает из DiskStub"""
+
+    def __init__(self, stub):
+        super().__init__()
+        self.stub = stub
+
+    def send(self, request, **kwargs):
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        status, headers, content = self.stub.handle(request.method, request.url, request.headers, body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+def install(stub):
+    """Направить общие HTTP-клиенты бота (http_pool) в stub"""
+    import http_pool
+
+    def handler(request):
+        status, headers, content = stub.handle(request.method, str(request.url), request.headers, request.read())
+        return httpx.Response(status, headers=headers, content=content)
+
+    session = http_pool.get_session()
+    adapter = StubAdapter(stub)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    http_pool._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
@@ -0,0 +1,204 @@
+"""
+ЛОКАЛЬНЫЙ СТЕНД ЯНДЕКС.ДИСКА
+HTTP-сервер с теми же запросами, что и disk_stub, плюс управляемые сбои:
+задержка с разбросом, ограничение скорости, ответы с ошибкой и обрывы
+соединения. Бот направляется на стенд через YANDEX_API_BASE:
+
+    python -m benchmarks.fake_yandex --rows 10000 --latency-ms 300 --error-rate 0.2
+    YANDEX_API_BASE=http://127.0.0.1:8765 PUBLIC_KEY=x YANDEX_TOKEN=x python main.py
+
+Сбои можно менять на ходу: POST /_control с JSON, например {"error_rate": 1};
+GET /_control — текущие настройки и счётчики
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.disk_stub import DiskStub, PUBLIC_PATH
+
+CONTROL_PATH = "/_control"
+CHUNK = 16384
+
+
+class Faults:
+    """Настройки сбоев; меняются на ходу из любого потока"""
+
+    FIELDS = {
+        "latency_ms": 0.0,       # задержка перед ответом
+        "jitter_ms": 0.0,        # случайная добавка к задержке (0..jitter)
+        "bandwidth_kbps": 0.0,   # скорость передачи тела в обе стороны (0 — без ограничения)
+        "error_rate": 0.0,       # доля запросов, на которые отвечаем error_status
+        "error_status": 503,
+        "drop_rate": 0.0         # доля запросов, на которых соединение обрывается без ответа
+    }
+
+    def __init__(self, **values):
+        self._lock = threading.Lock()
+        self._values = dict(self.FIELDS)
+        self.update(values)
+        self.injected_errors = 0
+        self.dropped = 0
+
+    def update(self, values):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"неизвестные настройки: {', '.join(sorted(unknown))}")
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = type(self.FIELDS[key])(value)
+
+    def get(self, key):
+        with self._lock:
+            return self._values[key]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values, injected_errors=self.injected_errors, dropped=self.dropped)
+
+    def delay(self):
+        """Пауза перед ответом, с"""
+        with self._lock:
+            return (self._values["latency_ms"] + random.uniform(0, self._values["jitter_ms"])) / 1000
+
+    def roll(self):
+        """Какой сбой устроить этому запросу: "drop", "error" или None"""
+        with self._lock:
+            chance = random.random()
+            if chance < self._values["drop_rate"]:
+                self.dropped += 1
+                return "drop"
+            if chance < self._values["drop_rate"] + self._values["error_rate"]:
+                self.injected_errors += 1
+                return "error"
+            return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeYandexDisk/1.0"
+
+    def log_message(self, format, *args):
+        pass  # без строки в stderr на каждый запрос
+
+    def _throttle(self, size):
+        kbps = self.server.faults.get("bandwidth_kbps")
+        if kbps > 0:
+            time.sleep(size / (kbps * 1024))
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = bytearray()
+        while len(body) < length:
+            chunk = self.rfile.read(min(CHUNK, length - len(body)))
+            if not chunk:
+                break
+            self._throttle(len(chunk))
+            body += chunk
+        return bytes(body)
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), CHUNK):
+            chunk = body[start:start + CHUNK]
+            self._throttle(len(chunk))
+            self.wfile.write(chunk)
+
+    def _control(self, body):
+        faults = self.server.faults
+        if self.command == "POST":
+            try:
+                faults.update(json.loads(body or b"{}"))
+            except (ValueError, TypeError) as e:
+                return self._send(400, {"Content-Type": "application/json"}, json.dumps({"error": str(e)}).encode())
+        stub = self.server.stub
+        payload = dict(faults.snapshot(), requests=stub.requests, bytes_in=stub.bytes_in, bytes_out=stub.bytes_out)
+        self._send(200, {"Content-Type": "application/json"}, json.dumps(payload).encode())
+
+    def _dispatch(self):
+        body = self._read_body()
+        if self.path.split("?", 1)[0] == CONTROL_PATH:
+            return self._control(body)
+
+        faults = self.server.faults
+        time.sleep(faults.delay())
+        failure = faults.roll()
+        if failure == "drop":
+            self.close_connection = True
+            self.connection.close()
+            return
+        if failure == "error":
+            status = faults.get("error_status")
+            return self._send(status, {"Content-Type": "application/json"},
+                              json.dumps({"error": "InjectedError", "description": f"injected {status}"}).encode())
+
+        url = f"{self.server.url}{self.path}"
+        status, headers, content = self.server.stub.handle(self.command, url, dict(self.headers), body)
+        self._send(status, headers, content)
+
+    do_GET = do_PUT = do_POST = do_DELETE = _dispatch
+
+
+class FakeYandexServer(ThreadingHTTPServer):
+    """Стенд в фоновом потоке: start() → url для YANDEX_API_BASE, stop()"""
+
+    daemon_threads = True
+
+    def __init__(self, stub=None, faults=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self.stub = stub or DiskStub()
+        self.stub.base_url = self.url
+        self.faults = faults or Faults()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-yandex", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд Яндекс.Диска")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workbook", help="книга, которую отдавать как публичный файл")
+    parser.add_argument("--rows", type=int, help="или сгенерировать книгу на столько строк")
+    for field, default in Faults.FIELDS.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    stub = DiskStub()
+    if args.workbook:
+        with open(args.workbook, "rb") as f:
+            stub.put_file(PUBLIC_PATH, f.read())
+    elif args.rows:
+        from benchmarks.generate import generate_workbook
+        stub.put_file(PUBLIC_PATH, generate_workbook(args.rows))
+
+    faults = Faults(**{field: getattr(args, field) for field in Faults.FIELDS})
+    server = FakeYandexServer(stub, faults, args.host, args.port)
+    print(f"🟢 Стенд Яндекс.Диска: {server.url} (YANDEX_API_BASE={server.url})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
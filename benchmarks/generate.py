@@ -0,0 +1,114 @@
+"""
+ГЕНЕРАТОР КНИГИ
+Синтетический budget.xlsx с раскладкой, которую пишет бот:
+Расходы A–G (Дата, Категория, Подкат, Сумма, Кто, Период, Способ),
+Доходы A–D (Дата, Источник, Сумма, Период).
+Категории, плательщики и способы оплаты — из меню бота, без эмодзи
+"""
+
+import argparse
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from openpyxl import Workbook
+
+from menu import ALL_CATEGORIES, PAYERS, PAYMENT_METHODS, INCOME_SOURCES
+from yandex_disk import clean_text, get_period
+
+EXPENSE_HEADER = ["Дата", "Категория", "Подкатегория", "Сумма", "Кто", "Период", "Способ оплаты"]
+INCOME_HEADER = ["Дата", "Источник", "Сумма", "Период"]
+
+# Категория → (вес в потоке расходов, типичная сумма, ₽)
+CATEGORY_PROFILE = {
+    "Продукты": (30, 900), "Коммуналка": (2, 6500), "Транспорт": (12, 350), "Кредиты": (1, 15000),
+    "Зелень": (6, 150), "Лекарства и лечение": (4, 1200), "Сигареты и алко": (10, 450),
+    "Кошка": (3, 700), "Быт расходники": (6, 600), "Развлечения и хобби": (5, 1500),
+    "Дом/ремонт": (2, 3500), "Одежда и обувь": (3, 3000), "Красота/Уход": (3, 1800), "Другое": (4, 800)
+}
+INCOME_AMOUNTS = {"Зарплата (Жена)": 60000, "Зарплата (Муж)": 90000, "Подработка (Муж)": 15000}
+INCOME_SHARE = 0.02  # доходов примерно в 50 раз меньше, чем расходов
+
+
+def _menu():
+    """Категории, плательщики, способы и источники так, как их пишет бот"""
+    categories = [clean_text(category) for category in ALL_CATEGORIES]
+    weights = [CATEGORY_PROFILE.get(category, (1, 1000))[0] for category in categories]
+    return (
+        categories, weights,
+        [clean_text(payer) for payer in PAYERS],
+        [clean_text(method) for method in PAYMENT_METHODS],
+        [clean_text(source) for source in INCOME_SOURCES]
+    )
+
+
+def _days(count, end):
+    """Даты строк: равномерно за период, последняя — end; по возрастанию"""
+    span = max(1, min(3650, count // 8))  # около 8 расходов в день, не больше 10 лет
+    start = end - timedelta(days=span - 1)
+    for i in range(count):
+        yield start + timedelta(days=i * span // count)
+
+
+def expense_rows(count, rng, end=None):
+    """Строки листа Расходы"""
+    categories, weights, payers, methods, _ = _menu()
+    for day in _days(count, end or date.today()):
+        category = rng.choices(categories, weights)[0]
+        typical = CATEGORY_PROFILE.get(category, (1, 1000))[1]
+        amount = round(rng.lognormvariate(0, 0.6) * typical)
+        yield [
+            day.strftime("%d.%m.%y"), category, None, float(max(amount, 1)),
+            rng.choice(payers), get_period(day), rng.choice(methods)
+        ]
+
+
+def income_rows(count, rng, end=None):
+    """Строки листа Доходы"""
+    sources = _menu()[4]
+    for day in _days(count, end or date.today()):
+        source = rng.choice(sources)
+        amount = round(INCOME_AMOUNTS.get(source, 30000) * rng.uniform(0.8, 1.2))
+        yield [day.strftime("%d.%m.%y"), source, float(amount), get_period(day)]
+
+
+def generate_workbook(rows, seed=42, end=None):
+    """Книга (bytes) примерно с rows строками расходов и доходов"""
+    rng = random.Random(seed)
+    incomes = max(3, int(rows * INCOME_SHARE))
+    expenses = max(1, rows - incomes)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Расходы")
+    ws.append(EXPENSE_HEADER)
+    for row in expense_rows(expenses, rng, end):
+        ws.append(row)
+    ws = wb.create_sheet("Доходы")
+    ws.append(INCOME_HEADER)
+    for row in income_rows(incomes, rng, end):
+        ws.append(row)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая книга budget.xlsx")
+    parser.add_argument("--rows", type=int, default=10000, help="строк расходов и доходов вместе")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", help="дата последней строки, ГГГГ-ММ-ДД (по умолчанию сегодня)")
+    parser.add_argument("-o", "--output", default="budget.xlsx")
+    args = parser.parse_args()
+
+    end = datetime.strptime(args.end, "%Y-%m-%d").date() if args.end else None
+    started = time.perf_counter()
+    data = generate_workbook(args.rows, args.seed, end)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"{args.output}: {args.rows} строк, {len(data) / 1024:.0f} КБ за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""
+НАГРУЗКА НА ОБРАБОТЧИКИ
+Виртуальные пользователи одновременно проходят сценарии бота — ввод расхода,
+ввод расхода задним числом, ввод дохода, статистику через календарь
+и сравнение периодов — вызывая button_callback и обработчики сумм
+с настоящими Update/CallbackQuery/Message из python-telegram-bot.
+Вместо Telegram — StubBot, который только запоминает вызовы API,
+вместо Яндекс.Диска — disk_stub или HTTP-стенд (--server).
+
+    python -m benchmarks.loadtest --rows 10000 --users 20 --iterations 10
+    python -m benchmarks.loadtest --users 50 --mix expense=5,stats=2,compare=1 --server --latency-ms 200
+
+Отчёт: p50/p95/p99 времени обработчиков по сценариям и шагам
+и задержки event loop (насколько опаздывает таймер, пока идут сценарии)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from tracing import span
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOWS = ("expense", "archive", "income", "stats", "compare")
+DEFAULT_MIX = "expense=4,archive=1,income=1,stats=3,compare=1"
+
+
+def _percentile(ordered, share):
+    """Значение по рангу в отсортированном списке"""
+    if not ordered:
+        return 0.0
+    rank = min(len(ordered) - 1, max(0, round(share * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def _latency(samples):
+    """p50/p95/p99 замеров в миллисекундах"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(_percentile(ordered, 0.50), 2),
+        "p95_ms": round(_percentile(ordered, 0.95), 2),
+        "p99_ms": round(_percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1], 2) if ordered else 0.0
+    }
+
+
+# ========== TELEGRAM-ЗАГЛУШКА ==========
+
+class StubBot:
+    """Бот без сети: любой метод API записывается и возвращает True"""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000
+        self.defaults = None       # Message.reply_text смотрит bot.defaults
+        self.calls = Counter()
+        self.errors = Counter()    # chat_id → ответов с ❌
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            self.calls[name] += 1
+            text = kwargs.get("text")
+            if isinstance(text, str) and text.startswith("❌"):
+                self.errors[kwargs.get("chat_id")] += 1
+            with span("reply", method=name):
+                if self.latency:
+                    await asyncio.sleep(self.latency)  # round-trip до api.telegram.org
+            return True
+
+        return call
+
+
+class StubContext:
+    """Та часть ContextTypes.DEFAULT_TYPE, которой пользуются обработчики"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.user_data = {}
+        self.chat_data = {}
+
+
+class VirtualUser:
+    """Пользователь со своим чатом и user_data; собирает Update для каждого шага"""
+
+    def __init__(self, user_id, bot):
+        from telegram import Chat, User
+
+        self.bot = bot
+        self.user = User(id=user_id, first_name=f"load{user_id}", is_bot=False)
+        self.chat = Chat(id=user_id, type=Chat.PRIVATE)
+        self.context = StubContext(bot)
+        self._counter = 0
+
+    def _next_id(self):
+        self._counter += 1
+        return self._counter
+
+    def _message(self, text=None):
+        from telegram import Message
+
+        message = Message(
+            message_id=self._next_id(), date=datetime.now(), chat=self.chat, from_user=self.user, text=text
+        )
+        message.set_bot(self.bot)
+        return message
+
+    def callback(self, data):
+        from telegram import CallbackQuery, Update
+
+        query = CallbackQuery(
+            id=str(self._next_id()), from_user=self.user, chat_instance=str(self.chat.id),
+            message=self._message(), data=data
+        )
+        query.set_bot(self.bot)
+        return Update(update_id=self._next_id(), callback_query=query)
+
+    def text(self, text):
+        from telegram import Update
+
+        return Update(update_id=self._next_id(), message=self._message(text))
+
+
+# ========== СЦЕНАРИИ ==========
+
+def _day(day):
+    return day.strftime("%d.%m.%y")
+
+
+def build_flow(name, rng):
+    """Шаги сценария: (имя шага, callback_data или обработчик, текст сообщения)"""
+    import main
+
+    today = date.today()
+    category = rng.choice(main.ALL_CATEGORIES)
+    amount = str(rng.randint(50, 5000))
+    expense_choice = [
+        ("category", f"cat_{category}", None),
+        ("payer", f"payer_{rng.choice(main.PAYERS)}", None),
+        ("method", f"method_{rng.choice(main.PAYMENT_METHODS)}", None)
+    ]
+
+    if name == "expense":
+        return [("menu", "expense", None)] + expense_choice + [("amount", main.handle_expense_amount, amount)]
+    if name == "archive":
+        past = today - timedelta(days=rng.randint(1, 60))
+        return (
+            [("menu", "archive_expense", None), ("date", f"archive_expense_date_{_day(past)}", None)]
+            + expense_choice + [("amount", main.handle_archive_expense_amount, amount)]
+        )
+    if name == "income":
+        return [
+            ("menu", "income", None),
+            ("source", f"source_{rng.choice(main.INCOME_SOURCES)}", None),
+            ("amount", main.handle_income_amount, str(rng.randint(10000, 100000)))
+        ]
+    if name == "stats":
+        steps = [("menu", "stats_menu", None), ("period", "stats_period", None)]
+        kind = rng.choice(("dates", "month", "year"))
+        if kind == "dates":
+            start = today - timedelta(days=rng.randint(7, 90))
+            end = start + timedelta(days=rng.randint(0, (today - start).days))
+            return steps + [
+                ("type", "period_dates", None),
+                ("start", f"stats_start_date_{_day(start)}", None),
+                ("end", f"stats_end_date_{_day(end)}", None)
+            ]
+        if kind == "month":
+            month = today.replace(day=1) - timedelta(days=rng.randint(0, 90))
+            return steps + [("type", "period_month", None), ("month", f"stats_month_date_{_day(month)}", None)]
+        return steps + [("type", "period_year", None), ("year", f"stats_year_{today.year - rng.randint(0, 1)}", None)]
+    if name == "compare":
+        end1 = today - timedelta(days=rng.randint(31, 60))
+        start1 = end1 - timedelta(days=rng.randint(7, 30))
+        start2 = end1 + timedelta(days=1)
+        end2 = min(today, start2 + timedelta(days=(end1 - start1).days))
+        return [
+            ("menu", "stats_compare", None),
+            ("start1", f"compare1_start_date_{_day(start1)}", None),
+            ("end1", f"compare1_end_date_{_day(end1)}", None),
+            ("start2", f"compare2_start_date_{_day(start2)}", None),
+            ("end2", f"compare2_end_date_{_day(end2)}", None)
+        ]
+    raise ValueError(f"неизвестный сценарий: {name}")
+
+
+def parse_mix(text):
+    """ "expense=4,stats=2" → {сценарий: вес} """
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise ValueError(f"неизвестный сценарий: {name} (есть: {', '.join(FLOWS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("пустая смесь сценариев")
+    return mix
+
+
+# ========== EVENT LOOP ==========
+
+class LoopMonitor:
+    """Фоновая задача спит interval и записывает, на сколько опоздала"""
+
+    def __init__(self, interval=0.01, stall_threshold=0.05):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        stalls = [lag for lag in self.lags if lag >= self.stall_threshold]
+        lags = sorted(lag * 1000 for lag in self.lags)
+        return {
+            "samples": len(lags),
+            "interval_ms": self.interval * 1000,
+            "p50_lag_ms": round(_percentile(lags, 0.50), 2),
+            "p99_lag_ms": round(_percentile(lags, 0.99), 2),
+            "max_lag_ms": round(lags[-1], 2) if lags else 0.0,
+            "stalls": len(stalls),
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "stall_total_ms": round(sum(stalls) * 1000, 1)
+        }
+
+
+# ========== ПРОЦЕСС С НАГРУЗКОЙ ==========
+
+async def _load(args):
+    stub = None
+    if args.workbook:
+        from benchmarks.disk_stub import DiskStub, PUBLIC_PATH, install
+
+        stub = DiskStub()
+        with open(args.workbook, "rb") as f:
+            stub.put_file(PUBLIC_PATH, f.read())
+        install(stub)
+
+    import main
+    import storage
+    from yandex_disk import yandex_breaker
+
+    bot = StubBot(args.telegram_latency_ms)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    flow_samples = {name: [] for name in names}
+    step_samples = {}
+    flow_errors = Counter()
+    failures = []
+
+    # Книга скачивается до нагрузки: иначе первый сценарий меряет холодный старт
+    started = time.perf_counter()
+    await storage.get_statistics_async(balance=True)
+    warm_up_ms = (time.perf_counter() - started) * 1000
+
+    async def run_user(number):
+        rng = random.Random(args.seed + number)
+        user = VirtualUser(100000 + number, bot)
+        for _ in range(args.iterations):
+            name = rng.choices(names, weights)[0]
+            errors_before = bot.errors[user.chat.id]
+            total = 0.0
+            for step, action, text in build_flow(name, rng):
+                if args.think_ms:
+                    await asyncio.sleep(rng.uniform(0, args.think_ms) / 1000)
+                step_started = time.perf_counter()
+                try:
+                    if text is None:
+                        await main.button_callback(user.callback(action), user.context)
+                    else:
+                        await action(user.text(text), user.context)
+                except Exception as e:
+                    failures.append(f"{name}/{step}: {type(e).__name__}: {e}")
+                    flow_errors[name] += 1
+                    break
+                elapsed = (time.perf_counter() - step_started) * 1000
+                step_samples.setdefault(f"{name}/{step}", []).append(elapsed)
+                total += elapsed
+            else:
+                flow_samples[name].append(total)
+            if bot.errors[user.chat.id] > errors_before:
+                flow_errors[name] += 1
+            user.context.user_data.clear()
+
+    monitor = LoopMonitor(args.probe_ms / 1000, args.stall_ms / 1000)
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(number) for number in range(args.users)))
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    started = time.perf_counter()
+    await storage.writer.flush()
+    flush_ms = (time.perf_counter() - started) * 1000
+    await storage.writer.stop()
+
+    completed = sum(len(samples) for samples in flow_samples.values())
+    result = {
+        "users": args.users,
+        "iterations": args.iterations,
+        "think_ms": args.think_ms,
+        "telegram_latency_ms": args.telegram_latency_ms,
+        "mix": mix,
+        "wall_s": round(wall, 2),
+        "flows_per_s": round(completed / wall, 1) if wall else 0.0,
+        "warm_up_ms": round(warm_up_ms, 1),
+        "final_flush_ms": round(flush_ms, 1),
+        "flows": {
+            name: dict(_latency(samples), errors=flow_errors[name])
+            for name, samples in flow_samples.items() if samples or flow_errors[name]
+        },
+        "steps": {name: _latency(samples) for name, samples in sorted(step_samples.items())},
+        "event_loop": monitor.stats(),
+        "telegram_calls": dict(bot.calls),
+        "failures": failures[:20],
+        "yandex_disk": yandex_breaker.snapshot()
+    }
+    if stub is not None:
+        result["disk"] = {"requests": stub.requests, "bytes_in": stub.bytes_in, "bytes_out": stub.bytes_out}
+    return result
+
+
+def _worker(args):
+    """Нагрузка в этом процессе: результат — JSON последней строкой stdout"""
+    logging.disable(logging.WARNING)
+    result = asyncio.run(_load(args))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+# ========== ОРКЕСТРАЦИЯ ==========
+
+def _print_report(report):
+    print(f"\n👥 {report['users']} пользователей × {report['iterations']} сценариев "
+          f"за {report['wall_s']} с ({report['flows_per_s']} сценариев/с)")
+    for name, summary in report["flows"].items():
+        print(f"  {name:<10} n={summary['count']:<5} p50 {summary['p50_ms']:>9.2f}  p95 {summary['p95_ms']:>9.2f}  "
+              f"p99 {summary['p99_ms']:>9.2f} мс   ошибок {summary['errors']}")
+    slowest = sorted(report["steps"].items(), key=lambda item: item[1]["p99_ms"], reverse=True)[:5]
+    print("  Самые долгие шаги (p99): " + ", ".join(f"{name} {summary['p99_ms']:.1f} мс" for name, summary in slowest))
+    loop = report["event_loop"]
+    print(f"  Event loop: p99 опоздания {loop['p99_lag_ms']} мс, max {loop['max_lag_ms']} мс, "
+          f"{loop['stalls']} остановок ≥ {loop['stall_threshold_ms']:.0f} мс, всего {loop['stall_total_ms']} мс")
+    for failure in report["failures"]:
+        print(f"  ⚠️ {failure}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на обработчики бота без Telegram")
+    parser.add_argument("--rows", type=int, default=10000, help="строк в синтетической книге")
+    parser.add_argument("--users", type=int, default=10, help="одновременных пользователей")
+    parser.add_argument("--iterations", type=int, default=10, help="сценариев на пользователя")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"веса сценариев: {', '.join(FLOWS)}")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="пауза пользователя между шагами (0..think)")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0, help="задержка каждого вызова Telegram API")
+    parser.add_argument("--probe-ms", type=float, default=10.0, help="период замера event loop")
+    parser.add_argument("--stall-ms", type=float, default=50.0, help="опоздание, которое считается остановкой")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="loadtest-report.json")
+    parser.add_argument("--server", action="store_true", help="ходить на HTTP-стенд, а не в Яндекс.Диск в памяти")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка стенда (с --server)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workbook", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        return
+    parse_mix(args.mix)  # ошибка в смеси — до генерации книги
+
+    from benchmarks.generate import generate_workbook
+    from benchmarks.run import _git_commit
+    from config import VERSION
+
+    data = generate_workbook(args.rows, args.seed)
+    forwarded = [
+        "--users", str(args.users), "--iterations", str(args.iterations), "--mix", args.mix,
+        "--think-ms", str(args.think_ms), "--telegram-latency-ms", str(args.telegram_latency_ms),
+        "--probe-ms", str(args.probe_ms), "--stall-ms", str(args.stall_ms), "--seed", str(args.seed)
+    ]
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        BOT_TOKEN="",
+        YANDEX_TOKEN="benchmark",
+        PUBLIC_KEY="benchmark",
+        PARTITIONS_ENABLED="0",
+        LOCAL_CACHE_TO_DISK="0"
+    )
+
+    with tempfile.TemporaryDirectory(prefix="budget-load-") as workdir:
+        command = [sys.executable, "-m", "benchmarks.loadtest", "--worker"] + forwarded
+        server = None
+        if args.server:
+            from benchmarks.disk_stub import PUBLIC_PATH
+            from benchmarks.fake_yandex import Faults, FakeYandexServer
+
+            server = FakeYandexServer(faults=Faults(latency_ms=args.latency_ms, error_rate=args.error_rate))
+            server.stub.put_file(PUBLIC_PATH, data)
+            env["YANDEX_API_BASE"] = server.start()
+        else:
+            workbook_path = os.path.join(workdir, "source.xlsx")
+            with open(workbook_path, "wb") as f:
+                f.write(data)
+            command += ["--workbook", workbook_path]
+
+        print(f"⏱ {args.users} пользователей, книга {args.rows} строк...", flush=True)
+        try:
+            process = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        finally:
+            if server is not None:
+                server.stop()
+    if process.returncode != 0:
+        raise SystemExit(f"❌ Нагрузка не удалась:\n{process.stderr[-2000:]}")
+
+    report = json.loads(process.stdout.strip().splitlines()[-1])
+    report.update({
+        "version": VERSION,
+        "commit": _git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": args.rows,
+        "transport": "http" if args.server else "memory"
+    })
+    if server is not None:
+        report["faults"] = server.faults.snapshot()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    _print_report(report)
+    print(f"\n✅ Отчёт: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
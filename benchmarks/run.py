@@ -0,0 +1,255 @@
+"""
+ЗАМЕРЫ
+Для каждого размера книги запускается отдельный процесс с чистым состоянием
+(индекс, журнал, локальная копия) и Яндекс.Диском в памяти. Замеряются
+запись и удаление, статистика во всех режимах, статистика за период
+и сравнение периодов. Результат — JSON-отчёт; --baseline печатает
+изменение медиан относительно прошлого отчёта.
+С --server вместо Яндекс.Диска в памяти поднимается HTTP-стенд (fake_yandex)
+с заданной задержкой, скоростью и долей ошибок
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = "1000,10000,100000"
+
+
+def _summary(samples):
+    """Сводка замеров в миллисекундах"""
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0], 2),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "max_ms": round(ordered[-1], 2)
+    }
+
+
+# ========== ПРОЦЕСС С ЗАМЕРАМИ ==========
+
+async def _measure(workbook_path, repeat):
+    stub = None
+    if workbook_path:
+        from benchmarks.disk_stub import DiskStub, PUBLIC_PATH, install
+
+        stub = DiskStub()
+        with open(workbook_path, "rb") as f:
+            stub.put_file(PUBLIC_PATH, f.read())
+        install(stub)
+    # без книги бот ходит на стенд по YANDEX_API_BASE
+
+    import main
+    import storage
+    from yandex_disk import yandex_breaker
+
+    ops = {}
+
+    async def timed(name, operation, runs=repeat):
+        # Отказы (ответ с ❌, несостоявшаяся загрузка, исключение) считаются, а не прерывают
+        # замеры: с --error-rate так видно, сколько из них повторы и предохранитель не спасли
+        samples = []
+        errors = 0
+        for _ in range(runs):
+            started = time.perf_counter()
+            try:
+                result = await operation()
+                failed = result is False or (isinstance(result, str) and result.startswith("❌"))
+            except Exception:
+                failed = True
+            samples.append((time.perf_counter() - started) * 1000)
+            errors += failed
+        ops[name] = dict(_summary(samples), errors=errors)
+
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    two_months_ago = today - timedelta(days=60)
+    fmt = lambda day: day.strftime("%d.%m.%y")
+
+    # Первый запрос: скачивание книги и построение индекса
+    await timed("stats_cold", lambda: storage.get_statistics_async(balance=True), runs=1)
+
+    for name, kwargs in [
+        ("stats_categories", {"by_categories": True}),
+        ("stats_balance", {"balance": True}),
+        ("stats_period_current", {"period": "current"}),
+        ("stats_period_previous", {"period": "previous"}),
+        ("stats_period_all", {"period": "all"})
+    ]:
+        await timed(name, lambda kwargs=kwargs: storage.get_statistics_async(**kwargs))
+
+    await timed("get_statistics_period", lambda: main.get_statistics_period(fmt(month_ago), fmt(today)))
+    await timed("compare_periods", lambda: main.compare_periods(
+        fmt(two_months_ago), fmt(month_ago), fmt(month_ago + timedelta(days=1)), fmt(today)
+    ))
+
+    category, payer, method = main.ALL_CATEGORIES[0], main.PAYERS[0], main.PAYMENT_METHODS[1]
+    await timed("add_expense", lambda: storage.add_expense_async(category, 500, payer, method))
+    await timed("flush_upload", storage.writer.flush, runs=1)
+    await timed("stats_after_write", lambda: storage.get_statistics_async(balance=True))
+    await timed("delete_last", lambda: storage.delete_last_async("Расходы"))
+
+    await storage.writer.stop()
+    result = {"ops": ops, "yandex_disk": yandex_breaker.snapshot()}
+    if stub is not None:
+        result["disk"] = {"requests": stub.requests, "bytes_in": stub.bytes_in, "bytes_out": stub.bytes_out}
+    return result
+
+
+def _worker(args):
+    """Замеры в этом процессе: результат — JSON последней строкой stdout"""
+    logging.disable(logging.WARNING)  # логи бота не мешают замерам
+    result = asyncio.run(_measure(args.workbook, args.repeat))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+# ========== ОРКЕСТРАЦИЯ ==========
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _run_size(rows, repeat, workdir, faults=None):
+    from benchmarks.generate import generate_workbook
+
+    started = time.perf_counter()
+    data = generate_workbook(rows)
+    generated = time.perf_counter() - started
+
+    size_dir = os.path.join(workdir, str(rows))
+    os.makedirs(size_dir, exist_ok=True)
+    workbook_path = os.path.join(size_dir, "source.xlsx")
+    with open(workbook_path, "wb") as f:
+        f.write(data)
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        BOT_TOKEN="",
+        YANDEX_TOKEN="benchmark",
+        PUBLIC_KEY="benchmark",
+        PARTITIONS_ENABLED="0",
+        LOCAL_CACHE_TO_DISK="0"
+    )
+    command = [sys.executable, "-m", "benchmarks.run", "--worker", "--repeat", str(repeat)]
+
+    server = None
+    if faults is not None:
+        from benchmarks.disk_stub import PUBLIC_PATH
+        from benchmarks.fake_yandex import FakeYandexServer
+
+        server = FakeYandexServer(faults=faults)
+        server.stub.put_file(PUBLIC_PATH, data)
+        env["YANDEX_API_BASE"] = server.start()
+    else:
+        command += ["--workbook", workbook_path]
+
+    try:
+        process = subprocess.run(command, cwd=size_dir, env=env, capture_output=True, text=True)
+    finally:
+        if server is not None:
+            server.stop()
+    if process.returncode != 0:
+        raise RuntimeError(f"замер на {rows} строках не удался:\n{process.stderr[-2000:]}")
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result.update({"rows": rows, "file_kb": round(len(data) / 1024), "generate_s": round(generated, 2)})
+    if server is not None:
+        stub = server.stub
+        result["disk"] = {"requests": stub.requests, "bytes_in": stub.bytes_in, "bytes_out": stub.bytes_out}
+        result["faults"] = server.faults.snapshot()
+    return result
+
+
+def _print_report(report, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {result["rows"]: result["ops"] for result in baseline["results"]}
+    for result in report["results"]:
+        print(f"\n📊 {result['rows']} строк ({result['file_kb']} КБ)")
+        for name, summary in result["ops"].items():
+            line = (f"  {name:<24} p50 {summary['p50_ms']:>10.2f} мс   max {summary['max_ms']:>10.2f} мс"
+                    f"   ошибок {summary.get('errors', 0)}")
+            old = previous.get(result["rows"], {}).get(name)
+            if old and old["p50_ms"]:
+                line += f"   {(summary['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100:+.1f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры бота на синтетических книгах")
+    parser.add_argument("--rows", default=DEFAULT_SIZES, help="размеры книг через запятую (до 1000000)")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждой операции")
+    parser.add_argument("-o", "--output", default="benchmark-report.json")
+    parser.add_argument("--baseline", help="прошлый отчёт для сравнения")
+    parser.add_argument("--workdir", help="куда класть книги и состояние (по умолчанию — временная папка)")
+    parser.add_argument("--server", action="store_true", help="ходить на HTTP-стенд, а не в Яндекс.Диск в памяти")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка стенда (с --server)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workbook", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        return
+
+    from config import VERSION
+
+    faults = None
+    if args.server:
+        from benchmarks.fake_yandex import Faults
+        faults = Faults(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, bandwidth_kbps=args.bandwidth_kbps,
+            error_rate=args.error_rate, drop_rate=args.drop_rate
+        )
+
+    sizes = [int(size) for size in args.rows.split(",") if size.strip()]
+    report = {
+        "version": VERSION,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "transport": "http" if args.server else "memory",
+        "results": []
+    }
+    with tempfile.TemporaryDirectory(prefix="budget-bench-") as tmp:
+        workdir = args.workdir or tmp
+        for rows in sizes:
+            print(f"⏱ {rows} строк...", flush=True)
+            report["results"].append(_run_size(rows, args.repeat, workdir, faults))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_report(report, baseline)
+    print(f"\n✅ Отчёт: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
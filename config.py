@@ -11,11 +11,56 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 # ========== ЯНДЕКС.ДИСК ==========
 YANDEX_TOKEN = os.getenv("YANDEX_TOKEN", "")
 PUBLIC_KEY = os.getenv("PUBLIC_KEY", "")
+YANDEX_API_BASE = os.getenv("YANDEX_API_BASE", "https://cloud-api.yandex.net").rstrip("/")  # для локального стенда
 
 # ========== НАСТРОЙКИ ==========
 LOCAL_EXCEL_PATH = "budget.xlsx"
+CACHE_META_PATH = os.getenv("CACHE_META_PATH", "budget.meta.json")  # версия локальной копии
+LOCAL_CACHE_TO_DISK = os.getenv("LOCAL_CACHE_TO_DISK", "0") == "1"  # хранить копию книги на диске между запусками
 VERSION = "6.2"
 
+# ========== ПОВТОРЫ И ПРЕДОХРАНИТЕЛЬ ЯНДЕКС.ДИСКА ==========
+YANDEX_RETRY_ATTEMPTS = int(os.getenv("YANDEX_RETRY_ATTEMPTS", 3))
+YANDEX_RETRY_BASE_DELAY = float(os.getenv("YANDEX_RETRY_BASE_DELAY", 0.5))  # секунд, удваивается с каждой попыткой
+YANDEX_RETRY_MAX_DELAY = float(os.getenv("YANDEX_RETRY_MAX_DELAY", 8))
+YANDEX_BREAKER_THRESHOLD = int(os.getenv("YANDEX_BREAKER_THRESHOLD", 5))  # отказов подряд до размыкания
+YANDEX_BREAKER_RESET = float(os.getenv("YANDEX_BREAKER_RESET", 30))  # секунд до пробного запроса
+
+# ========== HTTP ==========
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))  # соединений на хост
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))  # секунд
+
+# ========== ЖУРНАЛ ЗАПИСЕЙ ==========
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "journal.jsonl")
+JOURNAL_FLUSH_INTERVAL = int(os.getenv("JOURNAL_FLUSH_INTERVAL", 30))  # секунд
+JOURNAL_FLUSH_MAX_ENTRIES = int(os.getenv("JOURNAL_FLUSH_MAX_ENTRIES", 10))
+
+# ========== ИНДЕКС КНИГИ ==========
+LEDGER_DB_PATH = os.getenv("LEDGER_DB_PATH", "ledger.db")  # SQLite-зеркало строк книги
+CACHE_REFRESH_INTERVAL = int(os.getenv("CACHE_REFRESH_INTERVAL", 60))  # секунд между фоновыми сверками
+CACHE_IDLE_SECONDS = int(os.getenv("CACHE_IDLE_SECONDS", 20))  # сверяемся, если столько секунд не было запросов
+
+# ========== ЗАКРЫТЫЕ ГОДЫ ==========
+PARTITIONS_ENABLED = os.getenv("PARTITIONS_ENABLED", "0") == "1"  # читать /Финансы/<год>/budget.xlsx; строки года переносятся вручную
+PARTITIONS_CACHE_PATH = os.getenv("PARTITIONS_CACHE_PATH", "partitions.json")  # сводки закрытых лет
+PARTITIONS_CHECK_INTERVAL = int(os.getenv("PARTITIONS_CHECK_INTERVAL", 3600))  # секунд между сверками списка лет
+
+# ========== ТРАССИРОВКА ==========
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"  # дерево шагов для каждого обновления Telegram
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 200))  # последних трасс в памяти
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 1000))  # с какой длительности обновление считается медленным
+
+# ========== ПРОФИЛИРОВАНИЕ ==========
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # доступ к /debug/traces, /debug/profile, /debug/memory; пусто — выключены
+ADMIN_IDS = {int(part) for part in os.getenv("ADMIN_IDS", "").split(",") if part.strip().isdigit()}  # кому можно /profile
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))  # период снятия стеков
+
+# ========== ПАМЯТЬ ==========
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", 0))  # выше — статистика без кэшей в памяти; 0 — без бюджета
+MEMORY_SAMPLE_MS = float(os.getenv("MEMORY_SAMPLE_MS", 50))  # период замера RSS, пока идёт операция
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "0") == "1"  # tracemalloc с самого старта (медленнее)
+
 # ========== ДЛЯ ВЕБ-СЕРВЕРА И ПИНГА ==========
 PORT = int(os.getenv("PORT", 10000))
 RENDER_URL = os.getenv("RENDER_URL", "")  # Ваш URL на Render
@@ -0,0 +1,72 @@
+"""
+ОБЩИЙ ПУЛ HTTP-СОЕДИНЕНИЙ
+Keep-alive соединения для Яндекс.Диска, Telegram и авто-пинга
+"""
+
+import logging
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_POOL_SIZE, HTTP_KEEPALIVE_EXPIRY
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+
+
+def get_session():
+    """Общая requests.Session: соединения и TLS-рукопожатия переиспользуются"""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_SIZE,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=0  # повторы делает вызывающий код
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                logger.info(f"🔌 HTTP-пул создан (размер {HTTP_POOL_SIZE})")
+    return _session
+
+
+def get_async_client():
+    """Общий httpx.AsyncClient (создаётся в работающем event loop)"""
+    global _async_client
+
+    if _async_client is None or _async_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+        _async_client = httpx.AsyncClient(limits=limits, timeout=30, follow_redirects=True)
+    return _async_client
+
+
+async def close_async_client():
+    """Закрыть асинхронный клиент (при остановке приложения)"""
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def close_session():
+    """Закрыть общую requests.Session"""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
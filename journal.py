@@ -0,0 +1,122 @@
+"""
+ЖУРНАЛ ОТЛОЖЕННЫХ ЗАПИСЕЙ
+Записи сразу сохраняются на диск, а в Excel переносятся пачкой.
+Перед загрузкой книги в журнал пишется отметка: какие записи она содержит
+и какой у неё MD5. Если процесс упал между загрузкой и очисткой журнала,
+по отметке видно, что эти записи уже в облаке, и повторно они не вносятся
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class WriteJournal:
+    """Append-only журнал (outbox) строк, ещё не перенесённых в Excel"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._uploads = {}  # MD5 отправленной книги → id записей в ней
+        self._entries = self._load()
+        if self._entries:
+            logger.info(f"📒 В журнале найдено неперенесённых записей: {len(self._entries)}")
+
+    def _load(self):
+        """Прочитать журнал с диска (битые строки пропускаются)"""
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Пропущена повреждённая строка журнала: {line[:80]}")
+                        continue
+                    if "upload" in record:
+                        self._uploads.setdefault(record["upload"], set()).update(record["ids"])
+                    else:
+                        entries.append(record)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _rewrite(self):
+        """Атомарно перезаписать журнал текущими записями"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            for md5, ids in self._uploads.items():
+                f.write(json.dumps({"upload": md5, "ids": sorted(ids)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def append(self, sheet, values):
+        """Записать строку в журнал (сразу на диск)"""
+        entry = {
+            "id": uuid.uuid4().hex,
+            "sheet": sheet,
+            "values": values,
+            "ts": time.time()
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries.append(entry)
+        return entry
+
+    def pending(self):
+        """Копия списка неперенесённых записей"""
+        with self._lock:
+            return list(self._entries)
+
+    def remove(self, entry_ids):
+        """Убрать перенесённые в Excel записи (и отметки о загрузках с ними)"""
+        entry_ids = set(entry_ids)
+        with self._lock:
+            self._entries = [e for e in self._entries if e["id"] not in entry_ids]
+            self._uploads = {md5: ids - entry_ids for md5, ids in self._uploads.items() if ids - entry_ids}
+            self._rewrite()
+
+    def mark_upload(self, entry_ids, md5):
+        """Перед загрузкой: книга с этим MD5 содержит записи entry_ids"""
+        with self._lock:
+            if set(entry_ids) <= self._uploads.get(md5, set()):
+                return  # повторная попытка с той же книгой
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"upload": md5, "ids": list(entry_ids)}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._uploads.setdefault(md5, set()).update(entry_ids)
+
+    def uploaded_in(self, md5):
+        """id записей журнала, которые уже есть в книге с этим MD5"""
+        with self._lock:
+            pending = {e["id"] for e in self._entries}
+            return self._uploads.get(md5, set()) & pending
+
+    def pop_last(self, sheet):
+        """Убрать последнюю неперенесённую запись листа (или None)"""
+        with self._lock:
+            for i in range(len(self._entries) - 1, -1, -1):
+                if self._entries[i]["sheet"] == sheet:
+                    entry = self._entries.pop(i)
+                    self._rewrite()
+                    return entry
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,559 @@
+"""
+ИНДЕКС КНИГИ В SQLITE
+Локальное зеркало строк листов Расходы/Доходы с индексами по дате,
+категории, периоду и плательщику, и готовые итоги по дням.
+Статистика считается SQL-запросами, без чтения xlsx.
+"""
+
+import bisect
+import hashlib
+import io
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from openpyxl import load_workbook
+
+from config import LEDGER_DB_PATH
+from memory import memory
+from metrics import AGGREGATION_SECONDS
+from tracing import span
+from ledger_stats import (
+    EXPENSE_SHEETS, INCOME_SHEETS, EXPENSE_COLUMNS, INCOME_COLUMNS,
+    LedgerSummary, PeriodStats, parse_amount, parse_date, _pad
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    row INTEGER NOT NULL,       -- номер строки на листе
+    day INTEGER,                -- date.toordinal() или NULL
+    category TEXT,
+    amount REAL,
+    payer TEXT,
+    period TEXT,
+    method TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_row ON expenses(row);
+CREATE INDEX IF NOT EXISTS idx_expenses_day ON expenses(day);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category, day);
+CREATE INDEX IF NOT EXISTS idx_expenses_period ON expenses(period);
+CREATE INDEX IF NOT EXISTS idx_expenses_payer ON expenses(payer, day);
+
+CREATE TABLE IF NOT EXISTS incomes (
+    row INTEGER NOT NULL,
+    day INTEGER,
+    source TEXT,
+    amount REAL,
+    period TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_incomes_row ON incomes(row);
+CREATE INDEX IF NOT EXISTS idx_incomes_day ON incomes(day);
+CREATE INDEX IF NOT EXISTS idx_incomes_period ON incomes(period);
+
+-- что именно отражено в таблицах: лист, последняя строка и контрольная сумма строк
+CREATE TABLE IF NOT EXISTS sheets (
+    kind TEXT PRIMARY KEY,
+    sheet TEXT,
+    last_row INTEGER NOT NULL DEFAULT 0,
+    checksum TEXT NOT NULL DEFAULT '0'
+);
+
+-- итоги по (лист, категория/источник, кто, способ, период, день);
+-- пустое значение ключа — '' (и 0 для дня), чтобы работал ON CONFLICT
+CREATE TABLE IF NOT EXISTS aggregates (
+    sheet TEXT NOT NULL,
+    category TEXT NOT NULL,
+    payer TEXT NOT NULL,
+    method TEXT NOT NULL,
+    period TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    total REAL NOT NULL,
+    entries INTEGER NOT NULL,
+    PRIMARY KEY (sheet, category, payer, method, period, day)
+);
+CREATE INDEX IF NOT EXISTS idx_aggregates_day ON aggregates(sheet, day);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SCHEMA_VERSION = "2"  # при смене схемы индекс строится заново
+CHECKSUM_MOD = 2 ** 64
+INSERT_BATCH = 500
+
+
+def _text(value):
+    """Текст ячейки (пустая ячейка — None)"""
+    return str(value) if value else None
+
+
+def _day(value):
+    day = parse_date(value) if value else None
+    return day.toordinal() if day else None
+
+
+def _expense_record(row):
+    """(day, category, amount, payer, period, method) из строки листа Расходы"""
+    return (_day(row[0]), _text(row[1]), parse_amount(row[3]),
+            _text(row[4]), _text(row[5]), _text(row[6]))
+
+
+def _income_record(row):
+    """(day, source, amount, period) из строки листа Доходы"""
+    return (_day(row[0]), _text(row[1]), parse_amount(row[2]), _text(row[3]))
+
+
+def _expense_key(record):
+    day, category, amount, payer, period, method = record
+    return (category or "", payer or "", method or "", period or "", day or 0), amount
+
+
+def _income_key(record):
+    day, source, amount, period = record
+    return (source or "", "", "", period or "", day or 0), amount
+
+
+AGGREGATE_KEYS = {"expenses": _expense_key, "incomes": _income_key}
+
+UPSERT_AGGREGATE = """
+INSERT INTO aggregates(sheet, category, payer, method, period, day, total, entries)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(sheet, category, payer, method, period, day)
+DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries
+"""
+
+
+# kind → (таблица, колонки, ширина строки листа, разбор строки, подходящие листы)
+TABLES = {
+    "expenses": ("expenses", ("day", "category", "amount", "payer", "period", "method"),
+                 EXPENSE_COLUMNS, _expense_record, EXPENSE_SHEETS),
+    "incomes": ("incomes", ("day", "source", "amount", "period"),
+                INCOME_COLUMNS, _income_record, INCOME_SHEETS)
+}
+
+
+def _row_hash(row_num, record):
+    digest = hashlib.blake2b(repr((row_num, record)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+# ========== ПРЕФИКСНЫЕ СУММЫ ПО ДНЯМ ==========
+
+class PrefixSeries:
+    """Отсортированные дни и накопленные суммы: итог за диапазон — два бинарных поиска"""
+
+    def __init__(self):
+        self.days = []
+        self.totals = []   # totals[i] — сумма за все дни до days[i] включительно
+        self.counts = []
+
+    def add(self, day, total, count):
+        """Добавить итог дня. False — день не последний, ряд нужно строить заново"""
+        if self.days and day < self.days[-1]:
+            return False
+        if self.days and day == self.days[-1]:
+            self.totals[-1] += total
+            self.counts[-1] += count
+        else:
+            self.days.append(day)
+            self.totals.append((self.totals[-1] if self.totals else 0) + total)
+            self.counts.append((self.counts[-1] if self.counts else 0) + count)
+        return True
+
+    def between(self, first_day, last_day):
+        """(сумма, число строк) за дни first_day..last_day"""
+        i = bisect.bisect_left(self.days, first_day)
+        j = bisect.bisect_right(self.days, last_day)
+        if j <= i:
+            return 0, 0
+        total = self.totals[j - 1] - (self.totals[i - 1] if i else 0)
+        count = self.counts[j - 1] - (self.counts[i - 1] if i else 0)
+        return total, count
+
+
+class DateIndex:
+    """Префиксные суммы доходов, расходов и расходов по каждой категории"""
+
+    def __init__(self):
+        self.incomes = PrefixSeries()
+        self.expenses = PrefixSeries()
+        self.categories = {}
+
+    def add(self, kind, category, day, total, count):
+        """Учесть изменение итогов дня. False — индекс устарел"""
+        if not day:
+            return True
+        if kind == "incomes":
+            return self.incomes.add(day, total, count)
+        if not category:
+            return True  # в статистику за период идут только расходы с категорией
+        series = self.categories.setdefault(category, PrefixSeries())
+        return series.add(day, total, count) and self.expenses.add(day, total, count)
+
+    def period_stats(self, start, end):
+        stats = PeriodStats(start, end)
+        bounds = (start.toordinal(), end.toordinal())
+        stats.income_total, stats.income_rows = self.incomes.between(*bounds)
+        stats.expense_total, stats.expense_rows = self.expenses.between(*bounds)
+        for category, series in self.categories.items():
+            total, count = series.between(*bounds)
+            if count:
+                stats.expenses_by_category[category] = total
+        return stats
+
+
+class LedgerIndex:
+    """
+    SQLite-зеркало книги.
+    Помнит версию книги, которую отражает: пока версия не сменилась, xlsx не читается.
+    При смене версии дописываются только новые строки, если старые не менялись
+    (это проверяет контрольная сумма), иначе лист перечитывается целиком.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self.generation = 0   # растёт при каждой синхронизации с файлом
+        self._dates = None    # DateIndex, строится при первом запросе за период
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if not row or row[0] != SCHEMA_VERSION:
+                for table in ("expenses", "incomes", "aggregates", "sheets", "meta"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                self._conn.execute("INSERT INTO meta(key, value) VALUES ('schema', ?)", (SCHEMA_VERSION,))
+            for kind in TABLES:
+                self._conn.execute("INSERT OR IGNORE INTO sheets(kind) VALUES (?)", (kind,))
+            self._conn.commit()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ----- версия -----
+
+    @property
+    def version(self):
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            return row[0] if row else None
+
+    def set_version(self, version):
+        """Отметить, что таблицы соответствуют этой версии книги"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('version', ?)", (version,))
+            conn.commit()
+
+    def _state(self, kind):
+        sheet, last_row, checksum = self._connect().execute(
+            "SELECT sheet, last_row, checksum FROM sheets WHERE kind = ?", (kind,)
+        ).fetchone()
+        return sheet, last_row, int(checksum)
+
+    def _set_state(self, kind, sheet, last_row, checksum):
+        self._connect().execute(
+            "UPDATE sheets SET sheet = ?, last_row = ?, checksum = ? WHERE kind = ?",
+            (sheet, last_row, str(checksum), kind)
+        )
+
+    def _kind_of(self, sheet_name):
+        """Какая таблица отражает лист (или None)"""
+        for kind in TABLES:
+            if self._state(kind)[0] == sheet_name:
+                return kind
+        return None
+
+    # ----- синхронизация с xlsx -----
+
+    def sync(self, data, version=None):
+        """
+        Привести индекс к версии книги (bytes). version — MD5 облачной версии;
+        без него версией считается MD5 самого содержимого.
+        True — книгу пришлось читать
+        """
+        version = version or f"local:{hashlib.md5(data).hexdigest()}"
+        with self._lock:
+            if version == self.version:
+                return False
+
+            started = time.perf_counter()
+            with span("parse", op="index_sync"):
+                wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+                try:
+                    added = {}
+                    for kind, (_, _, _, _, candidates) in TABLES.items():
+                        sheet_name = next((name for name in candidates if name in wb.sheetnames), None)
+                        added[kind] = self._sync_sheet(wb[sheet_name] if sheet_name else None, kind, sheet_name)
+                except Exception:
+                    self._conn.rollback()
+                    raise
+                finally:
+                    wb.close()
+
+            self._connect().execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('version', ?)", (version,))
+            self._conn.commit()
+            self.generation += 1
+            self._dates = None
+            AGGREGATION_SECONDS.observe(time.perf_counter() - started, operation="index_sync")
+            logger.info(f"🗂 Индекс книги обновлён до версии {version}: "
+                        f"+{added['expenses']} расходов, +{added['incomes']} доходов")
+            return True
+
+    def _sync_sheet(self, ws, kind, sheet_name):
+        """Синхронизировать одну таблицу, вернуть число добавленных строк"""
+        table = TABLES[kind][0]
+        stored_sheet, last_row, checksum = self._state(kind)
+
+        if ws is not None and stored_sheet == sheet_name and last_row:
+            added = self._read_tail(ws, kind, last_row, checksum)
+            if added is not None:
+                return added
+            logger.info(f"🗂 Лист {sheet_name} изменён не только в конце — индекс пересобирается")
+
+        self._conn.execute(f"DELETE FROM {table}")
+        self._conn.execute("DELETE FROM aggregates WHERE sheet = ?", (kind,))
+        self._set_state(kind, sheet_name, 0, 0)
+        if ws is None:
+            return 0
+        return self._read_tail(ws, kind, 0, 0)
+
+    def _read_tail(self, ws, kind, last_row, expected_checksum):
+        """
+        Дописать строки листа после last_row.
+        None — строки до last_row не совпадают с индексом
+        """
+        table, columns, width, to_record, _ = TABLES[kind]
+        insert = f"INSERT INTO {table}(row, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})"
+
+        ws.reset_dimensions()
+        checksum = 0
+        verified = last_row == 0
+        seen_last = 0
+        added = 0
+        batch = []
+
+        for row_num, row in enumerate(ws.iter_rows(min_row=2, max_col=width, values_only=True), start=2):
+            if not any(value not in (None, "") for value in row):
+                continue
+            if row_num > last_row and not verified:
+                if checksum != expected_checksum:
+                    return None
+                verified = True
+
+            record = to_record(_pad(row, width))
+            checksum = (checksum + _row_hash(row_num, record)) % CHECKSUM_MOD
+            seen_last = row_num
+            if row_num > last_row:
+                batch.append((row_num,) + record)
+                if len(batch) >= INSERT_BATCH:
+                    self._insert(kind, insert, batch)
+                    added += len(batch)
+                    batch = []
+
+        if not verified and checksum != expected_checksum:
+            return None
+        if batch:
+            self._insert(kind, insert, batch)
+            added += len(batch)
+
+        self._set_state(kind, ws.title, seen_last, checksum)
+        return added
+
+    def _insert(self, kind, insert, rows):
+        self._conn.executemany(insert, rows)
+        self._aggregate(kind, [row[1:] for row in rows], 1)
+
+    def _aggregate(self, kind, records, sign):
+        """Прибавить (sign=1) или вычесть (sign=-1) строки из итогов"""
+        to_key = AGGREGATE_KEYS[kind]
+        params = []
+        for record in records:
+            key, amount = to_key(record)
+            if amount is not None:
+                params.append((kind,) + key + (sign * amount, sign))
+        if params:
+            self._conn.executemany(UPSERT_AGGREGATE, params)
+            if self._dates is not None:
+                for _, category, _, _, _, day, total, count in params:
+                    if not self._dates.add(kind, category, day, total, count):
+                        self._dates = None  # изменился не последний день — перестроим при чтении
+                        break
+        if sign < 0:
+            self._conn.execute("DELETE FROM aggregates WHERE entries <= 0")
+
+    # ----- изменения, сделанные ботом -----
+
+    def record_append(self, sheet_name, row_num, values):
+        """Бот записал строку values в строку row_num листа"""
+        with self._lock:
+            kind = self._kind_of(sheet_name)
+            if kind is None:
+                return
+            table, columns, width, to_record, _ = TABLES[kind]
+            _, last_row, checksum = self._state(kind)
+
+            checksum = (checksum - self._remove_rows(kind, "row = ?", (row_num,))) % CHECKSUM_MOD
+            record = to_record(_pad(tuple(values), width))
+            self._insert(
+                kind,
+                f"INSERT INTO {table}(row, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+                [(row_num,) + record]
+            )
+            checksum = (checksum + _row_hash(row_num, record)) % CHECKSUM_MOD
+            self._set_state(kind, sheet_name, max(last_row, row_num), checksum)
+            self._conn.commit()
+
+    def record_delete(self, sheet_name, row_num):
+        """Бот удалил строку row_num листа (строки ниже сдвинулись вверх)"""
+        with self._lock:
+            kind = self._kind_of(sheet_name)
+            if kind is None:
+                return
+            table, columns, _, _, _ = TABLES[kind]
+            _, last_row, checksum = self._state(kind)
+
+            checksum -= self._remove_rows(kind, "row = ?", (row_num,))
+            # Строки ниже удалённой меняют номер — пересчитываем их вклад в контрольную сумму
+            below = self._conn.execute(
+                f"SELECT row, {', '.join(columns)} FROM {table} WHERE row > ?", (row_num,)
+            ).fetchall()
+            for row in below:
+                checksum += _row_hash(row[0] - 1, tuple(row[1:])) - _row_hash(row[0], tuple(row[1:]))
+            self._conn.execute(f"UPDATE {table} SET row = row - 1 WHERE row > ?", (row_num,))
+
+            if last_row >= row_num:
+                last_row = self._conn.execute(f"SELECT COALESCE(MAX(row), 0) FROM {table}").fetchone()[0]
+            self._set_state(kind, sheet_name, last_row, checksum % CHECKSUM_MOD)
+            self._conn.commit()
+
+    def _remove_rows(self, kind, where, params):
+        """Удалить строки (и вычесть их из итогов), вернуть их вклад в контрольную сумму"""
+        table, columns = TABLES[kind][:2]
+        rows = self._conn.execute(f"SELECT row, {', '.join(columns)} FROM {table} WHERE {where}", params).fetchall()
+        self._conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+        self._aggregate(kind, [tuple(row[1:]) for row in rows], -1)
+        return sum(_row_hash(row[0], tuple(row[1:])) for row in rows)
+
+    # ----- запросы -----
+
+    def summary(self):
+        """Итоги всей книги (LedgerSummary) из таблицы итогов"""
+        summary = LedgerSummary()
+        with self._lock, AGGREGATION_SECONDS.time(operation="summary"), span("compute", op="summary"):
+            conn = self._connect()
+            summary.sheets = {kind: self._state(kind)[0] for kind in TABLES}
+
+            for category, payer, method, period, total, count in conn.execute(
+                "SELECT category, payer, method, period, SUM(total), SUM(entries) FROM aggregates "
+                "WHERE sheet = 'expenses' GROUP BY category, payer, method, period"
+            ):
+                summary.expense_rows += count
+                summary.expense_total += total
+                if category:
+                    summary.categories[category] = summary.categories.get(category, 0) + total
+                    summary.categorized_total += total
+                if period:
+                    summary.periods[period] = summary.periods.get(period, 0) + total
+                if payer:
+                    summary.by_payer[payer] = summary.by_payer.get(payer, 0) + total
+                if method:
+                    summary.by_method[method] = summary.by_method.get(method, 0) + total
+
+            for source, total, count in conn.execute(
+                "SELECT category, SUM(total), SUM(entries) FROM aggregates "
+                "WHERE sheet = 'incomes' GROUP BY category"
+            ):
+                summary.income_rows += count
+                summary.income_total += total
+                if source:
+                    summary.income_by_source[source] = total
+        return summary
+
+    def months(self):
+        """Суммы и число строк по месяцам: {"expenses": {"2025-03": [сумма, строк]}, "incomes": {...}}"""
+        result = {"expenses": {}, "incomes": {}}
+        with self._lock:
+            for kind, day, total, count in self._connect().execute(
+                "SELECT sheet, day, SUM(total), SUM(entries) FROM aggregates WHERE day > 0 GROUP BY sheet, day"
+            ):
+                day = date.fromordinal(day)
+                entry = result[kind].setdefault(f"{day.year:04d}-{day.month:02d}", [0.0, 0])
+                entry[0] += total
+                entry[1] += count
+        return result
+
+    def _date_index(self):
+        """Префиксные суммы по дням из таблицы итогов (один раз на версию книги)"""
+        if self._dates is None:
+            dates = DateIndex()
+            conn = self._connect()
+            for day, category, total, count in conn.execute(
+                "SELECT day, category, SUM(total), SUM(entries) FROM aggregates "
+                "WHERE sheet = 'expenses' AND day > 0 AND category != '' "
+                "GROUP BY day, category ORDER BY day"
+            ):
+                dates.add("expenses", category, day, total, count)
+            for day, total, count in conn.execute(
+                "SELECT day, SUM(total), SUM(entries) FROM aggregates "
+                "WHERE sheet = 'incomes' AND day > 0 GROUP BY day ORDER BY day"
+            ):
+                dates.add("incomes", None, day, total, count)
+            self._dates = dates
+        return self._dates
+
+    def warm(self):
+        """Построить префиксные суммы заранее (прогрев после старта и сверки); выше бюджета памяти — нет"""
+        if memory.over_budget():
+            return
+        with self._lock:
+            self._date_index()
+
+    def _period_stats_sql(self, start, end):
+        """Итоги за период запросами к таблице итогов, без префиксных сумм в памяти"""
+        stats = PeriodStats(start, end)
+        bounds = (start.toordinal(), end.toordinal())
+        conn = self._connect()
+        for category, total, count in conn.execute(
+            "SELECT category, SUM(total), SUM(entries) FROM aggregates "
+            "WHERE sheet = 'expenses' AND day BETWEEN ? AND ? AND category != '' GROUP BY category",
+            bounds
+        ):
+            if count:
+                stats.expenses_by_category[category] = total
+                stats.expense_total += total
+                stats.expense_rows += count
+        stats.income_total, stats.income_rows = conn.execute(
+            "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(entries), 0) FROM aggregates "
+            "WHERE sheet = 'incomes' AND day BETWEEN ? AND ?",
+            bounds
+        ).fetchone()
+        return stats
+
+    def period_stats(self, ranges):
+        """
+        Итоги (PeriodStats) за диапазоны [(start, end), ...]: O(log n) на диапазон и категорию.
+        Выше бюджета памяти — потоковый режим: префиксные суммы выгружаются, считает SQLite
+        """
+        with self._lock, AGGREGATION_SECONDS.time(operation="period_stats"), span("compute", op="period_stats"):
+            if memory.over_budget():
+                self._dates = None
+                return [self._period_stats_sql(start, end) for start, end in ranges]
+            dates = self._date_index()
+            return [dates.period_stats(start, end) for start, end in ranges]
+
+
+ledger_index = LedgerIndex(LEDGER_DB_PATH)
@@ -0,0 +1,234 @@
+"""
+ПОТОКОВОЕ ЧТЕНИЕ СТАТИСТИКИ
+Книга открывается в режиме read_only, каждый лист читается одним проходом,
+а каждая строка сразу передаётся всем агрегаторам
+"""
+
+from datetime import datetime, date
+from typing import Optional
+
+from openpyxl import load_workbook
+
+# Листы и колонки книги
+EXPENSE_SHEETS = ["Расходы", "расходы", "Лист1", "budget"]
+INCOME_SHEETS = ["Доходы", "доходы"]
+EXPENSE_COLUMNS = 7  # A–G: Дата, Категория, Подкат, Сумма, Кто, Период, Способ
+INCOME_COLUMNS = 4   # A–D: Дата, Источник, Сумма, Период
+
+PERIOD_LABELS = {
+    "current": "10-24",
+    "previous": "25-9"
+}
+
+
+def parse_amount(value) -> Optional[float]:
+    """Сумма из ячейки: число или строка вида "1 500,50 ₽" (пусто/ошибка — None)"""
+    if not value:
+        return None
+    try:
+        if isinstance(value, str):
+            value = value.replace(' ', '').replace(',', '.').replace('₽', '').strip()
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_date(value) -> Optional[date]:
+    """Дата из ячейки: строка ДД.ММ.ГГ или дата, которую Excel распознал сам"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value), "%d.%m.%y").date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _pad(row, size):
+    """Строка нужной длины (короткие строки дополняются None)"""
+    if len(row) >= size:
+        return row
+    return tuple(row) + (None,) * (size - len(row))
+
+
+def scan_ledger(source, aggregators):
+    """
+    Один проход по листам расходов и доходов (source — путь или файловый объект).
+    Агрегатор — объект с методами add_expense(row) и add_income(row).
+    Возвращает имена найденных листов: {"expenses": ..., "incomes": ...}
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        found = {
+            "expenses": next((name for name in EXPENSE_SHEETS if name in wb.sheetnames), None),
+            "incomes": next((name for name in INCOME_SHEETS if name in wb.sheetnames), None)
+        }
+
+        if found["expenses"]:
+            ws = wb[found["expenses"]]
+            ws.reset_dimensions()  # не доверяем размеру листа, записанному в файле
+            for row in ws.iter_rows(min_row=2, max_col=EXPENSE_COLUMNS, values_only=True):
+                row = _pad(row, EXPENSE_COLUMNS)
+                for aggregator in aggregators:
+                    aggregator.add_expense(row)
+
+        if found["incomes"]:
+            ws = wb[found["incomes"]]
+            ws.reset_dimensions()
+            for row in ws.iter_rows(min_row=2, max_col=INCOME_COLUMNS, values_only=True):
+                row = _pad(row, INCOME_COLUMNS)
+                for aggregator in aggregators:
+                    aggregator.add_income(row)
+
+        return found
+    finally:
+        wb.close()
+
+
+# ========== АГРЕГАТОРЫ ==========
+
+class LedgerSummary:
+    """Все итоги книги за один проход: категории, баланс, периоды, кто и чем платил"""
+
+    def __init__(self):
+        self.sheets = {}
+        self.income_total = 0
+        self.expense_total = 0
+        self.categories = {}          # категория → сумма расходов
+        self.categorized_total = 0    # расходы, у которых указана категория
+        self.periods = {}             # "10-24" / "25-9" → сумма расходов
+        self.by_payer = {}            # кто платил → сумма расходов
+        self.by_method = {}           # способ оплаты → сумма расходов
+        self.income_by_source = {}    # источник → сумма доходов
+        self.expense_rows = 0
+        self.income_rows = 0
+
+    def add_expense(self, row):
+        amount = parse_amount(row[3])
+        if amount is None:
+            return
+
+        self.expense_rows += 1
+        self.expense_total += amount
+
+        category = row[1]
+        if category:
+            self.categories[category] = self.categories.get(category, 0) + amount
+            self.categorized_total += amount
+        if row[5]:
+            self.periods[row[5]] = self.periods.get(row[5], 0) + amount
+        if row[4]:
+            self.by_payer[row[4]] = self.by_payer.get(row[4], 0) + amount
+        if row[6]:
+            self.by_method[row[6]] = self.by_method.get(row[6], 0) + amount
+
+    def add_income(self, row):
+        amount = parse_amount(row[2])
+        if amount is None:
+            return
+
+        self.income_rows += 1
+        self.income_total += amount
+        if row[1]:
+            self.income_by_source[row[1]] = self.income_by_source.get(row[1], 0) + amount
+
+    @property
+    def balance(self):
+        return self.income_total - self.expense_total
+
+    def period_total(self, period):
+        """Расходы за "current", "previous" или "all" """
+        if period == "all":
+            return self.expense_total
+        return self.periods.get(PERIOD_LABELS.get(period), 0)
+
+    def merge(self, other):
+        """Прибавить итоги другой книги (например, закрытого года)"""
+        self.income_total += other.income_total
+        self.expense_total += other.expense_total
+        self.categorized_total += other.categorized_total
+        self.expense_rows += other.expense_rows
+        self.income_rows += other.income_rows
+        for field in SUMMARY_BREAKDOWNS:
+            mine = getattr(self, field)
+            for key, amount in getattr(other, field).items():
+                mine[key] = mine.get(key, 0) + amount
+        return self
+
+
+# Разбивки LedgerSummary: словари {ключ: сумма}
+SUMMARY_BREAKDOWNS = ("categories", "periods", "by_payer", "by_method", "income_by_source")
+
+
+# ========== СТАТИСТИКА ЗА ДИАПАЗОНЫ ДАТ ==========
+
+class PeriodStats:
+    """Итоги за диапазон дат: числа без форматирования"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.income_total = 0.0
+        self.expense_total = 0.0
+        self.expenses_by_category = {}
+        self.expense_rows = 0
+        self.income_rows = 0
+
+    @property
+    def balance(self):
+        return self.income_total - self.expense_total
+
+    def merge(self, other):
+        """Прибавить итоги того же диапазона из другой книги"""
+        self.income_total += other.income_total
+        self.expense_total += other.expense_total
+        self.expense_rows += other.expense_rows
+        self.income_rows += other.income_rows
+        for category, amount in other.expenses_by_category.items():
+            self.expenses_by_category[category] = self.expenses_by_category.get(category, 0) + amount
+        return self
+
+
+# ========== ТЕКСТ ДЛЯ TELEGRAM ==========
+
+def format_period_stats(stats, top=5):
+    """Текст статистики за период"""
+    result = []
+    result.append(f"💵 Доходы: {stats.income_total:,.0f} ₽")
+    result.append(f"💰 Расходы: {stats.expense_total:,.0f} ₽")
+    result.append(f"📊 Баланс: {stats.balance:,.0f} ₽")
+
+    if stats.expenses_by_category:
+        result.append("\n📊 По категориям:")
+        sorted_cats = sorted(stats.expenses_by_category.items(), key=lambda x: x[1], reverse=True)
+        for cat, amt in sorted_cats[:top]:
+            percent = (amt / stats.expense_total * 100) if stats.expense_total > 0 else 0
+            result.append(f"  {cat}: {amt:,.0f} ₽ ({percent:.1f}%)")
+
+    return "\n".join(result)
+
+
+def format_change(val1, val2):
+    """Изменение в процентах со стрелкой"""
+    if val1 == 0:
+        return "∞"
+    change = ((val2 - val1) / val1) * 100
+    arrow = "📈" if change > 0 else "📉" if change < 0 else "➡️"
+    return f"{change:+.1f}% {arrow}"
+
+
+def format_comparison(first, second):
+    """Текст сравнения двух периодов"""
+    result = []
+    for title, attr in [("📈 Доходы:", "income_total"), ("💰 Расходы:", "expense_total"), ("📊 Баланс:", "balance")]:
+        val1 = getattr(first, attr)
+        val2 = getattr(second, attr)
+        if result:
+            result.append("")
+        result.append(title)
+        result.append(f"  П1: {val1:,.0f} ₽")
+        result.append(f"  П2: {val2:,.0f} ₽")
+        result.append(f"  Изменение: {format_change(val1, val2)}")
+
+    return "\n".join(result)
@@ -0,0 +1,101 @@
+"""
+ЛОКАЛЬНАЯ КОПИЯ КНИГИ В ПАМЯТИ
+Байты budget.xlsx и метаданные версии держатся в памяти;
+диск используется только как необязательный кэш между перезапусками
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCopy:
+    """Содержимое книги (bytes) и метаданные её версии"""
+
+    def __init__(self, path, meta_path, persist=False):
+        self.path = path
+        self.meta_path = meta_path
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._data = None
+        self._md5 = None
+        self._meta = {}
+        if persist:
+            self._load_from_disk()
+
+    def _load_from_disk(self):
+        """Поднять копию, сохранённую прошлым запуском"""
+        try:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+            self._md5 = hashlib.md5(self._data).hexdigest()
+        except OSError:
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self._meta = json.load(f)
+        except (OSError, ValueError):
+            self._meta = {}
+        logger.info(f"💾 Локальная копия книги прочитана с диска ({len(self._data)} байт)")
+
+    # ----- содержимое -----
+
+    @property
+    def data(self):
+        """Байты книги (или None, если копии ещё нет)"""
+        return self._data
+
+    @property
+    def md5(self):
+        return self._md5
+
+    @property
+    def size(self):
+        return len(self._data) if self._data is not None else None
+
+    def exists(self):
+        return self._data is not None
+
+    def stream(self):
+        """Книга как файловый объект (для openpyxl)"""
+        return io.BytesIO(self._data)
+
+    def replace(self, data):
+        """Заменить содержимое книги"""
+        data = bytes(data)
+        with self._lock:
+            self._data = data
+            self._md5 = hashlib.md5(data).hexdigest()
+            if self.persist:
+                self._write_file(data)
+
+    def _write_file(self, data):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить книгу на диск: {e}")
+
+    # ----- метаданные -----
+
+    def meta(self):
+        """Копия метаданных версии"""
+        with self._lock:
+            return dict(self._meta)
+
+    def set_meta(self, meta):
+        with self._lock:
+            self._meta = dict(meta)
+            if self.persist:
+                try:
+                    with open(self.meta_path, "w", encoding="utf-8") as f:
+                        json.dump(self._meta, f, ensure_ascii=False)
+                except OSError as e:
+                    logger.warning(f"Не удалось сохранить метаданные кэша: {e}")
@@ -14,6 +14,8 @@ import random
 import calendar
 import signal
 import socket
+import hmac
+import math
 from datetime import datetime, timezone, timedelta, date
 from typing import Optional
 from contextlib import asynccontextmanager
@@ -29,29 +31,45 @@ from telegram.ext import (
     filters,
     ConversationHandler
 )
+from telegram.request import HTTPXRequest
 
 # FastAPI
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import Response, PlainTextResponse
 import uvicorn
-import requests
 
 # Наши модули
-from config import VERSION, PORT, LOCAL_EXCEL_PATH
-from yandex_disk import add_expense, add_income, delete_last, download_from_yandex, get_statistics
+from config import VERSION, PORT, HTTP_POOL_SIZE, PROFILE_TOKEN, ADMIN_IDS, PROFILE_MAX_SECONDS, PROFILE_INTERVAL_MS
+from storage import (
+    add_expense_async, add_income_async, delete_last_async, get_statistics_async,
+    get_period_stats, sync_local_copy, writer, warmer
+)
+from http_pool import get_session, close_async_client, close_session
+from ledger_stats import parse_date, format_period_stats, format_comparison
+from ledger_index import ledger_index
+from partitions import year_archive
+from yandex_disk import local_copy, yandex_breaker, journal
+from metrics import registry, instrument_handler, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import span, traces, slow_summary
+from profiling import profiler, ProfilerBusyError
+from memory import memory, rss_bytes
+from menu import (
+    ALL_CATEGORIES, PRIORITY_CATEGORIES, HIDDEN_CATEGORIES, INCOME_SOURCES, PAYERS, PAYMENT_METHODS
+)
 
 # ========== ПРИНУДИТЕЛЬНЫЙ СБРОС ВЕБХУКА ПРИ СТАРТЕ ==========
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 if BOT_TOKEN:
     try:
         # Сначала пробуем получить информацию о вебхуке
-        webhook_info = requests.get(
+        webhook_info = get_session().get(
             f"https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo",
             timeout=5
         ).json()
         
         # Если есть активный вебхук, удаляем его
         if webhook_info.get('ok') and webhook_info.get('result', {}).get('url'):
-            requests.post(
+            get_session().post(
                 f"https://api.telegram.org/bot{BOT_TOKEN}/deleteWebhook",
                 json={"drop_pending_updates": True},
                 timeout=5
@@ -59,7 +77,7 @@ if BOT_TOKEN:
             print("🔥 Вебхук удален")
         
         # Также пробуем остановить все активные сессии polling
-        requests.post(
+        get_session().post(
             f"https://api.telegram.org/bot{BOT_TOKEN}/close",
             timeout=5
         )
@@ -97,24 +115,6 @@ bot_started = False
 ) = range(10)
 
 # ========== ДАННЫЕ ==========
-ALL_CATEGORIES = [
-    "🛒 Продукты", "🏠 Коммуналка", "🚗 Транспорт", "💳 Кредиты",
-    "🌿 Зелень", "💊 Лекарства и лечение", "🚬 Сигареты и алко",
-    "🐱 Кошка", "🧹 Быт расходники", "🎮 Развлечения и хобби",
-    "🔨 Дом/ремонт", "👕 Одежда и обувь", "💇 Красота/Уход", "📦 Другое"
-]
-
-PRIORITY_CATEGORIES = [
-    "🛒 Продукты", "🚗 Транспорт", "🚬 Сигареты и алко",
-    "🏠 Коммуналка", "💳 Кредиты", "🎮 Развлечения и хобби"
-]
-
-HIDDEN_CATEGORIES = [cat for cat in ALL_CATEGORIES if cat not in PRIORITY_CATEGORIES]
-
-INCOME_SOURCES = ["💼 Зарплата (Жена)", "💼 Зарплата (Муж)", "💻 Подработка (Муж)"]
-PAYERS = ["👩 Жена", "👨 Муж"]
-PAYMENT_METHODS = ["💵 Наличные", "💳 Карта Муж", "💳 Карта Жена", "📌 Другое"]
-
 MONTHS_RU = {
     1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
     5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
@@ -135,13 +135,6 @@ def get_current_date_obj() -> date:
     """Получить текущую дату как объект date"""
     return datetime.now(timezone(timedelta(hours=3))).date()
 
-def parse_date(date_str: str) -> Optional[date]:
-    """Парсит дату из строки ДД.ММ.ГГ"""
-    try:
-        return datetime.strptime(date_str, "%d.%m.%y").date()
-    except:
-        return None
-
 def format_date(date_obj: date) -> str:
     """Форматирует дату в ДД.ММ.ГГ"""
     return date_obj.strftime("%d.%m.%y")
@@ -310,6 +303,7 @@ def get_delete_keyboard():
     ])
 
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
+@instrument_handler
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
@@ -322,6 +316,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="HTML"
     )
 
+@instrument_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
     help_text = """
@@ -349,6 +344,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     await update.message.reply_text(help_text, parse_mode="HTML")
 
+@instrument_handler
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /stats"""
     await update.message.reply_text(
@@ -357,10 +353,12 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="HTML"
     )
 
+@instrument_handler
 async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /ping"""
     await update.message.reply_text(f"🏓 Pong! Время: {get_moscow_time()}")
 
+@instrument_handler
 async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /debug"""
     user = update.effective_user
@@ -380,12 +378,58 @@ async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"👤 Ваш ID: {user.id}\n"
         f"📊 Режим: Архив + Сравнение\n"
         f"━━━━━━━━━━━━━━━━\n"
+        f"{slow_summary()}\n"
+        f"━━━━━━━━━━━━━━━━\n"
         f"💡 Бот работает 24/7 и никогда не спит!"
     )
     
     await update.message.reply_text(response)
 
+def finite_or_default(value, default):
+    """Число из запроса; nan, inf и мусор — значение по умолчанию"""
+    try:
+        number = float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+    return number if math.isfinite(number) else default
+
+def profile_seconds(value, default=10):
+    """Длительность съёмки профиля: от 1 до PROFILE_MAX_SECONDS секунд"""
+    return max(1, min(PROFILE_MAX_SECONDS, int(finite_or_default(value, default))))
+
+def profile_interval(value_ms):
+    """Период снятия стеков в секундах: от 1 мс до 1 с"""
+    default = finite_or_default(PROFILE_INTERVAL_MS, 5.0)  # nan в окружении — 5 мс, как по умолчанию
+    return max(1.0, min(1000.0, finite_or_default(value_ms, default))) / 1000
+
+# Без instrument_handler: съёмка по замыслу длится секунды и заслонила бы медленные обновления
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /profile [секунд] — только для ADMIN_IDS"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Команда доступна только администратору")
+        return
+    
+    seconds = profile_seconds(context.args[0] if context.args else None)
+    await update.message.reply_text(f"🔬 Снимаю профиль {seconds} с...")
+    try:
+        profile = await profiler.capture(seconds, profile_interval(None))
+    except ProfilerBusyError:
+        await update.message.reply_text("⏳ Профилирование уже идёт, попробуйте позже")
+        return
+    
+    if not profile.stacks:
+        await update.message.reply_text(f"💤 За {seconds} с бот ничем не был занят")
+        return
+    top = "\n".join(f"{share:.0%} {frame}" for frame, _, share in profile.top(5))
+    await context.bot.send_document(
+        chat_id=update.effective_chat.id,
+        document=profile.collapsed().encode("utf-8"),
+        filename=f"profile-{profile.started_at:%Y%m%d-%H%M%S}.txt",
+        caption=f"🔬 {profile.samples} снимков за {seconds} с, чаще всего:\n{top}"[:1024]
+    )
+
 # ========== ОБРАБОТЧИКИ КОЛЛБЭКОВ ==========
+@instrument_handler
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на inline-кнопки"""
     query = update.callback_query
@@ -641,7 +685,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if start_date:
             await query.edit_message_text("⏳ Считаю статистику...")
-            stats_text = get_statistics_period(start_date, end_date)
+            stats_text = await get_statistics_period(start_date, end_date)
             await query.edit_message_text(
                 f"📊 <b>Статистика за период:</b>\n"
                 f"📅 {start_date} - {end_date}\n\n{stats_text}",
@@ -684,7 +728,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             end_date = date_obj.replace(day=last_day)
             
             await query.edit_message_text("⏳ Считаю статистику...")
-            stats_text = get_statistics_period(
+            stats_text = await get_statistics_period(
                 format_date(start_date),
                 format_date(end_date)
             )
@@ -722,7 +766,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         end_date = date(year, 12, 31)
         
         await query.edit_message_text("⏳ Считаю статистику...")
-        stats_text = get_statistics_period(
+        stats_text = await get_statistics_period(
             format_date(start_date),
             format_date(end_date)
         )
@@ -845,7 +889,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
         
         await query.edit_message_text("⏳ Сравниваю периоды...")
-        compare_text = compare_periods(start1, end1, start2, end2)
+        compare_text = await compare_periods(start1, end1, start2, end2)
         await query.edit_message_text(
             f"📊 <b>Сравнение периодов</b>\n\n"
             f"Период 1: {start1} - {end1}\n"
@@ -871,15 +915,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "download_excel":
         await query.edit_message_text("⏬ Скачиваю файл...")
         
-        if download_from_yandex():
+        if await sync_local_copy():
             try:
-                with open(LOCAL_EXCEL_PATH, "rb") as f:
-                    await context.bot.send_document(
-                        chat_id=query.message.chat_id,
-                        document=f,
-                        filename="budget.xlsx",
-                        caption="📁 Ваш файл budget.xlsx"
-                    )
+                await context.bot.send_document(
+                    chat_id=query.message.chat_id,
+                    document=local_copy.data,
+                    filename="budget.xlsx",
+                    caption="📁 Ваш файл budget.xlsx"
+                )
                 await query.message.reply_text(
                     "Выберите действие:",
                     reply_markup=get_stats_keyboard()
@@ -899,7 +942,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "stats_categories":
         await query.edit_message_text("⏳ Считаю...")
-        stats_text = get_statistics(by_categories=True)
+        stats_text = await get_statistics_async(by_categories=True)
         await query.edit_message_text(
             f"📊 <b>Расходы по категориям:</b>\n\n{stats_text}",
             reply_markup=get_stats_keyboard(),
@@ -909,7 +952,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "stats_balance":
         await query.edit_message_text("⏳ Считаю...")
-        balance_text = get_statistics(balance=True)
+        balance_text = await get_statistics_async(balance=True)
         await query.edit_message_text(
             f"💰 <b>Текущий баланс:</b>\n\n{balance_text}",
             reply_markup=get_stats_keyboard(),
@@ -926,7 +969,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     elif data == "delete_expense":
-        result = delete_last("Расходы")
+        result = await delete_last_async("Расходы")
         await query.message.reply_text(result)
         await query.message.reply_text(
             "Выберите действие:",
@@ -935,7 +978,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     elif data == "delete_income":
-        result = delete_last("Доходы")
+        result = await delete_last_async("Доходы")
         await query.message.reply_text(result)
         await query.message.reply_text(
             "Выберите действие:",
@@ -946,6 +989,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 # ========== ОБРАБОТЧИКИ СООБЩЕНИЙ ==========
+@instrument_handler
 async def handle_expense_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода суммы расхода (текущая дата)"""
     text = update.message.text.strip()
@@ -971,7 +1015,7 @@ async def handle_expense_amount(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data.clear()
         return ConversationHandler.END
     
-    result = add_expense(category, amount, payer, method)
+    result = await add_expense_async(category, amount, payer, method)
     await update.message.reply_text(result)
     await update.message.reply_text(
         "👇 Выберите следующее действие:",
@@ -981,6 +1025,7 @@ async def handle_expense_amount(update: Update, context: ContextTypes.DEFAULT_TY
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrument_handler
 async def handle_archive_expense_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода суммы расхода (архивная дата)"""
     text = update.message.text.strip()
@@ -1007,7 +1052,7 @@ async def handle_archive_expense_amount(update: Update, context: ContextTypes.DE
         context.user_data.clear()
         return ConversationHandler.END
     
-    result = add_expense(category, amount, payer, method)
+    result = await add_expense_async(category, amount, payer, method)
     await update.message.reply_text(f"✅ {result} (дата: {archive_date})")
     await update.message.reply_text(
         "👇 Выберите следующее действие:",
@@ -1017,6 +1062,7 @@ async def handle_archive_expense_amount(update: Update, context: ContextTypes.DE
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrument_handler
 async def handle_income_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода суммы дохода (текущая дата)"""
     text = update.message.text.strip()
@@ -1041,7 +1087,7 @@ async def handle_income_amount(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
     
     payer = "Муж" if "Муж" in source else "Жена"
-    result = add_income(source, amount, payer)
+    result = await add_income_async(source, amount, payer)
     
     await update.message.reply_text(result)
     await update.message.reply_text(
@@ -1052,6 +1098,7 @@ async def handle_income_amount(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrument_handler
 async def handle_archive_income_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода суммы дохода (архивная дата)"""
     text = update.message.text.strip()
@@ -1077,7 +1124,7 @@ async def handle_archive_income_amount(update: Update, context: ContextTypes.DEF
         return ConversationHandler.END
     
     payer = "Муж" if "Муж" in source else "Жена"
-    result = add_income(source, amount, payer)
+    result = await add_income_async(source, amount, payer)
     
     await update.message.reply_text(f"✅ {result} (дата: {archive_date})")
     await update.message.reply_text(
@@ -1088,6 +1135,7 @@ async def handle_archive_income_amount(update: Update, context: ContextTypes.DEF
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrument_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена действия"""
     await update.message.reply_text(
@@ -1097,6 +1145,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrument_handler
 async def handle_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик неизвестных сообщений"""
     await update.message.reply_text(
@@ -1105,151 +1154,46 @@ async def handle_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ========== ФУНКЦИИ ДЛЯ СТАТИСТИКИ ==========
-def get_statistics_period(start_date: str, end_date: str) -> str:
+async def get_statistics_period(start_date: str, end_date: str) -> str:
     """Получает статистику за период"""
-    try:
-        if not download_from_yandex():
-            return "❌ Не удалось скачать файл"
-        
-        from openpyxl import load_workbook
-        
-        wb = load_workbook(LOCAL_EXCEL_PATH, data_only=True)
-        
-        income_total = 0
-        expense_total = 0
-        expenses_by_category = {}
-        
-        start = parse_date(start_date)
-        end = parse_date(end_date)
-        
-        if not start or not end:
-            return "❌ Ошибка в формате дат"
-        
-        sheet_name = None
-        for name in ["Расходы", "расходы"]:
-            if name in wb.sheetnames:
-                sheet_name = name
-                break
+    with memory.track("get_statistics_period"):
+        try:
+            start = parse_date(start_date)
+            end = parse_date(end_date)
         
-        if sheet_name:
-            ws = wb[sheet_name]
-            for row in range(2, ws.max_row + 1):
-                date_cell = ws.cell(row=row, column=1).value
-                category = ws.cell(row=row, column=2).value
-                amount = ws.cell(row=row, column=4).value
-                
-                if date_cell and category and amount:
-                    try:
-                        row_date = parse_date(str(date_cell))
-                        if row_date and start <= row_date <= end:
-                            if isinstance(amount, str):
-                                amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                            amount_val = float(amount)
-                            expense_total += amount_val
-                            expenses_by_category[category] = expenses_by_category.get(category, 0) + amount_val
-                    except:
-                        continue
+            if not start or not end:
+                return "❌ Ошибка в формате дат"
         
-        income_sheet = None
-        for name in ["Доходы", "доходы"]:
-            if name in wb.sheetnames:
-                income_sheet = name
-                break
+            results = await get_period_stats([(start, end)])
+            if results is None:
+                return "❌ Не удалось скачать файл"
         
-        if income_sheet:
-            ws = wb[income_sheet]
-            for row in range(2, ws.max_row + 1):
-                date_cell = ws.cell(row=row, column=1).value
-                amount = ws.cell(row=row, column=3).value
-                
-                if date_cell and amount:
-                    try:
-                        row_date = parse_date(str(date_cell))
-                        if row_date and start <= row_date <= end:
-                            if isinstance(amount, str):
-                                amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                            income_total += float(amount)
-                    except:
-                        continue
+            return format_period_stats(results[0])
         
-        balance = income_total - expense_total
-        
-        result = []
-        result.append(f"💵 Доходы: {income_total:,.0f} ₽")
-        result.append(f"💰 Расходы: {expense_total:,.0f} ₽")
-        result.append(f"📊 Баланс: {balance:,.0f} ₽")
+        except Exception as e:
+            logger.error(f"Ошибка статистики за период: {e}")
+            return f"❌ Ошибка: {str(e)[:100]}"
+
+async def compare_periods(start1: str, end1: str, start2: str, end2: str) -> str:
+    """Сравнивает два периода (одно скачивание и один проход по книге)"""
+    with memory.track("compare_periods"):
+        if not all([start1, end1, start2, end2]):
+            return "❌ Ошибка: не выбраны все даты"
+    
+        try:
+            ranges = [(parse_date(start1), parse_date(end1)), (parse_date(start2), parse_date(end2))]
+            if not all(start and end for start, end in ranges):
+                return "❌ Ошибка в формате дат"
         
-        if expenses_by_category:
-            result.append("\n📊 По категориям:")
-            sorted_cats = sorted(expenses_by_category.items(), key=lambda x: x[1], reverse=True)
-            for cat, amt in sorted_cats[:5]:
-                percent = (amt / expense_total * 100) if expense_total > 0 else 0
-                result.append(f"  {cat}: {amt:,.0f} ₽ ({percent:.1f}%)")
+            results = await get_period_stats(ranges)
+            if results is None:
+                return "❌ Не удалось скачать файл"
         
-        return "\n".join(result)
+            return format_comparison(results[0], results[1])
         
-    except Exception as e:
-        logger.error(f"Ошибка статистики за период: {e}")
-        return f"❌ Ошибка: {str(e)[:100]}"
-
-def compare_periods(start1: str, end1: str, start2: str, end2: str) -> str:
-    """Сравнивает два периода"""
-    if not all([start1, end1, start2, end2]):
-        return "❌ Ошибка: не выбраны все даты"
-    
-    stats1 = get_statistics_period(start1, end1)
-    stats2 = get_statistics_period(start2, end2)
-    
-    def extract_balance(text):
-        import re
-        match = re.search(r'Баланс: ([\d\s,]+) ₽', text)
-        if match:
-            return float(match.group(1).replace(' ', '').replace(',', ''))
-        return 0
-    
-    def extract_income(text):
-        match = re.search(r'Доходы: ([\d\s,]+) ₽', text)
-        if match:
-            return float(match.group(1).replace(' ', '').replace(',', ''))
-        return 0
-    
-    def extract_expense(text):
-        match = re.search(r'Расходы: ([\d\s,]+) ₽', text)
-        if match:
-            return float(match.group(1).replace(' ', '').replace(',', ''))
-        return 0
-    
-    inc1 = extract_income(stats1)
-    inc2 = extract_income(stats2)
-    exp1 = extract_expense(stats1)
-    exp2 = extract_expense(stats2)
-    bal1 = extract_balance(stats1)
-    bal2 = extract_balance(stats2)
-    
-    def format_change(val1, val2):
-        if val1 == 0:
-            return "∞"
-        change = ((val2 - val1) / val1) * 100
-        arrow = "📈" if change > 0 else "📉" if change < 0 else "➡️"
-        return f"{change:+.1f}% {arrow}"
-    
-    result = []
-    result.append(f"📈 Доходы:")
-    result.append(f"  П1: {inc1:,.0f} ₽")
-    result.append(f"  П2: {inc2:,.0f} ₽")
-    result.append(f"  Изменение: {format_change(inc1, inc2)}")
-    result.append("")
-    result.append(f"💰 Расходы:")
-    result.append(f"  П1: {exp1:,.0f} ₽")
-    result.append(f"  П2: {exp2:,.0f} ₽")
-    result.append(f"  Изменение: {format_change(exp1, exp2)}")
-    result.append("")
-    result.append(f"📊 Баланс:")
-    result.append(f"  П1: {bal1:,.0f} ₽")
-    result.append(f"  П2: {bal2:,.0f} ₽")
-    result.append(f"  Изменение: {format_change(bal1, bal2)}")
-    
-    return "\n".join(result)
+        except Exception as e:
+            logger.error(f"Ошибка сравнения периодов: {e}")
+            return f"❌ Ошибка: {str(e)[:100]}"
 
 # ================== ЗАПУСК ТЕЛЕГРАМ БОТА ==================
 async def setup_bot_commands(application: Application):
@@ -1264,6 +1208,13 @@ async def setup_bot_commands(application: Application):
     await application.bot.set_my_commands(commands)
     logger.info("✅ Команды меню установлены")
 
+class TracedRequest(HTTPXRequest):
+    """Запросы к Bot API — шаги "reply" в трассе обновления"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        with span("reply", method=url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, request_data, **kwargs)
+
 async def start_bot():
     """Запуск Telegram бота"""
     global bot_app, bot_started
@@ -1276,7 +1227,7 @@ async def start_bot():
     
     for attempt in range(3):
         try:
-            bot_app = Application.builder().token(BOT_TOKEN).build()
+            bot_app = Application.builder().token(BOT_TOKEN).request(TracedRequest(connection_pool_size=HTTP_POOL_SIZE)).build()
             logger.info(f"✅ Приложение создано (попытка {attempt + 1})")
             
             try:
@@ -1338,6 +1289,7 @@ async def start_bot():
             bot_app.add_handler(CommandHandler("ping", ping_command))
             bot_app.add_handler(CommandHandler("debug", debug_command))
             bot_app.add_handler(CommandHandler("cancel", cancel))
+            bot_app.add_handler(CommandHandler("profile", profile_command, block=False))  # не задерживает другие обновления
             
             bot_app.add_handler(expense_conv)
             bot_app.add_handler(archive_expense_conv)
@@ -1398,7 +1350,7 @@ def start_auto_ping():
             ping_count += 1
             
             try:
-                response = requests.get(
+                response = get_session().get(
                     f"{render_url}/health", 
                     timeout=10,
                     headers={"User-Agent": "Render-AutoPing/1.0"}
@@ -1428,9 +1380,10 @@ app = FastAPI(title="Family Finance Bot")
 @app.get("/health")
 @app.get("/ping")
 async def health_check():
-    """Health check для Render"""
+    """Health check для Render (HTTP 200 всегда; готовность кэша — в поле ready)"""
     return {
-        "status": "healthy",
+        "status": "healthy" if warmer.ready else "warming_up",
+        "ready": warmer.ready,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "bot_running": bot_started,
         "time_moscow": get_moscow_time(),
@@ -1451,9 +1404,78 @@ async def status():
             "running": bot_started,
             "version": VERSION,
             "features": ["archive", "period_stats", "compare_periods"]
-        }
+        },
+        "storage": writer.stats(),
+        "cache": warmer.stats(),
+        "archive": year_archive.stats(),
+        "profiler": profiler.stats(),
+        "memory": memory.stats(),
+        "yandex_disk": yandex_breaker.snapshot()
     }
 
+# Текущие значения для /metrics: считаются при каждом запросе
+registry.gauge("budget_uptime_seconds", "Время работы процесса",
+               lambda: (datetime.now(timezone.utc) - startup_time).total_seconds())
+registry.gauge("budget_writer_queue_depth", "Команды в очереди писателя книги", lambda: writer.queue_depth)
+registry.gauge("budget_journal_pending", "Записи журнала, ещё не загруженные в облако", lambda: len(journal))
+registry.gauge("budget_cache_ready", "Кэш прогрет (1) или ещё нет (0)", lambda: int(warmer.ready))
+registry.gauge("budget_memory_rss_bytes", "Резидентная память процесса", rss_bytes)
+registry.gauge("budget_memory_streaming", "Статистика в потоковом режиме: память выше бюджета",
+               lambda: int(memory.streaming))
+registry.gauge("budget_yandex_circuit_open", "Предохранитель Яндекс.Диска разомкнут",
+               lambda: int(yandex_breaker.state == yandex_breaker.OPEN))
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+def check_debug_token(authorization: str):
+    """
+    Диагностика процесса (трассы, профиль, память) — только с PROFILE_TOKEN
+    в заголовке Authorization: Bearer <токен>; в адресе токен попал бы в логи
+    """
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Диагностика выключена: PROFILE_TOKEN не задан")
+    supplied = authorization.removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20, min_ms: float = 0.0, authorization: str = Header(default="")):
+    """Самые медленные из последних обновлений: дерево шагов каждого (нужен PROFILE_TOKEN)"""
+    check_debug_token(authorization)
+    
+    return {
+        "stats": traces.stats(),
+        "traces": [trace.as_dict() for trace in traces.slowest(min(max(limit, 1), 200), finite_or_default(min_ms, 0.0))]
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10, interval_ms: float = PROFILE_INTERVAL_MS, idle: bool = False,
+                        authorization: str = Header(default="")):
+    """Свёрнутые стеки всех потоков за seconds секунд (нужен PROFILE_TOKEN)"""
+    check_debug_token(authorization)
+    
+    try:
+        profile = await profiler.capture(profile_seconds(seconds), profile_interval(interval_ms), idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profile.collapsed(), headers={
+        "X-Profile-Samples": str(profile.samples),
+        "X-Profile-Seconds": str(profile.seconds),
+        "Content-Disposition": f'attachment; filename="profile-{profile.started_at:%Y%m%d-%H%M%S}.txt"'
+    })
+
+@app.get("/debug/memory")
+async def debug_memory(seconds: float = 5, top: int = 15, frames: int = 1,
+                       authorization: str = Header(default="")):
+    """Пики памяти по операциям и топ мест выделения по tracemalloc за seconds секунд (нужен PROFILE_TOKEN)"""
+    check_debug_token(authorization)
+    
+    allocations = await memory.allocations(profile_seconds(seconds, 5), min(max(top, 1), 100), min(max(frames, 1), 25))
+    return {"memory": memory.stats(), "allocations": allocations}
+
 @app.on_event("startup")
 async def startup_event():
     """Запуск при старте приложения"""
@@ -1475,6 +1497,12 @@ async def startup_event():
     start_auto_ping()
     logger.info("🔧 Авто-пинг запущен")
     
+    # Запускаем единственного писателя книги
+    writer.start()
+    
+    # Прогреваем кэш в фоне: книга, индекс и итоги будут готовы к первому запросу
+    warmer.start()
+    
     # Запускаем бота в фоне
     asyncio.create_task(start_bot())
 
@@ -1486,6 +1514,13 @@ async def shutdown_event_handler():
     global shutdown_event
     shutdown_event.set()
     
+    # Переносим в облако всё, что осталось в журнале
+    await warmer.stop()
+    await writer.stop()
+    await close_async_client()
+    close_session()
+    ledger_index.close()
+    
     if bot_app:
         try:
             await bot_app.updater.stop()
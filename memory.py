@@ -0,0 +1,205 @@
+"""
+УЧЁТ ПАМЯТИ
+RSS процесса: пик за каждую операцию (add_expense, get_statistics,
+get_statistics_period...) снимает фоновый поток, который работает,
+только пока идёт хотя бы одна операция. Снимки tracemalloc — по запросу.
+Выше бюджета MEMORY_BUDGET_MB статистика переходит в потоковый режим:
+итоги за период считаются SQL-запросами без префиксных сумм в памяти,
+а книга в openpyxl выгружается сразу после использования
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from config import MEMORY_BUDGET_MB, MEMORY_SAMPLE_MS, MEMORY_TRACEMALLOC
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+RESUME_SHARE = 0.9  # обратно из потокового режима — когда RSS опустится ниже 90% бюджета
+
+if MEMORY_TRACEMALLOC:
+    tracemalloc.start()
+
+
+def rss_bytes():
+    """Текущий RSS процесса (Linux: /proc/self/statm); None — узнать нельзя"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """Наибольший RSS за всё время работы процесса"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(value):
+    return round(value / MB, 1) if value is not None else None
+
+
+class _Tracking:
+    """with memory.track(name): — пик RSS за время блока (и в async-функциях)"""
+
+    __slots__ = ("_monitor", "_name", "_key")
+
+    def __init__(self, monitor, name):
+        self._monitor = monitor
+        self._name = name
+
+    def __enter__(self):
+        self._key = self._monitor._begin(self._name)
+        return self
+
+    def __exit__(self, *exc):
+        self._monitor._end(self._key)
+        return False
+
+
+class MemoryMonitor:
+    """Пики RSS по операциям и бюджет памяти"""
+
+    def __init__(self, budget_mb, sample_ms):
+        self.budget = budget_mb * MB
+        self.interval = max(sample_ms, 1) / 1000
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._active = {}        # операция → [имя, RSS в начале, пик]
+        self._wake = threading.Event()
+        self._thread = None
+        self._snapshot_lock = None
+        self.operations = {}     # имя → сводка пиков
+        self.streaming = False
+        self.switches = 0
+
+    # ----- пики по операциям -----
+
+    def track(self, name):
+        return _Tracking(self, name)
+
+    def _begin(self, name):
+        rss = rss_bytes() or 0
+        with self._lock:
+            key = next(self._ids)
+            self._active[key] = [name, rss, rss]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return key
+
+    def _end(self, key):
+        rss = rss_bytes() or 0
+        with self._lock:
+            name, start, peak = self._active.pop(key)
+            if not self._active:
+                self._wake.clear()
+            peak = max(peak, rss)
+            entry = self.operations.setdefault(name, {
+                "runs": 0, "last_peak_mb": None, "max_peak_mb": 0.0, "max_growth_mb": 0.0
+            })
+            entry["runs"] += 1
+            entry["last_peak_mb"] = _mb(peak)
+            entry["max_peak_mb"] = max(entry["max_peak_mb"], _mb(peak))
+            entry["max_growth_mb"] = max(entry["max_growth_mb"], _mb(peak - start))
+        self.over_budget()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            rss = rss_bytes()
+            if rss is None:
+                continue
+            with self._lock:
+                for entry in self._active.values():
+                    if rss > entry[2]:
+                        entry[2] = rss
+
+    # ----- бюджет -----
+
+    def over_budget(self):
+        """Процесс вышел за MEMORY_BUDGET_MB — работать без кэшей в памяти"""
+        if not self.budget:
+            return False
+        rss = rss_bytes()
+        if rss is None:
+            return False
+        over = rss > (self.budget * RESUME_SHARE if self.streaming else self.budget)
+        if over != self.streaming:
+            self.streaming = over
+            self.switches += 1
+            if over:
+                logger.warning(f"🧠 Память {_mb(rss)} МБ больше бюджета {_mb(self.budget)} МБ: "
+                               f"статистика в потоковом режиме")
+            else:
+                logger.info(f"🧠 Память {_mb(rss)} МБ — снова в пределах бюджета, кэши в памяти включены")
+        return over
+
+    # ----- tracemalloc -----
+
+    async def allocations(self, seconds=5.0, top=15, frames=1):
+        """
+        Места, где выделена живая память: tracemalloc включается на seconds секунд
+        (если он уже работает с MEMORY_TRACEMALLOC — снимок сразу)
+        """
+        if self._snapshot_lock is None:
+            self._snapshot_lock = asyncio.Lock()
+        async with self._snapshot_lock:
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(max(1, frames))
+                await asyncio.sleep(seconds)
+            try:
+                snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+                traced, traced_peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_here:
+                    tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ))
+        key = "traceback" if frames > 1 else "lineno"
+        stats = await asyncio.to_thread(snapshot.statistics, key)
+        return {
+            "window_s": seconds if started_here else None,
+            "traced_mb": _mb(traced),
+            "traced_peak_mb": _mb(traced_peak),
+            "top": [
+                {
+                    "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_kb": round(stat.size / 1024, 1),
+                    "blocks": stat.count
+                }
+                for stat in stats[:top]
+            ]
+        }
+
+    def stats(self):
+        """Состояние для /status"""
+        with self._lock:
+            operations = {name: dict(entry) for name, entry in self.operations.items()}
+        return {
+            "rss_mb": _mb(rss_bytes()),
+            "peak_rss_mb": _mb(peak_rss_bytes()),
+            "budget_mb": _mb(self.budget) if self.budget else None,
+            "streaming": self.streaming,
+            "switches": self.switches,
+            "tracemalloc": tracemalloc.is_tracing(),
+            "operations": operations
+        }
+
+
+memory = MemoryMonitor(MEMORY_BUDGET_MB, MEMORY_SAMPLE_MS)
@@ -0,0 +1,26 @@
+"""
+МЕНЮ БОТА
+Категории, источники доходов, плательщики, способы оплаты и команды.
+Без побочных эффектов: импортируется и ботом, и benchmarks
+"""
+
+ALL_CATEGORIES = [
+    "🛒 Продукты", "🏠 Коммуналка", "🚗 Транспорт", "💳 Кредиты",
+    "🌿 Зелень", "💊 Лекарства и лечение", "🚬 Сигареты и алко",
+    "🐱 Кошка", "🧹 Быт расходники", "🎮 Развлечения и хобби",
+    "🔨 Дом/ремонт", "👕 Одежда и обувь", "💇 Красота/Уход", "📦 Другое"
+]
+
+PRIORITY_CATEGORIES = [
+    "🛒 Продукты", "🚗 Транспорт", "🚬 Сигареты и алко",
+    "🏠 Коммуналка", "💳 Кредиты", "🎮 Развлечения и хобби"
+]
+
+HIDDEN_CATEGORIES = [cat for cat in ALL_CATEGORIES if cat not in PRIORITY_CATEGORIES]
+
+INCOME_SOURCES = ["💼 Зарплата (Жена)", "💼 Зарплата (Муж)", "💻 Подработка (Муж)"]
+PAYERS = ["👩 Жена", "👨 Муж"]
+PAYMENT_METHODS = ["💵 Наличные", "💳 Карта Муж", "💳 Карта Жена", "📌 Другое"]
+
+# Команды, на которые у бота есть обработчики; остальные в метриках — "other"
+COMMANDS = ("start", "help", "stats", "ping", "debug", "cancel", "profile")
@@ -0,0 +1,252 @@
+"""
+МЕТРИКИ
+Счётчики и гистограммы в памяти процесса; GET /metrics отдаёт их
+в текстовом формате Prometheus. Без внешних сервисов и зависимостей:
+замер — это perf_counter, блокировка и пара сложений
+"""
+
+import bisect
+import functools
+import re
+import threading
+import time
+
+from menu import COMMANDS
+from tracing import start_trace
+
+# Границы корзин гистограмм, секунды: от быстрых ответов по индексу до медленных загрузок
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]  # счётчик без меток виден и до первого события
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class _Timer:
+    """with histogram.time(...): — замер блока кода (и в async-функциях)"""
+
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+        return False
+
+
+class Histogram:
+    """Гистограмма длительностей (секунды) с метками"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # метки → [счётчики по корзинам..., +Inf], сумма, число
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            snapshot = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), counts):
+                cumulative += hits
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение, которое вычисляется при каждом запросе /metrics"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self._read = read
+
+    def render(self):
+        try:
+            value = self._read()
+        except Exception:
+            return []  # источник ещё не готов — метрику просто не показываем
+        if value is None:
+            return []
+        return [f"{self.name} {_number(float(value))}"]
+
+
+class Registry:
+    """Все метрики процесса в порядке регистрации"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read):
+        return self._add(Gauge(name, documentation, read))
+
+    def render(self):
+        """Текст для /metrics (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4"  # charset добавляет Starlette
+
+# ========== МЕТРИКИ БОТА ==========
+
+YANDEX_SECONDS = registry.histogram(
+    "budget_yandex_transfer_seconds", "Скачивание и загрузка книги на Яндекс.Диск (с повторами)",
+    ("operation", "result")
+)
+WORKBOOK_SECONDS = registry.histogram(
+    "budget_workbook_seconds", "Открытие, сохранение и правка книги", ("operation",)
+)
+AGGREGATION_SECONDS = registry.histogram(
+    "budget_aggregation_seconds", "Подсчёт итогов: синхронизация индекса, сводки, периоды", ("operation",)
+)
+HANDLER_SECONDS = registry.histogram(
+    "budget_handler_seconds", "Обработка обновления Telegram", ("handler", "action")
+)
+UPDATES = registry.counter("budget_updates_total", "Обработанные обновления Telegram", ("kind",))
+HANDLER_ERRORS = registry.counter("budget_handler_errors_total", "Исключения в обработчиках Telegram", ("handler",))
+CACHE = registry.counter("budget_cache_total", "Обращения к кэшам: hit — обошлись без чтения", ("cache", "result"))
+RETRIES = registry.counter("budget_retries_total", "Повторные попытки запросов к Яндекс.Диску", ("operation",))
+UPLOAD_FAILURES = registry.counter("budget_upload_failures_total", "Загрузки книги в облако, не удавшиеся после повторов")
+
+
+def cache_result(cache, hit):
+    CACHE.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ========== ОБРАБОТЧИКИ TELEGRAM ==========
+
+_ACTION = re.compile(r"[a-z][a-z0-9]*(?:_[a-z][a-z0-9]*)*")
+
+
+def update_action(update):
+    """
+    Метка действия: callback_data без дат и названий ("cat_🛒 Продукты" → "cat",
+    "stats_start_date_01.02.25" → "stats_start_date"), известная команда или "text";
+    незнакомые команды — "other", чтобы набор меток не рос от ввода пользователей
+    """
+    query = getattr(update, "callback_query", None)
+    if query is not None:
+        match = _ACTION.match(query.data or "")
+        return "callback", match.group(0) if match else "other"
+    message = getattr(update, "message", None)
+    text = getattr(message, "text", None) or ""
+    if text.startswith("/"):
+        words = text[1:].split()
+        command = words[0].split("@")[0] if words else ""
+        return "command", command if command in COMMANDS else "other"
+    return "message", "text"
+
+
+def instrument_handler(handler):
+    """
+    Декоратор обработчика Telegram: длительность по действию, счётчик обновлений
+    и трасса обновления (см. tracing)
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        kind, action = update_action(update)
+        UPDATES.inc(kind=kind)
+        started = time.perf_counter()
+        try:
+            with start_trace(handler.__name__, action=action):
+                return await handler(update, context, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=handler.__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=handler.__name__, action=action)
+
+    return wrapper
@@ -0,0 +1,284 @@
+"""
+ГОДОВЫЕ РАЗДЕЛЫ КНИГИ
+Закрытые годы лежат отдельными файлами /Финансы/<год>/budget.xlsx,
+текущий год — в горячей книге /Финансы/budget.xlsx.
+Для закрытого года один раз считается сводка (итоги по дням и категориям);
+она хранится рядом с файлом года (summary.json) и не пересчитывается,
+пока файл года не изменится. Статистика за прошлые годы берётся из сводок.
+Строки закрытого года должны быть перенесены из горячей книги в файл года,
+иначе они попадут в итоги дважды. Бот сам их не переносит, поэтому разделы
+по умолчанию выключены (PARTITIONS_ENABLED=0).
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import PARTITIONS_ENABLED, PARTITIONS_CACHE_PATH, PARTITIONS_CHECK_INTERVAL, YANDEX_TOKEN
+from ledger_index import DateIndex
+from metrics import cache_result
+from tracing import span
+from ledger_stats import (
+    LedgerSummary, PeriodStats, SUMMARY_BREAKDOWNS, scan_ledger, parse_amount, parse_date
+)
+from yandex_disk import (
+    REMOTE_FOLDER, list_folder_async, get_resource_meta_async, download_resource_async, upload_resource_async
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = "budget.xlsx"
+SUMMARY_FILE = "summary.json"
+SUMMARY_FORMAT = 1  # при смене формата сводки пересчитываются
+MOSCOW_TZ = timezone(timedelta(hours=3))  # год закрывается по времени бота, а не сервера
+
+
+# ========== СВОДКА ЗАКРЫТОГО ГОДА ==========
+
+class DayTotals:
+    """Агрегатор: итоги по дням (расходы — ещё и по категориям), как в статистике за период"""
+
+    def __init__(self):
+        self.expenses = {}  # (день, категория) → [сумма, строк]
+        self.incomes = {}   # день → [сумма, строк]
+
+    @staticmethod
+    def _add(totals, key, amount):
+        entry = totals.setdefault(key, [0.0, 0])
+        entry[0] += amount
+        entry[1] += 1
+
+    def add_expense(self, row):
+        if not row[0] or not row[1]:
+            return
+        amount = parse_amount(row[3])
+        day = parse_date(row[0]) if amount is not None else None
+        if day is not None:
+            self._add(self.expenses, (day.toordinal(), str(row[1])), amount)
+
+    def add_income(self, row):
+        if not row[0]:
+            return
+        amount = parse_amount(row[2])
+        day = parse_date(row[0]) if amount is not None else None
+        if day is not None:
+            self._add(self.incomes, day.toordinal(), amount)
+
+
+def build_summary(year, md5, data):
+    """Сводка книги года (bytes): JSON-совместимый словарь"""
+    totals = LedgerSummary()
+    days = DayTotals()
+    scan_ledger(io.BytesIO(data), [totals, days])
+    return {
+        "format": SUMMARY_FORMAT,
+        "year": year,
+        "md5": md5,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "totals": {
+            "income_total": totals.income_total,
+            "expense_total": totals.expense_total,
+            "categorized_total": totals.categorized_total,
+            "expense_rows": totals.expense_rows,
+            "income_rows": totals.income_rows,
+            **{field: getattr(totals, field) for field in SUMMARY_BREAKDOWNS}
+        },
+        "expenses": sorted([day, category, total, count] for (day, category), (total, count) in days.expenses.items()),
+        "incomes": sorted([day, total, count] for day, (total, count) in days.incomes.items())
+    }
+
+
+def _ledger_summary(summary):
+    """LedgerSummary из сводки года"""
+    result = LedgerSummary()
+    for field, value in summary["totals"].items():
+        setattr(result, field, dict(value) if field in SUMMARY_BREAKDOWNS else value)
+    return result
+
+
+# ========== АРХИВ ЗАКРЫТЫХ ЛЕТ ==========
+
+class YearArchive:
+    """
+    Сводки закрытых лет. Список лет сверяется с Яндекс.Диском при прогреве
+    и затем не чаще раза в PARTITIONS_CHECK_INTERVAL секунд; книга года
+    скачивается, только если для её версии (MD5) ещё нет сводки
+    """
+
+    def __init__(self, root, cache_path):
+        self.root = root
+        self.cache_path = cache_path
+        self.enabled = PARTITIONS_ENABLED and bool(YANDEX_TOKEN)
+        self._lock = threading.Lock()
+        self._summaries = {}   # год → сводка
+        self._dates = None     # DateIndex по всем закрытым годам
+        self._refreshing = None
+        self.attempted = False # была ли попытка сверки в этом запуске
+        self.loaded = False    # список лет хотя бы раз получен с Яндекс.Диска
+        self.checked_at = None
+        if self.enabled:
+            self._load_cache()
+
+    # ----- локальный кэш сводок -----
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._summaries = {
+            int(year): summary for year, summary in cached.items()
+            if summary.get("format") == SUMMARY_FORMAT
+        }
+
+    def _save_cache(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._summaries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить сводки закрытых лет: {e}")
+
+    # ----- сверка с Яндекс.Диском -----
+
+    @property
+    def years(self):
+        with self._lock:
+            return sorted(self._summaries)
+
+    async def ensure_loaded(self):
+        """Перед первым запросом: сверить сводки, если в этом запуске ещё не пробовали"""
+        if self.enabled and not self.attempted:
+            await self.refresh(force=True)
+
+    async def refresh(self, force=False):
+        """Сверить список закрытых лет и версии их книг с Яндекс.Диском"""
+        if not self.enabled:
+            return
+        if not force and self.checked_at is not None and time.monotonic() - self.checked_at < PARTITIONS_CHECK_INTERVAL:
+            return
+        if self._refreshing is None:
+            self._refreshing = asyncio.Lock()
+        async with self._refreshing:
+            if not force and self.checked_at is not None and time.monotonic() - self.checked_at < PARTITIONS_CHECK_INTERVAL:
+                return
+            self.attempted = True
+            try:
+                names = await list_folder_async(self.root)
+            except Exception as e:
+                logger.warning(f"Не удалось получить список закрытых лет: {e}")
+                return
+
+            current_year = datetime.now(MOSCOW_TZ).year
+            years = sorted(int(name) for name in names if len(name) == 4 and name.isdigit() and int(name) < current_year)
+            summaries = {}
+            for year in years:
+                try:
+                    summary = await self._year_summary(year)
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить сводку за {year} год: {e}")
+                    summary = self._summaries.get(year)
+                if summary is not None:
+                    summaries[year] = summary
+
+            with self._lock:
+                changed = summaries != self._summaries
+                self._summaries = summaries
+                if changed:
+                    self._dates = None
+            if changed:
+                await asyncio.to_thread(self._save_cache)
+                logger.info(f"🗄 Закрытые годы: {', '.join(map(str, years)) or 'нет'}")
+            self.loaded = True
+            self.checked_at = time.monotonic()
+
+    async def _year_summary(self, year):
+        """Сводка года: из памяти, из summary.json рядом с книгой или подсчётом (None — книги нет)"""
+        folder = f"{self.root}/{year}"
+        meta = await get_resource_meta_async(f"{folder}/{ARCHIVE_FILE}")
+        if meta is None:
+            return None
+        md5 = meta.get("md5")
+
+        cached = self._summaries.get(year)
+        if cached is not None and md5 and cached.get("md5") == md5:
+            cache_result("archive", True)
+            return cached
+
+        if md5 and await get_resource_meta_async(f"{folder}/{SUMMARY_FILE}") is not None:
+            try:
+                stored = json.loads(await download_resource_async(f"{folder}/{SUMMARY_FILE}"))
+            except ValueError:
+                stored = None
+            if stored and stored.get("format") == SUMMARY_FORMAT and stored.get("md5") == md5:
+                cache_result("archive", True)
+                return stored
+
+        cache_result("archive", False)
+        started = time.monotonic()
+        with span("download", op="archive", year=year):
+            data = await download_resource_async(f"{folder}/{ARCHIVE_FILE}")
+        with span("parse", op="archive", year=year):
+            summary = await asyncio.to_thread(build_summary, year, md5 or hashlib.md5(data).hexdigest(), data)
+        logger.info(f"🗄 Сводка за {year} год посчитана за {time.monotonic() - started:.1f} с")
+        try:
+            await upload_resource_async(
+                f"{folder}/{SUMMARY_FILE}", json.dumps(summary, ensure_ascii=False).encode("utf-8")
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить сводку за {year} год на Яндекс.Диск: {e}")
+        return summary
+
+    # ----- запросы -----
+
+    def covers(self, start, end):
+        """Диапазон целиком в закрытых годах — горячая книга не нужна"""
+        with self._lock:
+            return all(year in self._summaries for year in range(start.year, end.year + 1))
+
+    def _date_index(self):
+        if self._dates is None:
+            dates = DateIndex()
+            summaries = self._summaries.values()
+            for day, category, total, count in sorted(row for s in summaries for row in s["expenses"]):
+                dates.add("expenses", category, day, total, count)
+            for day, total, count in sorted(row for s in summaries for row in s["incomes"]):
+                dates.add("incomes", None, day, total, count)
+            self._dates = dates
+        return self._dates
+
+    def period_stats(self, ranges):
+        """Итоги закрытых лет (PeriodStats) за диапазоны [(start, end), ...]"""
+        with self._lock:
+            if not self._summaries:
+                return [PeriodStats(start, end) for start, end in ranges]
+            dates = self._date_index()
+            return [dates.period_stats(start, end) for start, end in ranges]
+
+    def summary(self):
+        """Итоги всех закрытых лет (LedgerSummary)"""
+        result = LedgerSummary()
+        with self._lock:
+            for year in sorted(self._summaries):
+                result.merge(_ledger_summary(self._summaries[year]))
+        return result
+
+    def stats(self):
+        """Состояние для /status"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "years": sorted(self._summaries),
+                "loaded": self.loaded
+            }
+
+
+year_archive = YearArchive(REMOTE_FOLDER, PARTITIONS_CACHE_PATH)
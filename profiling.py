@@ -0,0 +1,147 @@
+"""
+ПРОФИЛИРОВАНИЕ ПО ЗАПРОСУ
+Сэмплирующий профилировщик: отдельный поток каждые несколько миллисекунд
+снимает стеки всех потоков (event loop, asyncio.to_thread, писатель, пинг)
+через sys._current_frames(). Результат — свёрнутые стеки
+("поток;функция;...;функция число"), их понимают flamegraph.pl и speedscope.
+Пока съёмки нет, профилировщик ничего не делает: ни потока, ни хуков
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Листья стеков, в которых поток просто ждёт работу (по умолчанию не показываются)
+IDLE_LEAVES = {
+    ("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker"),
+    ("queue.py", "get"), ("threading.py", "_wait_for_tstate_lock"), ("socketserver.py", "serve_forever")
+}
+
+
+class ProfilerBusyError(Exception):
+    """Съёмка уже идёт: одновременно — только одна"""
+
+
+def _location(code):
+    """Короткий путь к файлу: от корня бота или от site-packages"""
+    path = code.co_filename
+    if path.startswith(ROOT + os.sep):
+        return path[len(ROOT) + 1:]
+    marker = f"site-packages{os.sep}"
+    if marker in path:
+        return path.split(marker, 1)[1]
+    return os.path.basename(path)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({_location(code)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """Результат съёмки: счётчики свёрнутых стеков"""
+
+    def __init__(self, stacks, samples, seconds, interval, started_at):
+        self.stacks = stacks           # "поток;кадр;...;кадр" → число попаданий
+        self.samples = samples         # сколько раз снимались стеки
+        self.seconds = seconds
+        self.interval = interval
+        self.started_at = started_at
+
+    def collapsed(self):
+        """Текст в формате свёрнутых стеков"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=10):
+        """Функции, на которых чаще всего стоял поток: [(кадр, попаданий, доля)]"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(frame, count, count / total) for frame, count in leaves.most_common(limit)]
+
+
+class SamplingProfiler:
+    """Одна съёмка за раз; await capture(seconds) → Profile"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.captures = 0
+        self.last_capture = None
+
+    @property
+    def active(self):
+        return self._lock.locked()
+
+    def _sample(self, seconds, interval, idle, stop):
+        own = threading.get_ident()
+        stacks = Counter()
+        labels = {}  # code → подпись: одна и та же функция встречается в каждом снимке
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not stop.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(f"thread:{names.get(ident, ident)}")
+                stacks[";".join(reversed(parts))] += 1
+            samples += 1
+        return stacks, samples
+
+    async def capture(self, seconds, interval, idle=False):
+        """Снимать стеки seconds секунд каждые interval секунд"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("профилирование уже идёт")
+        stop = threading.Event()
+        try:
+            loop = asyncio.get_running_loop()
+            done = loop.create_future()
+            started_at = datetime.now()
+
+            def finish(callback, value):
+                if not done.done():
+                    callback(value)
+
+            def run():
+                try:
+                    result = self._sample(seconds, interval, idle, stop)
+                except BaseException as e:
+                    loop.call_soon_threadsafe(finish, done.set_exception, e)
+                else:
+                    loop.call_soon_threadsafe(finish, done.set_result, result)
+
+            threading.Thread(target=run, name="profiler", daemon=True).start()
+            stacks, samples = await done
+            self.captures += 1
+            self.last_capture = started_at
+            return Profile(stacks, samples, seconds, interval, started_at)
+        finally:
+            stop.set()  # если ожидание отменили, поток остановится на следующем снимке
+            self._lock.release()
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "captures": self.captures,
+            "last_capture": self.last_capture.isoformat(timespec="seconds") if self.last_capture else None
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,141 @@
+"""
+ПОВТОРЫ И ПРЕДОХРАНИТЕЛЬ
+Экспоненциальная задержка со случайным разбросом между попытками
+и circuit breaker: при серии отказов запросы сразу отклоняются,
+а бот отвечает по кэшу
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут: сервис недоступен, запрос не отправлялся"""
+
+
+class RetryPolicy:
+    """Сколько раз пытаться и сколько ждать между попытками"""
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Пауза после неудачной попытки attempt (0, 1, ...): full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    closed — запросы идут как обычно;
+    open — после failure_threshold отказов подряд запросы отклоняются reset_timeout секунд;
+    half_open — пропускается один пробный запрос: успех замыкает цепь, отказ снова размыкает
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.total_failures = 0
+        self.rejected = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+    def allow(self):
+        """Можно ли отправить запрос сейчас"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"✅ {self.name}: связь восстановлена")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self.total_failures += 1
+            self.last_error = str(error)[:200] if error else None
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"⚡ {self.name}: предохранитель разомкнут на {self.reset_timeout:.0f} с")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        """Состояние для /status"""
+        with self._lock:
+            self._maybe_half_open()
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "total_failures": self.total_failures,
+                "rejected": self.rejected,
+                "retry_in_s": retry_in,
+                "last_error": self.last_error
+            }
+
+
+async def retry_async(operation, policy, breaker, name, kind):
+    """
+    Выполнить await operation() с повторами, не блокируя event loop.
+    name — для журнала (может содержать путь), kind — короткая метка метрики (download, meta, ...).
+    CircuitOpenError — предохранитель разомкнут; иначе — последняя ошибка
+    """
+    for attempt in range(policy.attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} недоступен")
+        try:
+            result = await operation()
+        except Exception as e:
+            breaker.record_failure(e)
+            logger.warning(f"{name}: попытка {attempt + 1}/{policy.attempts} не удалась: {e}")
+            if attempt + 1 == policy.attempts:
+                raise
+            RETRIES.inc(operation=kind)
+            await asyncio.sleep(policy.delay(attempt))
+        else:
+            breaker.record_success()
+            return result
+
@@ -0,0 +1,618 @@
+"""
+АСИНХРОННОЕ ХРАНИЛИЩЕ
+Единственный писатель книги: все изменения идут через очередь команд
+"""
+
+import asyncio
+import gc
+import logging
+import time
+
+from config import (
+    JOURNAL_FLUSH_INTERVAL, JOURNAL_FLUSH_MAX_ENTRIES, CACHE_REFRESH_INTERVAL, CACHE_IDLE_SECONDS
+)
+from yandex_disk import (
+    journal, local_copy, download_from_yandex_async, upload_to_yandex_async, fetch_remote_meta_async,
+    load_local_workbook, save_local_workbook, local_version,
+    append_entries, append_entries_fast, delete_last_row, expense_values, income_values,
+    pending_deleted_message, format_statistics, update_summary_sheet
+)
+from summary_sheet import SUMMARY_SHEET, read_summary
+from resilience import CircuitOpenError
+from ledger_index import ledger_index
+from partitions import year_archive
+from memory import memory
+from metrics import cache_result
+from tracing import span, start_trace, current_trace_id
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCommand:
+    """Команда для писателя: append / delete / flush / refresh"""
+
+    def __init__(self, kind, sheet=None, entry_id=None):
+        self.kind = kind
+        self.sheet = sheet
+        self.entry_id = entry_id
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.trace_id = current_trace_id()  # обновление, которое ждёт команду
+
+
+class WorkbookWriter:
+    """
+    Единственная задача, которая меняет budget.xlsx и подменяет локальную копию
+    скачанной из облака. Применяет команды строго по очереди и загружает результат в облако
+    одной отправкой на пачку изменений. Новые строки вписываются прямо
+    в XML локальной копии; книга в openpyxl открывается только для удаления
+    (или если быстрый путь не подошёл).
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._task = None
+        self._wb = None             # книга в openpyxl (только когда нужна)
+        self._wb_dirty = False      # в книге есть изменения, не сохранённые в локальную копию
+        self._version = None        # версия облачного файла, от которой идут изменения
+        self._applied = set()       # записи журнала, уже внесённые в книгу
+        self._unuploaded = []       # внесённые, но ещё не загруженные в облако
+        self._dirty_since = None    # когда книга разошлась с облаком
+        self._index_base = None     # поколение индекса, в которое пишутся наши изменения
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    # ----- управление -----
+
+    def start(self):
+        """Запустить задачу писателя (из работающего event loop)"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Писатель книги запущен")
+        return self._task
+
+    async def stop(self):
+        """Дописать всё в облако и остановить писателя"""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def queue_depth(self):
+        """Сколько команд ждёт в очереди"""
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self):
+        """Состояние очереди для /status"""
+        return {
+            "queue_depth": self.queue_depth,
+            "processed": self.processed,
+            "avg_wait_ms": round(self.total_wait / self.processed * 1000, 1) if self.processed else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "last_wait_ms": round(self.last_wait * 1000, 1),
+            "pending_journal": len(journal),
+            "dirty": self._dirty_since is not None
+        }
+
+    # ----- команды -----
+
+    async def _submit(self, kind, **kwargs):
+        self.start()
+        command = WriteCommand(kind, **kwargs)
+        with span("writer", op=kind):
+            await self._queue.put(command)
+            return await command.future
+
+    async def append(self, sheet, values):
+        """Записать строку: сначала в журнал, потом в книгу. True — строка внесена в книгу"""
+        entry = await asyncio.to_thread(journal.append, sheet, values)
+        return await self._submit("append", sheet=sheet, entry_id=entry["id"])
+
+    async def delete_last(self, sheet):
+        """Удалить последнюю запись листа, вернуть текст ответа"""
+        return await self._submit("delete", sheet=sheet)
+
+    async def refresh(self):
+        """
+        Подтянуть облачную версию книги перед чтением: локальную копию заменяет
+        только писатель, иначе скачивание затёрло бы ещё не загруженные изменения.
+        Возвращает (версия для индекса, содержимое копии) — "" вместо версии,
+        если индекс уже актуален; None — копии нет
+        """
+        return await self._submit("refresh")
+
+    @property
+    def dirty(self):
+        """Локальная копия содержит изменения, которых ещё нет в облаке"""
+        return self._dirty_since is not None
+
+    def changes_in_index(self):
+        """Все изменения бота уже видны в индексе — перед чтением их не нужно загружать в облако"""
+        if len(journal) > len(self._applied):
+            return False
+        if self._dirty_since is None:
+            return True
+        return self._index_base is not None and self._index_base == ledger_index.generation
+
+    async def flush(self):
+        """Загрузить накопленные изменения в облако. True — облако актуально"""
+        if self._task is None and not len(journal):
+            return True
+        return await self._submit("flush")
+
+    # ----- цикл писателя -----
+
+    def _flush_timeout(self):
+        """Сколько ждать новых команд до отложенной загрузки"""
+        if self._dirty_since is not None:
+            return max(0.0, JOURNAL_FLUSH_INTERVAL - (time.monotonic() - self._dirty_since))
+        if len(journal) > len(self._applied):
+            return JOURNAL_FLUSH_INTERVAL  # повторим попытку позже
+        return None
+
+    async def _run(self):
+        while True:
+            try:
+                command = await asyncio.wait_for(self._queue.get(), timeout=self._flush_timeout())
+                batch = [command]
+            except asyncio.TimeoutError:
+                batch = []
+
+            # Всё, что успело накопиться, обрабатываем одной пачкой
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                # Своя трасса: пачка может обслуживать несколько обновлений сразу
+                waiting = [command.trace_id for command in batch if command.trace_id is not None]
+                with start_trace("writer", background=True, commands=len(batch), traces=waiting):
+                    await self._process(batch)
+            except Exception as e:
+                logger.error(f"Ошибка писателя книги: {e}")
+                for command in batch:
+                    if not command.future.done():
+                        command.future.set_exception(e)
+
+            if self._wb is not None and not self._wb_dirty and memory.over_budget():
+                # Выше бюджета памяти книга в openpyxl не держится между пачками
+                self._wb = None
+                gc.collect()
+
+    async def _process(self, batch):
+        now = time.monotonic()
+        for command in batch:
+            wait = now - command.enqueued_at
+            self.processed += 1
+            self.total_wait += wait
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+
+        loaded = await self._ensure_workbook()
+        if loaded:
+            await asyncio.to_thread(self._apply_journal)
+
+        upload_now = False
+        replies = []
+        for command in batch:
+            if command.kind == "append":
+                command.future.set_result(command.entry_id in self._applied)
+            elif command.kind == "delete":
+                if loaded:
+                    replies.append((command, await asyncio.to_thread(self._delete_last, command.sheet)))
+                    upload_now = True
+                else:
+                    command.future.set_result("❌ Не удалось скачать файл")
+            elif command.kind == "flush":
+                replies.append((command, None))
+                upload_now = True
+            elif command.kind == "refresh":
+                replies.append((command, None))
+
+        dirty = self._dirty_since is not None
+        if dirty and (
+            upload_now
+            or len(self._unuploaded) >= JOURNAL_FLUSH_MAX_ENTRIES
+            or time.monotonic() - self._dirty_since >= JOURNAL_FLUSH_INTERVAL
+        ):
+            synced = await self._upload()
+        else:
+            synced = not dirty and len(journal) == 0
+
+        for command, message in replies:
+            if command.kind == "flush":
+                command.future.set_result(synced)
+            elif command.kind == "refresh":
+                command.future.set_result(self._read_snapshot(loaded))
+            elif message.startswith("✅") and not synced:
+                command.future.set_result("⚠️ Запись удалена локально")
+            else:
+                command.future.set_result(message)
+
+    async def _ensure_workbook(self):
+        """Актуальная локальная копия: скачиваем, только если облачный файл сменился"""
+        if self._dirty_since is not None:
+            return True  # локальные изменения новее облака
+
+        if not await download_from_yandex_async():
+            return False
+
+        version = local_version()
+        if version is None or version != self._version:
+            self._wb = None
+            self._wb_dirty = False
+            self._version = version
+            uploaded = journal.uploaded_in(version) if version else set()
+            if uploaded:
+                # Книга с этими записями загружена, но журнал не успели очистить
+                await asyncio.to_thread(journal.remove, uploaded)
+                logger.info(f"📒 Записи журнала уже в облаке, повторно не вносим: {len(uploaded)}")
+            # В облаке нет ни одной записи из журнала — внесём их заново
+            self._applied.clear()
+            self._unuploaded.clear()
+            logger.info(f"📗 Локальная копия книги обновлена (версия {version})")
+        return True
+
+    def _read_snapshot(self, loaded):
+        """Версия и содержимое копии для читателей — снимаются в одном шаге писателя"""
+        if not loaded:
+            if not local_copy.exists():
+                return None
+            logger.warning("⚡ Облако недоступно — читаем локальную копию")
+        if self._dirty_since is not None:
+            # Облако недоступно: локальная копия новее облака
+            version = "" if self.changes_in_index() else f"local:{local_copy.md5}"
+        else:
+            version = local_version() or f"local:{local_copy.md5}"
+            if version == ledger_index.version:
+                version = ""
+        return version, local_copy.data
+
+    def _workbook(self):
+        """Книга в openpyxl: загружается из локальной копии при первой необходимости"""
+        if self._wb is None:
+            self._wb = load_local_workbook()
+        return self._wb
+
+    def _mark_dirty(self):
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+
+    def _index_follows(self):
+        """
+        Можно ли вносить наши изменения прямо в индекс: он отражает ту же версию,
+        из которой загружена книга, и с тех пор не пересобирался
+        """
+        if self._dirty_since is None:
+            self._index_base = ledger_index.generation if ledger_index.version == self._version else None
+        return self._index_base is not None and self._index_base == ledger_index.generation
+
+    def _apply_journal(self):
+        """Внести в книгу записи журнала, которых в ней ещё нет"""
+        entries = [e for e in journal.pending() if e["id"] not in self._applied]
+        if not entries:
+            return
+        follows = self._index_follows()
+        written = None
+        if not self._wb_dirty:
+            written = append_entries_fast(entries)
+            if written is not None:
+                self._wb = None  # копия изменена мимо книги в openpyxl
+        if written is None:
+            written = append_entries(self._workbook(), entries)
+            self._wb_dirty = True
+        for entry, (sheet_name, row_num) in zip(entries, written):
+            self._applied.add(entry["id"])
+            self._unuploaded.append(entry["id"])
+            if follows:
+                ledger_index.record_append(sheet_name, row_num, entry["values"])
+        self._mark_dirty()
+
+    def _delete_row(self, sheet):
+        message, deleted = delete_last_row(self._workbook(), sheet)
+        if deleted is not None:
+            self._wb_dirty = True
+            if self._index_follows():
+                ledger_index.record_delete(*deleted)
+            self._mark_dirty()
+        return message
+
+    def _delete_last(self, sheet):
+        """Удалить последнюю запись листа в книге"""
+        entry = journal.pop_last(sheet)
+        if entry is not None:
+            if entry["id"] in self._applied:
+                self._applied.discard(entry["id"])
+                self._unuploaded.remove(entry["id"])
+                self._delete_row(sheet)
+            return pending_deleted_message(sheet, entry)
+
+        return self._delete_row(sheet)
+
+    def _update_summary(self):
+        """Лист Сводка: итоги берутся из индекса, если он содержит все наши изменения"""
+        if self._index_follows():
+            update_summary_sheet(ledger_index.summary(), ledger_index.months())
+        else:
+            update_summary_sheet()
+
+    async def _upload(self):
+        """Сохранить книгу и загрузить её в облако"""
+        if self._wb_dirty:
+            if SUMMARY_SHEET not in self._wb.sheetnames:
+                self._wb.create_sheet(SUMMARY_SHEET)
+            await asyncio.to_thread(save_local_workbook, self._wb)
+            self._wb_dirty = False
+        await asyncio.to_thread(self._update_summary)
+
+        await asyncio.to_thread(journal.mark_upload, self._unuploaded, local_copy.md5)
+        if not await upload_to_yandex_async():
+            logger.warning(f"⚠️ Изменения остаются локально до следующей попытки: {len(self._unuploaded)}")
+            return False
+
+        uploaded = list(self._unuploaded)
+        await asyncio.to_thread(journal.remove, uploaded)
+        self._applied.difference_update(uploaded)
+        self._unuploaded.clear()
+        self._dirty_since = None
+        self._version = local_version()
+        if self._index_base is not None and self._index_base == ledger_index.generation and self._version:
+            ledger_index.set_version(self._version)  # индекс уже содержит загруженные изменения
+        self._index_base = None
+        logger.info(f"✅ Книга загружена в облако (записей из журнала: {len(uploaded)})")
+        return True
+
+
+writer = WorkbookWriter()
+
+
+# ========== ПУБЛИЧНЫЙ АСИНХРОННЫЙ API ==========
+
+async def add_expense_async(category, amount, payer, payment_method):
+    """Добавить расход"""
+    with memory.track("add_expense"):
+        try:
+            values = expense_values(category, amount, payer, payment_method)
+
+            if await writer.append("Расходы", values):
+                return f"✅ Расход записан: {amount:,.0f} ₽, {values[1]}"
+            else:
+                return "⚠️ Расход записан локально, но не загружен в облако"
+
+        except Exception as e:
+            logger.error(f"Ошибка добавления расхода: {e}")
+            return f"❌ Ошибка: {str(e)}"
+
+
+async def add_income_async(source, amount, payer):
+    """Добавить доход"""
+    try:
+        values = income_values(source, amount)
+
+        if await writer.append("Доходы", values):
+            return f"✅ Доход записан: {amount:,.0f} ₽, {values[1]}"
+        else:
+            return "⚠️ Доход записан локально"
+
+    except Exception as e:
+        logger.error(f"Ошибка добавления дохода: {e}")
+        return f"❌ Ошибка: {str(e)}"
+
+
+async def delete_last_async(sheet_name):
+    """Удалить последнюю запись из листа "Расходы" или "Доходы" """
+    try:
+        return await writer.delete_last(sheet_name)
+    except Exception as e:
+        logger.error(f"Ошибка удаления: {e}")
+        return f"❌ Ошибка удаления: {str(e)}"
+
+
+async def sync_local_copy():
+    """Загрузить изменения писателя и обновить локальную копию перед чтением"""
+    await writer.flush()
+    return await writer.refresh() is not None
+
+
+async def index_matches_cloud():
+    """Индекс отражает облачную книгу: сверка метаданных, без скачивания и без очереди писателя"""
+    version = ledger_index.version
+    if version is None:
+        return False
+    try:
+        remote_meta = await fetch_remote_meta_async()
+    except CircuitOpenError:
+        return True  # облако недоступно — отвечаем по индексу
+    if remote_meta is None:
+        return True
+    return remote_meta.get("md5") == version
+
+
+async def refresh_copy():
+    """
+    Подготовить книгу к чтению: загрузить изменения бота, если индекс их ещё не видит,
+    и подтянуть версию из облака, если файл меняли вне бота.
+    Возвращает (версия, содержимое), до которых нужно обновить индекс
+    ("" — индекс уже актуален), None — читать нечего
+    """
+    if not writer.changes_in_index():
+        await writer.flush()
+
+    if writer.dirty:
+        if writer.changes_in_index():
+            return "", None  # облако недоступно, но индекс видит все изменения бота
+    elif await index_matches_cloud():
+        cache_result("workbook", True)
+        return "", None
+
+    snapshot = await writer.refresh()
+    if snapshot is None:
+        # Облако недоступно и копии в памяти нет — отвечаем по индексу прошлого запуска
+        return ("", None) if ledger_index.version is not None else None
+    return snapshot
+
+
+async def refresh_index():
+    """Подготовить индекс к чтению (см. refresh_copy). False — файл недоступен"""
+    snapshot = await refresh_copy()
+    if snapshot is None:
+        return False
+    version, data = snapshot
+    cache_result("index", not version)
+    if version:
+        await asyncio.to_thread(ledger_index.sync, data, version)
+    return True
+
+
+async def get_statistics_async(by_categories=False, balance=False, period=None):
+    """Статистика (см. yandex_disk.format_statistics) по готовым итогам индекса"""
+    with memory.track("get_statistics"):
+        warmer.touch()
+        try:
+            snapshot = await refresh_copy()
+            if snapshot is None:
+                return "❌ Не удалось скачать файл"
+
+            version, data = snapshot
+            summary = None
+            cache_result("index", not version)
+            if version:
+                # Индекс отстал от книги: сначала пробуем готовый лист Сводка
+                with span("parse", op="summary_sheet"):
+                    summary = await asyncio.to_thread(read_summary, data)
+                cache_result("summary_sheet", summary is not None)
+                if summary is None:
+                    await asyncio.to_thread(ledger_index.sync, data, version)
+            if summary is None:
+                summary = await asyncio.to_thread(ledger_index.summary)
+
+            await year_archive.ensure_loaded()
+            if year_archive.years:
+                summary.merge(year_archive.summary())
+            return format_statistics(summary, by_categories, balance, period)
+
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики: {e}")
+            return f"❌ Ошибка при подсчете статистики: {str(e)}"
+
+
+async def get_period_stats(ranges):
+    """
+    Итоги (PeriodStats) за несколько диапазонов [(start, end), ...].
+    Закрытые годы берутся из сводок; горячая книга нужна, только если диапазон
+    выходит за закрытые годы, и читается, только если сменилась её версия.
+    None — файл недоступен
+    """
+    warmer.touch()
+    await year_archive.ensure_loaded()
+    results = year_archive.period_stats(ranges)
+    hot = [i for i, (start, end) in enumerate(ranges) if not year_archive.covers(start, end)]
+    if not hot:
+        return results
+
+    if not await refresh_index():
+        return None
+    hot_stats = await asyncio.to_thread(ledger_index.period_stats, [ranges[i] for i in hot])
+    for i, stats in zip(hot, hot_stats):
+        results[i].merge(stats)
+    return results
+
+
+# ========== ПРОГРЕВ КЭША ==========
+
+class CacheWarmer:
+    """
+    После старта скачивает книгу и строит индекс с итогами, чтобы первый
+    пользователь не ждал дольше остальных. Затем, пока бот простаивает,
+    периодически сверяет ревизию на Яндекс.Диске и подтягивает изменения.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.warmed_at = None
+        self.last_refresh = None
+        self.refreshes = 0
+        self._last_activity = 0.0
+        self._task = None
+
+    def touch(self):
+        """Отметить запрос пользователя: фоновая сверка его не перебивает"""
+        self._last_activity = time.monotonic()
+
+    def start(self):
+        """Запустить прогрев в фоне (из работающего event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self):
+        """Состояние прогрева для /status"""
+        return {
+            "ready": self.ready,
+            "warmed_at": self.warmed_at,
+            "last_refresh": self.last_refresh,
+            "refreshes": self.refreshes
+        }
+
+    async def warm_up(self):
+        """Скачать книгу, синхронизировать индекс и построить итоги. True — кэш готов"""
+        started = time.monotonic()
+        if not await refresh_index():
+            return False
+        await year_archive.refresh(force=True)
+        await asyncio.to_thread(ledger_index.warm)
+        self.ready = True
+        self.warmed_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        logger.info(f"🔥 Кэш прогрет за {time.monotonic() - started:.1f} с")
+        return True
+
+    def _idle(self):
+        return (
+            time.monotonic() - self._last_activity >= CACHE_IDLE_SECONDS
+            and writer.queue_depth == 0
+            and not writer.dirty
+        )
+
+    async def _run(self):
+        while not self.ready:
+            try:
+                if await self.warm_up():
+                    break
+            except Exception as e:
+                logger.error(f"Ошибка прогрева кэша: {e}")
+            logger.warning(f"⚠️ Кэш не прогрет, повтор через {CACHE_REFRESH_INTERVAL} с")
+            await asyncio.sleep(CACHE_REFRESH_INTERVAL)
+
+        while True:
+            await asyncio.sleep(CACHE_REFRESH_INTERVAL)
+            if not self._idle():
+                continue
+            try:
+                await refresh_index()
+                await year_archive.refresh(force=not year_archive.loaded)
+                await asyncio.to_thread(ledger_index.warm)
+                self.refreshes += 1
+                self.last_refresh = time.strftime("%Y-%m-%dT%H:%M:%S")
+            except Exception as e:
+                logger.warning(f"Фоновая сверка с Яндекс.Диском не удалась: {e}")
+
+
+warmer = CacheWarmer()
@@ -0,0 +1,143 @@
+"""
+ЛИСТ «СВОДКА»
+При каждом сохранении бот записывает в книгу компактный лист с итогами:
+по месяцам, категориям, периодам, плательщикам и способам оплаты.
+В листе хранится отпечаток листов с данными (CRC32 и размер их XML из
+оглавления zip). Пока отпечаток совпадает, статистика читается из сводки,
+а листы Расходы/Доходы не сканируются. Если книгу поменяли в Excel,
+отпечаток расходится, и итоги считаются заново.
+"""
+
+import logging
+import zipfile
+
+from ledger_stats import (
+    EXPENSE_SHEETS, INCOME_SHEETS, LedgerSummary, scan_ledger, parse_amount, parse_date
+)
+from xlsx_patch import XlsxPatchError, sheet_xml, sheet_values, sheet_fingerprints, read_sheet, replace_sheet
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SHEET = "Сводка"
+SUMMARY_FORMAT = "1"  # при смене раскладки листа старые сводки не читаются
+COLUMN_WIDTHS = (20, 28, 14, 10)
+
+MARKER_LABEL = "Отпечаток данных"
+TOTAL_LABEL = "Итого"
+
+# Раздел листа → поле LedgerSummary
+BREAKDOWN_LABELS = (
+    ("Категория", "categories"),
+    ("Период", "periods"),
+    ("Кто платил", "by_payer"),
+    ("Способ оплаты", "by_method"),
+    ("Источник дохода", "income_by_source")
+)
+MONTH_LABELS = (("Месяц: расходы", "expenses"), ("Месяц: доходы", "incomes"))
+
+
+class MonthTotals:
+    """Агрегатор: суммы и число строк по месяцам ("2025-03") для расходов и доходов"""
+
+    def __init__(self):
+        self.expenses = {}
+        self.incomes = {}
+
+    @staticmethod
+    def _add(totals, day_value, amount):
+        day = parse_date(day_value) if day_value and amount is not None else None
+        if day is None:
+            return
+        entry = totals.setdefault(f"{day.year:04d}-{day.month:02d}", [0.0, 0])
+        entry[0] += amount
+        entry[1] += 1
+
+    def add_expense(self, row):
+        self._add(self.expenses, row[0], parse_amount(row[3]))
+
+    def add_income(self, row):
+        self._add(self.incomes, row[0], parse_amount(row[2]))
+
+    def as_dict(self):
+        return {"expenses": self.expenses, "incomes": self.incomes}
+
+
+def data_marker(fingerprints):
+    """Отпечаток листов с данными: меняется при любой правке Расходов или Доходов"""
+    return ";".join([f"v{SUMMARY_FORMAT}"] + [f"{title}={fingerprints[title]}" for title in sorted(fingerprints)])
+
+
+def scan_summary(source):
+    """(LedgerSummary, итоги по месяцам) одним проходом по книге"""
+    summary = LedgerSummary()
+    months = MonthTotals()
+    summary.sheets = scan_ledger(source, [summary, months])
+    return summary, months.as_dict()
+
+
+# ========== ЗАПИСЬ ==========
+
+def summary_rows(summary, months, marker):
+    """Строки листа Сводка"""
+    rows = [
+        ["Раздел", "Ключ", "Сумма", "Записей"],
+        [MARKER_LABEL, marker],
+        [TOTAL_LABEL, "Доходы", summary.income_total, summary.income_rows],
+        [TOTAL_LABEL, "Расходы", summary.expense_total, summary.expense_rows],
+        [TOTAL_LABEL, "Баланс", summary.balance],
+        [TOTAL_LABEL, "С категорией", summary.categorized_total]
+    ]
+    for label, kind in MONTH_LABELS:
+        for month, (total, count) in sorted(months.get(kind, {}).items()):
+            rows.append([label, month, total, count])
+    for label, field in BREAKDOWN_LABELS:
+        for key, total in sorted(getattr(summary, field).items(), key=lambda item: -item[1]):
+            rows.append([label, str(key), total])
+    return rows
+
+
+def write_summary(data, summary, months):
+    """
+    Книга (bytes) с обновлённым листом Сводка.
+    XlsxPatchError — листа ещё нет, его нужно создать через openpyxl
+    """
+    marker = data_marker(sheet_fingerprints(data, EXPENSE_SHEETS + INCOME_SHEETS))
+    rows = summary_rows(summary, months, marker)
+    return replace_sheet(data, SUMMARY_SHEET, sheet_xml(rows, COLUMN_WIDTHS))
+
+
+# ========== ЧТЕНИЕ ==========
+
+def read_summary(data):
+    """Итоги книги (LedgerSummary) из листа Сводка; None — сводки нет или она устарела"""
+    try:
+        xml = read_sheet(data, SUMMARY_SHEET)
+        if xml is None:
+            return None
+        rows = sheet_values(xml)
+        fingerprints = sheet_fingerprints(data, EXPENSE_SHEETS + INCOME_SHEETS)
+    except (XlsxPatchError, ValueError, zipfile.BadZipFile) as e:
+        logger.info(f"Лист {SUMMARY_SHEET} не прочитан: {e}")
+        return None
+
+    if len(rows) < 2 or rows[1][:2] != [MARKER_LABEL, data_marker(fingerprints)]:
+        return None
+
+    summary = LedgerSummary()
+    summary.sheets = {
+        "expenses": next((name for name in EXPENSE_SHEETS if name in fingerprints), None),
+        "incomes": next((name for name in INCOME_SHEETS if name in fingerprints), None)
+    }
+    fields = dict(BREAKDOWN_LABELS)
+    totals = {}
+    for row in rows[2:]:
+        label, key, total, count = (row + [None] * 4)[:4]
+        if label == TOTAL_LABEL:
+            totals[key] = (total or 0, int(count or 0))
+        elif label in fields:
+            getattr(summary, fields[label])[key] = total or 0
+
+    summary.income_total, summary.income_rows = totals.get("Доходы", (0, 0))
+    summary.expense_total, summary.expense_rows = totals.get("Расходы", (0, 0))
+    summary.categorized_total = totals.get("С категорией", (0, 0))[0]
+    return summary
@@ -0,0 +1,100 @@
+"""
+Общие фикстуры: бот работает с Яндекс.Диском в памяти (benchmarks.disk_stub),
+а журнал, индекс и локальная копия у каждого теста свои
+"""
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# До импорта модулей бота: config читает окружение один раз
+_workdir = tempfile.mkdtemp(prefix="budget-tests-")
+os.environ.update({
+    "BOT_TOKEN": "",
+    "YANDEX_TOKEN": "test",
+    "PUBLIC_KEY": "test",
+    "PARTITIONS_ENABLED": "0",
+    "PROFILE_TOKEN": "test-token",
+    "LEDGER_DB_PATH": os.path.join(_workdir, "ledger.db"),
+    "JOURNAL_PATH": os.path.join(_workdir, "journal.jsonl"),
+    "CACHE_META_PATH": os.path.join(_workdir, "budget.meta.json"),
+    "YANDEX_RETRY_BASE_DELAY": "0"
+})
+
+import httpx
+import pytest
+from openpyxl import Workbook
+
+import http_pool
+import storage
+import yandex_disk
+from benchmarks.disk_stub import DiskStub, PUBLIC_PATH
+from journal import WriteJournal
+from ledger_index import LedgerIndex
+from local_copy import LocalCopy
+from resilience import CircuitBreaker
+
+EXPENSE_HEADER = ["Дата", "Категория", "Подкатегория", "Сумма", "Кто", "Период", "Способ оплаты"]
+INCOME_HEADER = ["Дата", "Источник", "Сумма", "Период"]
+
+
+def make_workbook(expenses=(), incomes=()):
+    """Книга (bytes) с листами Расходы и Доходы"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Расходы"
+    ws.append(EXPENSE_HEADER)
+    for row in expenses:
+        ws.append(list(row))
+    ws = wb.create_sheet("Доходы")
+    ws.append(INCOME_HEADER)
+    for row in incomes:
+        ws.append(list(row))
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class SlowDisk(DiskStub):
+    """DiskStub, который может придержать ответ: delays[маршрут] — секунды для следующих запросов"""
+
+    def __init__(self):
+        super().__init__()
+        self.delays = {}
+
+    async def handle_async(self, request):
+        route = request.url.path
+        delays = self.delays.get(route)
+        if delays:
+            await asyncio.sleep(delays.pop(0))
+        status, headers, content = self.handle(request.method, str(request.url), request.headers, request.read())
+        return httpx.Response(status, headers=headers, content=content)
+
+
+@pytest.fixture
+def disk(tmp_path, monkeypatch):
+    """Яндекс.Диск в памяти и чистое состояние хранилища"""
+    stub = SlowDisk()
+    monkeypatch.setattr(http_pool, "_async_client",
+                        httpx.AsyncClient(transport=httpx.MockTransport(stub.handle_async), follow_redirects=True))
+
+    copy = LocalCopy(str(tmp_path / "budget.xlsx"), str(tmp_path / "budget.meta.json"))
+    journal = WriteJournal(str(tmp_path / "journal.jsonl"))
+    index = LedgerIndex(str(tmp_path / "ledger.db"))
+    for module in (yandex_disk, storage):
+        monkeypatch.setattr(module, "local_copy", copy)
+        monkeypatch.setattr(module, "journal", journal)
+    monkeypatch.setattr(storage, "ledger_index", index)
+    monkeypatch.setattr(storage, "writer", storage.WorkbookWriter())
+    monkeypatch.setattr(yandex_disk, "yandex_breaker", CircuitBreaker("Яндекс.Диск"))
+    yield stub
+    index.close()
+
+
+def cloud_file(stub):
+    return stub.get_file(PUBLIC_PATH)
@@ -0,0 +1,95 @@
+"""Диагностические эндпоинты: доступ только с PROFILE_TOKEN"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from tracing import start_trace
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+def get(path, headers=None):
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            return await client.get(path, headers=headers or {})
+
+    return asyncio.run(request())
+
+
+@pytest.mark.parametrize("path", ["/debug/traces", "/debug/profile?seconds=1", "/debug/memory?seconds=1"])
+def test_debug_endpoints_require_token(path):
+    assert get(path).status_code == 401
+    assert get(path, {"Authorization": "Bearer wrong"}).status_code == 401
+
+
+def test_traces_do_not_expose_user_ids():
+    @main.instrument_handler
+    async def handler(update, context):
+        return None
+
+    class Update:
+        callback_query = None
+        message = None
+        effective_user = type("User", (), {"id": 123456789})()
+
+    with start_trace("outer_probe"):
+        pass
+    asyncio.run(handler(Update(), None))
+
+    response = get("/debug/traces", AUTH)
+    assert response.status_code == 200
+    assert response.json()["traces"]
+    assert "123456789" not in response.text
+
+
+def test_token_in_query_is_not_accepted():
+    assert get("/debug/traces?token=test-token").status_code == 401
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", float("nan"), None, "abc"])
+def test_profile_limits_ignore_non_finite(value):
+    assert main.profile_seconds(value) == 10
+    assert main.profile_interval(value) == main.PROFILE_INTERVAL_MS / 1000
+
+
+def test_profile_limits_are_clamped():
+    assert main.profile_seconds("1e9") == main.PROFILE_MAX_SECONDS
+    assert main.profile_seconds("-5") == 1
+    assert main.profile_interval(0) == 0.001
+    assert main.profile_interval(1e9) == 1.0
+
+
+
+@pytest.mark.parametrize("configured, expected", [(0, 0.001), (-5, 0.001), (float("nan"), 0.005), (1e9, 1.0)])
+def test_profile_interval_sanitises_config(monkeypatch, configured, expected):
+    monkeypatch.setattr(main, "PROFILE_INTERVAL_MS", configured)
+    assert main.profile_interval(None) == expected
+
+
+def test_profile_command_uses_sanitised_interval(monkeypatch):
+    captured = {}
+
+    class Profile:
+        stacks = {}
+
+    async def capture(seconds, interval, idle=False):
+        captured["interval"] = interval
+        return Profile()
+
+    class Message:
+        async def reply_text(self, text):
+            pass
+
+    update = type("Update", (), {"effective_user": type("User", (), {"id": 1})(), "message": Message()})()
+    context = type("Context", (), {"args": ["1"]})()
+    monkeypatch.setattr(main, "ADMIN_IDS", {1})
+    monkeypatch.setattr(main, "PROFILE_INTERVAL_MS", 0)
+    monkeypatch.setattr(main.profiler, "capture", capture)
+
+    asyncio.run(main.profile_command(update, context))
+
+    assert captured["interval"] == 0.001
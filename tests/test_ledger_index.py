@@ -0,0 +1,86 @@
+"""Индекс книги: правки бота (record_append / record_delete) не расходятся с файлом"""
+
+import io
+import logging
+
+import pytest
+from openpyxl import load_workbook
+
+from conftest import make_workbook
+from ledger_index import LedgerIndex
+from yandex_disk import delete_last_row
+
+EXPENSES = [
+    [f"0{day}.03.2024", category, "", amount, "Аня", "март 2024", "Карта"]
+    for day, (category, amount) in enumerate([("Еда", 100), ("Транспорт", 60), ("Еда", 250), ("Дом", 900)], start=1)
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LedgerIndex(str(tmp_path / "ledger.db"))
+    yield index
+    index.close()
+
+
+def fresh_checksums(tmp_path, data):
+    """Состояние листов в индексе, построенном по файлу с нуля"""
+    index = LedgerIndex(str(tmp_path / "fresh.db"))
+    try:
+        index.sync(data)
+        return {kind: index._state(kind) for kind in ("expenses", "incomes")}
+    finally:
+        index.close()
+
+
+def save(wb):
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def test_record_append_then_sync_reads_nothing_new(index, tmp_path):
+    data = make_workbook(expenses=EXPENSES[:3])
+    index.sync(data)
+
+    wb = load_workbook(io.BytesIO(data))
+    wb["Расходы"].append(EXPENSES[3])
+    index.record_append("Расходы", 5, EXPENSES[3])
+    data = save(wb)
+
+    assert {kind: index._state(kind) for kind in ("expenses", "incomes")} == fresh_checksums(tmp_path, data)
+    index.sync(data)
+    assert index.summary().expense_total == 1310
+
+
+def test_delete_last_then_sync_matches_checksum(index, tmp_path, caplog):
+    data = make_workbook(expenses=EXPENSES)
+    index.sync(data)
+
+    wb = load_workbook(io.BytesIO(data))
+    _, deleted = delete_last_row(wb, "Расходы")
+    assert deleted == ("Расходы", 5)
+    index.record_delete(*deleted)
+    data = save(wb)
+
+    assert {kind: index._state(kind) for kind in ("expenses", "incomes")} == fresh_checksums(tmp_path, data)
+    with caplog.at_level(logging.INFO, logger="ledger_index"):
+        assert index.sync(data)
+    assert "пересобирается" not in caplog.text
+    assert index.summary().expense_total == 410
+
+
+def test_delete_middle_row_then_sync_matches_checksum(index, tmp_path, caplog):
+    data = make_workbook(expenses=EXPENSES)
+    index.sync(data)
+
+    wb = load_workbook(io.BytesIO(data))
+    wb["Расходы"].delete_rows(3)
+    index.record_delete("Расходы", 3)
+    data = save(wb)
+
+    assert {kind: index._state(kind) for kind in ("expenses", "incomes")} == fresh_checksums(tmp_path, data)
+    with caplog.at_level(logging.INFO, logger="ledger_index"):
+        index.sync(data)
+    assert "пересобирается" not in caplog.text
+    assert index.summary().expense_total == 1250
@@ -0,0 +1,12 @@
+"""Тексты статистики: формулы те же, что были в main.py"""
+
+from ledger_stats import format_change
+
+
+def test_format_change_keeps_original_formula():
+    assert format_change(100, 150) == "+50.0% 📈"
+    assert format_change(200, 100) == "-50.0% 📉"
+    assert format_change(100, 100) == "+0.0% ➡️"
+    assert format_change(0, 100) == "∞"
+    # Отрицательный баланс делится без модуля, как и раньше
+    assert format_change(-100, -50) == "-50.0% 📉"
@@ -0,0 +1,35 @@
+"""Метки метрик обработчиков: конечный набор при любом вводе"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import HANDLER_SECONDS, instrument_handler, update_action
+
+
+def message(text):
+    return SimpleNamespace(callback_query=None, message=SimpleNamespace(text=text))
+
+
+@pytest.mark.parametrize("text, action", [
+    ("/stats", "stats"),
+    ("/start@budget_bot", "start"),
+    ("/profile 30", "profile"),
+    ("/anything", "other"),
+    ("/Stats", "other"),
+    ("/", "other"),
+    ("/ ", "other"),
+    ("/   @bot", "other"),
+])
+def test_command_labels_are_bounded(text, action):
+    assert update_action(message(text)) == ("command", action)
+
+
+def test_handler_survives_blank_command():
+    @instrument_handler
+    async def handler(update, context):
+        return "ok"
+
+    assert asyncio.run(handler(message("/ "), None)) == "ok"
+    assert "action=\"other\"" in "".join(HANDLER_SECONDS.render())
@@ -0,0 +1,96 @@
+"""Писатель книги и чтение статистики при одновременных запросах"""
+
+import asyncio
+import io
+
+import pytest
+
+import storage
+import yandex_disk
+from conftest import make_workbook, cloud_file
+from benchmarks.disk_stub import PUBLIC_PATH
+from journal import WriteJournal
+from ledger_stats import LedgerSummary, scan_ledger
+from local_copy import LocalCopy
+
+META_ROUTE = "/v1/disk/public/resources"
+
+
+def cloud_summary(stub):
+    summary = LedgerSummary()
+    summary.sheets = scan_ledger(io.BytesIO(cloud_file(stub)), [summary])
+    return summary
+
+
+@pytest.mark.parametrize("warm", [False, True], ids=["cold_index", "warm_index"])
+def test_reader_refresh_does_not_overwrite_unuploaded_append(disk, warm):
+    disk.put_file(PUBLIC_PATH, make_workbook([["01.03.25", "Продукты", None, 100.0, "Муж", "25-9", "Карта"]]))
+
+    async def scenario():
+        if warm:
+            await storage.refresh_index()
+        # Проверка версии у читателя задерживается, запись тем временем попадает в копию
+        disk.delays[META_ROUTE] = [0.5]
+        stats = asyncio.create_task(storage.get_statistics_async(balance=True))
+        await asyncio.sleep(0.1)
+        reply = await storage.add_expense_async("🛒 Продукты", 500, "👨 Муж", "💳 Карта")
+        await stats
+        assert await storage.writer.flush()
+        index_total = storage.ledger_index.summary().expense_total
+        await storage.writer.stop()
+        return reply, index_total
+
+    reply, index_total = asyncio.run(scenario())
+
+    assert reply.startswith("✅")
+    assert len(storage.journal) == 0
+    assert cloud_summary(disk).expense_total == 600.0
+    assert index_total == 600.0
+
+
+def test_statistics_follow_writes(disk):
+    disk.put_file(PUBLIC_PATH, make_workbook(incomes=[["01.03.25", "Зарплата", 1000.0, "25-9"]]))
+
+    async def scenario():
+        await storage.add_expense_async("🛒 Продукты", 300, "👨 Муж", "💳 Карта")
+        text = await storage.get_statistics_async(balance=True)
+        await storage.writer.stop()
+        return text
+
+    text = asyncio.run(scenario())
+
+    assert "Расходы: 300 ₽" in text
+    assert "Баланс: 700 ₽" in text
+    assert cloud_summary(disk).expense_total == 300.0
+
+
+def test_restart_after_upload_does_not_replay_uploaded_entries(disk, tmp_path, monkeypatch):
+    disk.put_file(PUBLIC_PATH, make_workbook())
+
+    async def crash_after_upload():
+        # Процесс «падает» между загрузкой книги и очисткой журнала
+        monkeypatch.setattr(storage.journal, "remove", lambda entry_ids: None)
+        await storage.add_expense_async("🛒 Продукты", 500, "👨 Муж", "💳 Карта")
+        assert await storage.writer.flush()
+
+    asyncio.run(crash_after_upload())
+    assert cloud_summary(disk).expense_total == 500.0
+
+    # Перезапуск: журнал читается с диска, локальной копии нет
+    restarted = WriteJournal(str(tmp_path / "journal.jsonl"))
+    assert len(restarted) == 1
+    copy = LocalCopy(str(tmp_path / "restart.xlsx"), str(tmp_path / "restart.meta.json"))
+    for module in (yandex_disk, storage):
+        monkeypatch.setattr(module, "journal", restarted)
+        monkeypatch.setattr(module, "local_copy", copy)
+    monkeypatch.setattr(storage, "writer", storage.WorkbookWriter())
+
+    async def after_restart():
+        assert await storage.writer.flush()
+        await storage.writer.stop()
+
+    asyncio.run(after_restart())
+
+    assert len(restarted) == 0
+    assert len(WriteJournal(str(tmp_path / "journal.jsonl"))) == 0
+    assert cloud_summary(disk).expense_total == 500.0
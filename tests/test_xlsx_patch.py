@@ -0,0 +1,129 @@
+"""Быстрая дозапись в xlsx: результат должен открываться openpyxl как обычная книга"""
+
+import io
+import zipfile
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill
+
+from conftest import make_workbook
+from xlsx_patch import append_rows
+from yandex_disk import _pick_sheet
+
+EXPENSE = ["05.03.2024", "Еда", "Кафе", 350.5, "Аня", "март 2024", "Карта"]
+
+
+def reopen(data):
+    return load_workbook(io.BytesIO(data))
+
+
+def styled_book(empty_rows=5):
+    """Книга, где под шапкой заранее оформлены пустые строки"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Расходы"
+    ws.append(["Дата", "Категория", "Подкатегория", "Сумма", "Кто", "Период", "Способ оплаты"])
+    fill = PatternFill("solid", fgColor="FFF2CC")
+    for row in range(2, 2 + empty_rows):
+        for column in range(1, 8):
+            ws.cell(row=row, column=column).fill = fill
+        ws.cell(row=row, column=4).number_format = "#,##0.00"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def test_append_fills_styled_empty_row():
+    data, written, tails = append_rows(styled_book(), [("Расходы", EXPENSE)], _pick_sheet)
+
+    assert written == [("Расходы", 2)]
+    assert tails == {"Расходы": 2}
+    ws = reopen(data)["Расходы"]
+    assert [cell.value for cell in ws[2]] == EXPENSE
+    assert ws.cell(row=2, column=1).fill.fgColor.rgb == "00FFF2CC"
+    assert ws.cell(row=2, column=4).number_format == "#,##0.00"
+    assert ws.cell(row=3, column=1).value is None
+    assert ws.cell(row=3, column=1).fill.fgColor.rgb == "00FFF2CC"
+
+
+def test_append_after_styled_rows_with_known_tail():
+    data, _, tails = append_rows(styled_book(), [("Расходы", EXPENSE)], _pick_sheet)
+    data, written, tails = append_rows(data, [("Расходы", EXPENSE), ("Расходы", EXPENSE)], _pick_sheet, tails)
+
+    assert written == [("Расходы", 3), ("Расходы", 4)]
+    ws = reopen(data)["Расходы"]
+    assert [ws.cell(row=row, column=2).value for row in range(2, 6)] == ["Еда", "Еда", "Еда", None]
+
+
+def shared_strings_book():
+    """Книга как из Excel: строки листа лежат в xl/sharedStrings.xml"""
+    main = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rels = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    pkg = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+    doc = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    content = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    strings = ["Дата", "Категория", "Подкатегория", "Сумма", "Кто", "Период", "Способ оплаты",
+               "01.03.2024", "Транспорт", "Метро", "Аня", "март 2024", "Карта"]
+    header = "".join(f'<c r="{col}1" t="s"><v>{i}</v></c>' for i, col in enumerate("ABCDEFG"))
+    row = ('<c r="A2" t="s"><v>7</v></c><c r="B2" t="s"><v>8</v></c><c r="C2" t="s"><v>9</v></c>'
+           '<c r="D2"><v>60</v></c><c r="E2" t="s"><v>10</v></c><c r="F2" t="s"><v>11</v></c>'
+           '<c r="G2" t="s"><v>12</v></c>')
+    parts = {
+        "[Content_Types].xml": (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{content}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{content}.worksheet+xml"/>'
+            f'<Override PartName="/xl/sharedStrings.xml" ContentType="{content}.sharedStrings+xml"/>'
+            '</Types>'
+        ),
+        "_rels/.rels": f'<Relationships {pkg}><Relationship Id="rId1" Type="{doc}/officeDocument" '
+                       'Target="xl/workbook.xml"/></Relationships>',
+        "xl/workbook.xml": f'<workbook {main} {rels}><sheets>'
+                           '<sheet name="Расходы" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships {pkg}>'
+            f'<Relationship Id="rId1" Type="{doc}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{doc}/sharedStrings" Target="sharedStrings.xml"/>'
+            '</Relationships>'
+        ),
+        "xl/worksheets/sheet1.xml": f'<worksheet {main}><dimension ref="A1:G2"/><sheetData>'
+                                    f'<row r="1">{header}</row><row r="2">{row}</row>'
+                                    '</sheetData></worksheet>',
+        "xl/sharedStrings.xml": f'<sst {main} count="{len(strings)}" uniqueCount="{len(strings)}">'
+                                + "".join(f"<si><t>{text}</t></si>" for text in strings) + "</sst>"
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zout:
+        for name, xml in parts.items():
+            zout.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml)
+    return buffer.getvalue()
+
+
+def test_append_keeps_shared_strings():
+    original = shared_strings_book()
+    with zipfile.ZipFile(io.BytesIO(original)) as zin:
+        shared = zin.read("xl/sharedStrings.xml")
+
+    data, written, _ = append_rows(original, [("Расходы", EXPENSE)], _pick_sheet)
+
+    assert written == [("Расходы", 3)]
+    with zipfile.ZipFile(io.BytesIO(data)) as zin:
+        assert zin.testzip() is None
+        assert zin.read("xl/sharedStrings.xml") == shared
+    rows = [[cell.value for cell in row] for row in reopen(data)["Расходы"].iter_rows(min_row=2)]
+    assert rows == [["01.03.2024", "Транспорт", "Метро", 60, "Аня", "март 2024", "Карта"], EXPENSE]
+
+
+def test_patched_book_survives_openpyxl_round_trip():
+    data, _, _ = append_rows(make_workbook(), [("Расходы", EXPENSE)], _pick_sheet)
+    wb = reopen(data)
+    assert wb["Расходы"].max_row == 2
+    assert wb["Расходы"].calculate_dimension() == "A1:G2"
+
+    wb["Расходы"].append(EXPENSE)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    ws = reopen(buffer.getvalue())["Расходы"]
+    assert [ws.cell(row=row, column=4).value for row in (2, 3)] == [350.5, 350.5]
@@ -0,0 +1,232 @@
+"""
+ТРАССИРОВКА
+Каждое обновление Telegram — трасса: дерево шагов (обработчик, скачивание,
+разбор, подсчёт, сохранение, загрузка, ответ) с длительностями.
+Текущий шаг передаётся через contextvars и доходит до asyncio.to_thread;
+вне трассы span() ничего не делает и ничего не создаёт.
+Последние трассы лежат в кольцевом буфере; /debug/traces и /debug
+показывают самые медленные из них
+"""
+
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config import TRACING_ENABLED, TRACE_BUFFER_SIZE, TRACE_SLOW_MS
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    """Шаг трассы: имя, метки, длительность и вложенные шаги"""
+
+    __slots__ = ("name", "attrs", "started", "duration", "error", "children", "trace")
+
+    def __init__(self, name, attrs, trace):
+        self.name = name
+        self.attrs = attrs
+        self.trace = trace
+        self.children = []
+        self.error = None
+        self.duration = None
+        self.started = time.perf_counter()
+
+    def as_dict(self, origin):
+        result = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None
+        }
+        if self.attrs:
+            result["attrs"] = self.attrs
+        if self.error:
+            result["error"] = self.error
+        if self.children:
+            result["children"] = [child.as_dict(origin) for child in list(self.children)]
+        return result
+
+
+class Trace:
+    """Дерево шагов одного обновления (или фоновой работы)"""
+
+    __slots__ = ("id", "root", "started_at", "background")
+
+    def __init__(self, name, attrs, background):
+        self.id = next(_ids)
+        self.started_at = datetime.now()
+        self.background = background
+        self.root = Span(name, attrs, self)
+
+    @property
+    def duration_ms(self):
+        return (self.root.duration or 0) * 1000
+
+    def breakdown(self):
+        """Время по видам шагов (download, parse, ...) — сумма шагов верхнего уровня каждого вида"""
+        totals = {}
+
+        def walk(span, inside):
+            for child in list(span.children):
+                if child.name not in inside and child.duration is not None:
+                    totals[child.name] = totals.get(child.name, 0.0) + child.duration * 1000
+                walk(child, inside | {child.name})
+
+        walk(self.root, frozenset())
+        return {name: round(ms, 1) for name, ms in sorted(totals.items(), key=lambda item: -item[1])}
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_ms": round(self.duration_ms, 1),
+            "background": self.background,
+            "breakdown": self.breakdown(),
+            "root": self.root.as_dict(self.root.started)
+        }
+
+
+class TraceBuffer:
+    """Последние трассы; фоновые попадают сюда, только если они медленные"""
+
+    def __init__(self, size, slow_ms):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=max(1, size))
+        self.recorded = 0
+        self.slow = 0
+
+    def record(self, trace):
+        slow = trace.duration_ms >= self.slow_ms
+        if trace.background and not slow:
+            return
+        with self._lock:
+            self._traces.append(trace)
+            self.recorded += 1
+            if slow:
+                self.slow += 1
+
+    def slowest(self, limit=10, min_ms=0.0):
+        """Самые долгие трассы буфера, от долгих к быстрым"""
+        with self._lock:
+            traces = [trace for trace in self._traces if trace.duration_ms >= min_ms]
+        return sorted(traces, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+    def stats(self):
+        with self._lock:
+            durations = sorted(trace.duration_ms for trace in self._traces if not trace.background)
+        pick = lambda share: round(durations[min(len(durations) - 1, int(share * len(durations)))], 1)
+        return {
+            "enabled": TRACING_ENABLED,
+            "recorded": self.recorded,
+            "buffered": len(self._traces),
+            "slow": self.slow,
+            "slow_ms": self.slow_ms,
+            "p50_ms": pick(0.50) if durations else None,
+            "p95_ms": pick(0.95) if durations else None,
+            "max_ms": round(durations[-1], 1) if durations else None
+        }
+
+
+traces = TraceBuffer(TRACE_BUFFER_SIZE, TRACE_SLOW_MS)
+
+
+# ========== ШАГИ ==========
+
+class _Scope:
+    """with span(...)/start_trace(...): открывает шаг и делает его текущим"""
+
+    __slots__ = ("_name", "_attrs", "_root", "_background", "_span", "_token")
+
+    def __init__(self, name, attrs, root=False, background=False):
+        self._name = name
+        self._attrs = attrs
+        self._root = root
+        self._background = background
+
+    def __enter__(self):
+        if self._root:
+            self._span = Trace(self._name, self._attrs, self._background).root
+        else:
+            parent = _current.get()
+            self._span = Span(self._name, self._attrs, parent.trace)
+            parent.children.append(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self._span
+        span.duration = time.perf_counter() - span.started
+        if exc_type is not None and exc_type is not asyncio.CancelledError:
+            span.error = f"{exc_type.__name__}: {exc}"[:200]
+        _current.reset(self._token)
+        if self._root:
+            traces.record(span.trace)
+        return False
+
+
+class _NoScope:
+    """Шаг вне трассы: ничего не записывает"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SCOPE = _NoScope()
+
+
+def start_trace(name, background=False, **attrs):
+    """Новая трасса (обновление Telegram или фоновая работа с background=True)"""
+    if not TRACING_ENABLED:
+        return _NO_SCOPE
+    return _Scope(name, attrs, root=True, background=background)
+
+
+def span(name, **attrs):
+    """Шаг внутри текущей трассы; без трассы — пустой контекст"""
+    if _current.get() is None:
+        return _NO_SCOPE
+    return _Scope(name, attrs)
+
+
+def annotate(**attrs):
+    """Добавить метки текущему шагу"""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace.id if current is not None else None
+
+
+# ========== ОТЧЁТ ДЛЯ /debug ==========
+
+def slow_summary(limit=3):
+    """Несколько строк о медленных обновлениях для команды /debug"""
+    stats = traces.stats()
+    if not stats["enabled"]:
+        return "🐢 Трассировка выключена"
+    if not stats["buffered"]:
+        return "🐢 Трасс пока нет"
+    lines = [
+        f"🐢 Обновлений: {stats['recorded']}, медленных (≥ {stats['slow_ms']:.0f} мс): {stats['slow']}",
+        f"⏱ p50 {stats['p50_ms']} мс, p95 {stats['p95_ms']} мс, max {stats['max_ms']} мс"
+    ]
+    for trace in traces.slowest(limit):
+        root = trace.root
+        action = root.attrs.get("action")
+        title = f"{root.name} ({action})" if action else root.name
+        steps = ", ".join(f"{name} {ms:.0f}" for name, ms in list(trace.breakdown().items())[:4])
+        lines.append(f"• {trace.started_at:%H:%M:%S} {title}: {trace.duration_ms:.0f} мс" + (f" — {steps}" if steps else ""))
+    return "\n".join(lines)
@@ -0,0 +1,387 @@
+"""
+БЫСТРАЯ ДОЗАПИСЬ СТРОК В XLSX
+Новая строка вписывается прямо в XML листа внутри zip-архива:
+остальные части книги копируются байт в байт, openpyxl не нужен
+"""
+
+import copy
+import io
+import posixpath
+import re
+import struct
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_ROW_NUM = re.compile(rb'\sr="(\d+)"')
+_CELL = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.DOTALL)
+_CELL_REF = re.compile(rb'\sr="([A-Z]+)(\d+)"')
+_CELL_STYLE = re.compile(rb'\ss="(\d+)"')
+_SPANS = re.compile(rb'\sspans="[^"]*"')
+_DIMENSION = re.compile(rb'<dimension ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"')
+
+
+class XlsxPatchError(Exception):
+    """Файл устроен не так, как ожидает быстрый путь — нужен openpyxl"""
+
+
+# ========== СТРУКТУРА КНИГИ ==========
+
+def _sheet_parts(zin):
+    """Имя листа → путь к его XML внутри архива"""
+    try:
+        workbook = ElementTree.fromstring(zin.read("xl/workbook.xml"))
+        rels = ElementTree.fromstring(zin.read("xl/_rels/workbook.xml.rels"))
+    except (KeyError, ElementTree.ParseError) as e:
+        raise XlsxPatchError(f"не прочитана структура книги: {e}")
+
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{{{PKG_REL_NS}}}Relationship")}
+    parts = {}
+    for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet"):
+        target = targets.get(sheet.get(f"{{{REL_NS}}}id"))
+        if not target:
+            continue
+        if target.startswith("/"):
+            parts[sheet.get("name")] = target.lstrip("/")
+        else:
+            parts[sheet.get("name")] = posixpath.normpath(posixpath.join("xl", target))
+    return parts
+
+
+# ========== XML ЛИСТА ==========
+
+def _sheet_data_bounds(xml):
+    """(начало, конец) содержимого <sheetData>; пустой <sheetData/> разворачивается"""
+    start = xml.find(b"<sheetData>")
+    if start < 0:
+        empty = xml.find(b"<sheetData/>")
+        if empty < 0:
+            raise XlsxPatchError("в листе нет <sheetData>")
+        xml = xml[:empty] + b"<sheetData></sheetData>" + xml[empty + len(b"<sheetData/>"):]
+        start = empty
+    start += len(b"<sheetData>")
+    end = xml.find(b"</sheetData>", start)
+    if end < 0:
+        raise XlsxPatchError("не найден </sheetData>")
+    return xml, start, end
+
+
+def _rows_backwards(xml, lo, hi):
+    """Строки листа от последней к первой: (номер, начало, конец)"""
+    pos = hi
+    while True:
+        start = xml.rfind(b"<row", lo, pos)
+        if start < 0:
+            return
+        tag_end = xml.index(b">", start)
+        if xml[tag_end - 1:tag_end] == b"/":
+            end = tag_end + 1
+        else:
+            end = xml.index(b"</row>", tag_end) + len(b"</row>")
+        match = _ROW_NUM.search(xml, start, tag_end)
+        if match is None:
+            raise XlsxPatchError("строка без номера")
+        yield int(match.group(1)), start, end
+        pos = start
+
+
+def _cells(row_xml):
+    """Ячейки строки: {колонка: (атрибуты, содержимое)}"""
+    cells = {}
+    for match in _CELL.finditer(row_xml):
+        ref = _CELL_REF.search(match.group(1))
+        if ref is None:
+            raise XlsxPatchError("ячейка без адреса")
+        cells[ref.group(1).decode()] = (match.group(1), match.group(2) or b"")
+    return cells
+
+
+def _has_value(content):
+    return b"<v>" in content or b"<v " in content or b"<is>" in content or b"<f" in content
+
+
+def _last_data_row(xml, lo, hi):
+    """Последняя строка, где в колонке A есть значение (как find_last_data_row)"""
+    for row_num, start, end in _rows_backwards(xml, lo, hi):
+        cell = _cells(xml[start:end]).get("A")
+        if cell is not None and _has_value(cell[1]):
+            return row_num
+        if row_num <= 1:
+            break
+    return 1
+
+
+def _cell_xml(ref, value, style=None):
+    """XML ячейки: число — <v>, строка — inlineStr"""
+    style_attr = f' s="{style}"' if style is not None else ""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise XlsxPatchError(f"неподдерживаемое значение {type(value).__name__}")
+    if isinstance(value, str):
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'.encode("utf-8")
+    return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'.encode("utf-8")
+
+
+def _build_row(row_num, values, existing=None):
+    """
+    Элемент <row> с новыми значениями. Пустая строка с оформлением (existing)
+    сохраняет свои атрибуты и стили ячеек; занятую ячейку не перезаписываем
+    """
+    new_cells = {}
+    for column, value in enumerate(values, start=1):
+        if value is None or value == "":
+            continue
+        new_cells[get_column_letter(column)] = value
+
+    row_attrs = f' r="{row_num}"'.encode()
+    old_cells = {}
+    if existing is not None:
+        tag_end = existing.index(b">")
+        row_attrs = _SPANS.sub(b"", existing[4:tag_end].rstrip(b"/"))
+        old_cells = _cells(existing)
+
+    parts = []
+    for column in sorted(set(new_cells) | set(old_cells), key=column_index_from_string):
+        if column not in new_cells:
+            attrs, content = old_cells[column]
+            parts.append(b"<c" + attrs + (b">" + content + b"</c>" if content else b"/>"))
+            continue
+        style = None
+        if column in old_cells:
+            attrs, content = old_cells[column]
+            if _has_value(content):
+                raise XlsxPatchError(f"ячейка {column}{row_num} уже занята")
+            match = _CELL_STYLE.search(attrs)
+            style = match.group(1).decode() if match else None
+        parts.append(_cell_xml(f"{column}{row_num}", new_cells[column], style))
+
+    return b"<row" + row_attrs + b">" + b"".join(parts) + b"</row>"
+
+
+def _insert_row(xml, lo, hi, row_num, values):
+    """Вставить строку row_num в <sheetData> (с сохранением порядка строк)"""
+    insert_at = hi
+    existing = None
+    for num, start, end in _rows_backwards(xml, lo, hi):
+        if num == row_num:
+            existing = (start, end)
+            break
+        if num < row_num:
+            insert_at = end
+            break
+        insert_at = start
+    else:
+        insert_at = lo if insert_at == hi else insert_at
+
+    if existing is not None:
+        start, end = existing
+        row_xml = _build_row(row_num, values, xml[start:end])
+        return xml[:start] + row_xml + xml[end:], len(row_xml) - (end - start)
+
+    row_xml = _build_row(row_num, values)
+    return xml[:insert_at] + row_xml + xml[insert_at:], len(row_xml)
+
+
+def _fix_dimension(xml, max_row, max_column):
+    """Расширить <dimension ref="A1:G10"> до новых границ"""
+    match = _DIMENSION.search(xml)
+    if match is None:
+        return xml
+    first_col, first_row, last_col, last_row = match.groups()
+    last_col = last_col or first_col
+    last_row = int(last_row or first_row)
+    column = max(column_index_from_string(last_col.decode()), max_column)
+    ref = f'<dimension ref="{first_col.decode()}{first_row.decode()}:{get_column_letter(column)}{max(last_row, max_row)}"'
+    return xml[:match.start()] + ref.encode() + xml[match.end():]
+
+
+def append_to_sheet_xml(xml, rows, last_row=None):
+    """
+    Дописать строки values после последней строки с данными.
+    Возвращает (новый XML, номера строк, новая последняя строка)
+    """
+    if b"<sheetData" not in xml:
+        raise XlsxPatchError("лист с префиксом пространства имён")
+    xml, lo, hi = _sheet_data_bounds(xml)
+    if last_row is None:
+        last_row = _last_data_row(xml, lo, hi)
+
+    written = []
+    max_column = 0
+    for values in rows:
+        row_num = last_row + 1
+        xml, grown = _insert_row(xml, lo, hi, row_num, values)
+        hi += grown
+        written.append(row_num)
+        max_column = max(max_column, len(values))
+        if values and values[0]:
+            last_row = row_num
+
+    return _fix_dimension(xml, written[-1] if written else 0, max_column), written, last_row
+
+
+# ========== ZIP ==========
+
+def _copy_member(zin, zout, info):
+    """Скопировать часть архива как есть, без распаковки и повторного сжатия"""
+    source = zin.fp
+    source.seek(info.header_offset)
+    header = source.read(30)
+    if header[:4] != b"PK\x03\x04":
+        raise XlsxPatchError(f"повреждён заголовок {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    raw = header + source.read(name_length + extra_length) + source.read(info.compress_size)
+    if info.flag_bits & 0x08:
+        signature = source.read(4)
+        raw += signature + source.read(12 if signature == b"PK\x07\x08" else 8)
+
+    copied = copy.copy(info)
+    copied.header_offset = zout.fp.tell()
+    zout.fp.write(raw)
+    zout.filelist.append(copied)
+    zout.NameToInfo[copied.filename] = copied
+    zout.start_dir = zout.fp.tell()
+
+
+def append_rows(data, rows, pick_sheet, last_rows=None):
+    """
+    Дописать строки [(лист, values), ...] в книгу (bytes).
+    pick_sheet(имена листов, лист) выбирает настоящий лист книги,
+    last_rows — известные последние строки с данными {лист: номер}.
+    Возвращает (новые bytes книги, [(лист, номер строки), ...], обновлённые last_rows)
+    """
+    last_rows = dict(last_rows or {})
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin:
+        parts = _sheet_parts(zin)
+        by_sheet = {}
+        written = []
+        for sheet_name, values in rows:
+            title = pick_sheet(list(parts), sheet_name)
+            by_sheet.setdefault(title, []).append(values)
+            written.append(title)
+
+        patched = {}
+        numbers = {}
+        for title, sheet_rows in by_sheet.items():
+            try:
+                xml = zin.read(parts[title])
+            except KeyError:
+                raise XlsxPatchError(f"нет части {parts[title]}")
+            patched[parts[title]], numbers[title], last_rows[title] = append_to_sheet_xml(
+                xml, sheet_rows, last_rows.get(title)
+            )
+
+        with zipfile.ZipFile(output, "w") as zout:
+            for info in zin.infolist():
+                if info.filename in patched:
+                    zout.writestr(copy.copy(info), patched[info.filename], compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    _copy_member(zin, zout, info)
+
+    positions = {title: iter(row_nums) for title, row_nums in numbers.items()}
+    return output.getvalue(), [(title, next(positions[title])) for title in written], last_rows
+
+
+# ========== ЛИСТ ЦЕЛИКОМ ==========
+
+def sheet_xml(rows, widths=()):
+    """XML листа со строками values (None — пустая ячейка) и шириной колонок"""
+    parts = []
+    for row_num, values in enumerate(rows, start=1):
+        cells = b"".join(
+            _cell_xml(f"{get_column_letter(column)}{row_num}", value)
+            for column, value in enumerate(values, start=1)
+            if value is not None and value != ""
+        )
+        parts.append(f'<row r="{row_num}">'.encode() + cells + b"</row>")
+    max_column = max((len(values) for values in rows), default=1)
+    cols = "".join(
+        f'<col min="{column}" max="{column}" width="{width}" customWidth="1"/>'
+        for column, width in enumerate(widths, start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<worksheet xmlns="{MAIN_NS}">'
+        f'<dimension ref="A1:{get_column_letter(max_column)}{max(len(rows), 1)}"/>'
+        + (f"<cols>{cols}</cols>" if cols else "")
+    ).encode("utf-8") + b"<sheetData>" + b"".join(parts) + b"</sheetData></worksheet>"
+
+
+def sheet_values(xml):
+    """Значения листа [[значение, ...], ...] из XML, где нет общих строк (sharedStrings)"""
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError as e:
+        raise XlsxPatchError(f"не разобран XML листа: {e}")
+    rows = []
+    for row in root.iter(f"{{{MAIN_NS}}}row"):
+        values = []
+        for cell in row.iter(f"{{{MAIN_NS}}}c"):
+            match = re.match(r"([A-Z]+)", cell.get("r", ""))
+            if match is None:
+                raise XlsxPatchError("ячейка без адреса")
+            column = column_index_from_string(match.group(1))
+            kind = cell.get("t")
+            if kind == "inlineStr":
+                value = "".join(t.text or "" for t in cell.iter(f"{{{MAIN_NS}}}t"))
+            else:
+                v = cell.find(f"{{{MAIN_NS}}}v")
+                if kind == "s":
+                    raise XlsxPatchError("лист использует общие строки")
+                if v is None or v.text is None:
+                    value = None
+                elif kind in ("str", "e"):
+                    value = v.text
+                else:
+                    value = float(v.text)
+            values.extend([None] * (column - len(values)))
+            values[column - 1] = value
+        rows.append(values)
+    return rows
+
+
+def sheet_fingerprints(data, titles):
+    """
+    CRC32 и размер XML листов из оглавления архива (без распаковки):
+    {лист: "crc:размер"}; листов, которых нет в книге, в ответе нет
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zin:
+        parts = _sheet_parts(zin)
+        result = {}
+        for title in titles:
+            if title in parts and parts[title] in zin.NameToInfo:
+                info = zin.getinfo(parts[title])
+                result[title] = f"{info.CRC:08x}:{info.file_size}"
+        return result
+
+
+def read_sheet(data, title):
+    """XML листа (None — такого листа нет)"""
+    with zipfile.ZipFile(io.BytesIO(data)) as zin:
+        part = _sheet_parts(zin).get(title)
+        if part is None or part not in zin.NameToInfo:
+            return None
+        return zin.read(part)
+
+
+def replace_sheet(data, title, xml):
+    """Заменить XML листа title; остальные части копируются как есть"""
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin:
+        part = _sheet_parts(zin).get(title)
+        if part is None or part not in zin.NameToInfo:
+            raise XlsxPatchError(f"в книге нет листа {title}")
+        with zipfile.ZipFile(output, "w") as zout:
+            for info in zin.infolist():
+                if info.filename == part:
+                    zout.writestr(copy.copy(info), xml, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    _copy_member(zin, zout, info)
+    return output.getvalue()
@@ -3,84 +3,311 @@
 Полная версия с функциями статистики
 """
 
-import requests
+import asyncio
 from datetime import datetime
+import io
 import logging
 import time
+import weakref
+import zipfile
 from openpyxl import load_workbook
-from config import YANDEX_TOKEN, PUBLIC_KEY, LOCAL_EXCEL_PATH
+from config import (
+    YANDEX_TOKEN, PUBLIC_KEY, YANDEX_API_BASE, LOCAL_EXCEL_PATH, CACHE_META_PATH, LOCAL_CACHE_TO_DISK, JOURNAL_PATH,
+    YANDEX_RETRY_ATTEMPTS, YANDEX_RETRY_BASE_DELAY, YANDEX_RETRY_MAX_DELAY,
+    YANDEX_BREAKER_THRESHOLD, YANDEX_BREAKER_RESET
+)
+from journal import WriteJournal
+from local_copy import LocalCopy
+from resilience import RetryPolicy, CircuitBreaker, CircuitOpenError, retry_async
+from http_pool import get_async_client
+from metrics import YANDEX_SECONDS, WORKBOOK_SECONDS, UPLOAD_FAILURES, cache_result
+from tracing import span
+from ledger_stats import PERIOD_LABELS
+from xlsx_patch import append_rows, XlsxPatchError
+from summary_sheet import SUMMARY_SHEET, write_summary, scan_summary
 
 logger = logging.getLogger(__name__)
 
+API_BASE_URL = f"{YANDEX_API_BASE}/v1/disk"
+PUBLIC_RESOURCE_URL = f"{API_BASE_URL}/public/resources"
+PUBLIC_DOWNLOAD_URL = f"{API_BASE_URL}/public/resources/download"
+FOLDER_URL = f"{API_BASE_URL}/resources"
+UPLOAD_URL = f"{API_BASE_URL}/resources/upload"
+REMOTE_FOLDER = "/Финансы"
+REMOTE_PATH = "/Финансы/budget.xlsx"
+META_FIELDS = ("md5", "modified", "revision", "size")
+DOWNLOAD_CHUNK = 65536
 
-def download_from_yandex(max_retries=3):
-    """Скачать файл с повторными попытками"""
-    for attempt in range(max_retries):
-        try:
-            api_url = "https://cloud-api.yandex.net/v1/disk/public/resources/download"
-            params = {"public_key": PUBLIC_KEY}
-            response = requests.get(api_url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            download_url = response.json()["href"]
-            response = requests.get(download_url, timeout=60)
+# Повторы и предохранитель для всех запросов к Яндекс.Диску
+TRANSFER_RETRY = RetryPolicy(YANDEX_RETRY_ATTEMPTS, YANDEX_RETRY_BASE_DELAY, YANDEX_RETRY_MAX_DELAY)
+META_RETRY = RetryPolicy(2, YANDEX_RETRY_BASE_DELAY, YANDEX_RETRY_MAX_DELAY)
+yandex_breaker = CircuitBreaker("Яндекс.Диск", YANDEX_BREAKER_THRESHOLD, YANDEX_BREAKER_RESET)
+
+# Книга живёт в памяти; на диск — только если включён LOCAL_CACHE_TO_DISK
+local_copy = LocalCopy(LOCAL_EXCEL_PATH, CACHE_META_PATH, persist=LOCAL_CACHE_TO_DISK)
+
+
+# ========== КЭШ ЛОКАЛЬНОЙ КОПИИ ==========
+
+def _load_cache_meta():
+    """Метаданные локальной копии файла"""
+    return local_copy.meta()
+
+
+def _save_cache_meta(meta):
+    """Сохранить метаданные локальной копии файла"""
+    local_copy.set_meta(meta)
+
+
+def invalidate_cache():
+    """Сбросить кэш: локальная копия больше не совпадает с облаком (указатели строк остаются)"""
+    tails = _load_cache_meta().get("tails")
+    _save_cache_meta({"tails": tails} if tails else {})
+
+
+def _meta_params():
+    """Параметры запроса метаданных публичного файла"""
+    return {"public_key": PUBLIC_KEY, "fields": ",".join(META_FIELDS)}
+
+
+def _is_cache_fresh(remote_meta):
+    """Совпадает ли локальная копия с версией на Яндекс.Диске"""
+    local_meta = _load_cache_meta()
+    if not local_meta or not local_copy.exists():
+        return False
+    
+    # Локальная копия могла быть изменена без загрузки в облако
+    if local_meta.get("local_size") != local_copy.size:
+        return False
+    
+    if remote_meta.get("md5"):
+        return local_meta.get("md5") == remote_meta["md5"]
+    return (
+        remote_meta.get("revision") is not None
+        and local_meta.get("revision") == remote_meta.get("revision")
+    )
+
+
+def _remember_version(remote_meta, content_md5):
+    """Запомнить, какой версии облачного файла соответствует локальная копия"""
+    meta = {"md5": content_md5, "local_size": local_copy.size}
+    # Ревизию берём только если она точно относится к этому содержимому
+    if remote_meta and remote_meta.get("md5") == content_md5:
+        meta.update({field: remote_meta.get(field) for field in META_FIELDS})
+    tails = _load_cache_meta().get("tails")
+    if tails:
+        meta["tails"] = tails
+    _save_cache_meta(meta)
+
+
+def _remember_if_uploaded(remote_meta):
+    """Запомнить версию, если облако уже отдаёт наш файл"""
+    local_md5 = local_copy.md5
+    if remote_meta.get("md5") == local_md5:
+        _remember_version(remote_meta, local_md5)
+
+
+def _store_download(content, remote_meta):
+    """Запомнить скачанную книгу и её версию"""
+    local_copy.replace(content)
+    _remember_version(remote_meta, local_copy.md5)
+
+
+_folder_ready = False
+
+
+def _mark_folder(response):
+    """Папка есть, если её создали (201) или она уже существовала (409)"""
+    global _folder_ready
+    if response.status_code in (201, 409):
+        _folder_ready = True
+
+
+async def _ensure_folder_async(headers):
+    """Создать папку Финансы, если это ещё не сделано в этом запуске"""
+    if not _folder_ready:
+        _mark_folder(await get_async_client().put(FOLDER_URL, headers=headers, params={"path": REMOTE_FOLDER}, timeout=15))
+
+
+# ========== ОБМЕН С ЯНДЕКС.ДИСКОМ ==========
+
+async def get_remote_meta_async():
+    """Получить md5/modified/revision файла на Яндекс.Диске (без скачивания)"""
+    response = await get_async_client().get(PUBLIC_RESOURCE_URL, params=_meta_params(), timeout=15)
+    response.raise_for_status()
+    data = response.json()
+    return {field: data.get(field) for field in META_FIELDS}
+
+
+async def fetch_remote_meta_async():
+    """Метаданные через предохранитель (None — не удалось получить)"""
+    try:
+        return await retry_async(get_remote_meta_async, META_RETRY, yandex_breaker, "Метаданные файла", "meta")
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.warning(f"Не удалось получить метаданные файла: {e}")
+        return None
+
+
+async def download_from_yandex_async():
+    """
+    Скачать файл с повторными попытками (только если он изменился).
+    Вызывает только писатель (storage.writer): скачивание заменяет локальную копию
+    """
+    client = get_async_client()
+    
+    try:
+        with span("download", op="check"):
+            remote_meta = await fetch_remote_meta_async()
+    except CircuitOpenError:
+        logger.error("❌ Яндекс.Диск недоступен")
+        return False
+    
+    if remote_meta and await asyncio.to_thread(_is_cache_fresh, remote_meta):
+        cache_result("workbook", True)
+        logger.info(f"✅ Файл не изменился (ревизия {remote_meta.get('revision')}), используем локальную копию")
+        return True
+    cache_result("workbook", False)
+    
+    async def fetch():
+        params = {"public_key": PUBLIC_KEY}
+        response = await client.get(PUBLIC_DOWNLOAD_URL, params=params, timeout=30)
+        response.raise_for_status()
+        
+        download_url = response.json()["href"]
+        buffer = bytearray()
+        async with client.stream("GET", download_url, timeout=60) as response:
             response.raise_for_status()
-            
-            with open(LOCAL_EXCEL_PATH, "wb") as f:
-                f.write(response.content)
-            
-            logger.info("✅ Файл скачан с Яндекс.Диска")
-            return True
-            
-        except Exception as e:
-            logger.warning(f"Попытка {attempt + 1}/{max_retries} не удалась: {e}")
-            time.sleep(2)
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                buffer += chunk
+        return buffer
+    
+    started = time.perf_counter()
+    try:
+        with span("download", op="workbook"):
+            buffer = await retry_async(fetch, TRANSFER_RETRY, yandex_breaker, "Скачивание", "download")
+    except Exception as e:
+        YANDEX_SECONDS.observe(time.perf_counter() - started, operation="download", result="error")
+        logger.error(f"❌ Не удалось скачать файл: {e}")
+        return False
+    YANDEX_SECONDS.observe(time.perf_counter() - started, operation="download", result="ok")
     
-    logger.error("❌ Не удалось скачать файл после всех попыток")
-    return False
+    await asyncio.to_thread(_store_download, buffer, remote_meta)
+    logger.info("✅ Файл скачан с Яндекс.Диска")
+    return True
 
 
-def upload_to_yandex(max_retries=3):
+async def upload_to_yandex_async():
     """Загрузить файл с повторными попытками"""
-    for attempt in range(max_retries):
-        try:
-            headers = {"Authorization": f"OAuth {YANDEX_TOKEN}"}
-            
-            # Создаем папку Финансы (если её нет)
-            folder_url = "https://cloud-api.yandex.net/v1/disk/resources"
-            folder_params = {"path": "/Финансы"}
-            requests.put(folder_url, headers=headers, params=folder_params)
-            
-            # Получаем ссылку для загрузки
-            upload_url = "https://cloud-api.yandex.net/v1/disk/resources/upload"
-            upload_params = {
-                "path": "/Финансы/budget.xlsx",
-                "overwrite": "true"
-            }
-            
-            response = requests.get(upload_url, headers=headers, params=upload_params, timeout=30)
-            response.raise_for_status()
-            
-            href = response.json()["href"]
-            
-            with open(LOCAL_EXCEL_PATH, "rb") as f:
-                upload_response = requests.put(href, files={"file": f}, timeout=60)
-                upload_response.raise_for_status()
-            
-            logger.info("✅ Файл загружен на Яндекс.Диск")
-            return True
-            
-        except Exception as e:
-            logger.warning(f"Попытка {attempt + 1}/{max_retries} не удалась: {e}")
-            time.sleep(2)
+    client = get_async_client()
+    headers = {"Authorization": f"OAuth {YANDEX_TOKEN}"}
     
-    logger.error("❌ Не удалось загрузить файл после всех попыток")
-    return False
+    async def send():
+        # Создаем папку Финансы (один раз за запуск)
+        await _ensure_folder_async(headers)
+        
+        # Получаем ссылку для загрузки
+        upload_params = {
+            "path": REMOTE_PATH,
+            "overwrite": "true"
+        }
+        
+        response = await client.get(UPLOAD_URL, headers=headers, params=upload_params, timeout=30)
+        response.raise_for_status()
+        
+        href = response.json()["href"]
+        upload_response = await client.put(href, files={"file": ("budget.xlsx", local_copy.data)}, timeout=60)
+        upload_response.raise_for_status()
+    
+    started = time.perf_counter()
+    try:
+        with span("upload", op="workbook"):
+            await retry_async(send, TRANSFER_RETRY, yandex_breaker, "Загрузка", "upload")
+    except Exception as e:
+        YANDEX_SECONDS.observe(time.perf_counter() - started, operation="upload", result="error")
+        UPLOAD_FAILURES.inc()
+        logger.error(f"❌ Не удалось загрузить файл: {e}")
+        return False
+    YANDEX_SECONDS.observe(time.perf_counter() - started, operation="upload", result="ok")
+    
+    try:
+        await asyncio.to_thread(_remember_if_uploaded, await get_remote_meta_async())
+    except Exception as e:
+        logger.warning(f"Не удалось получить метаданные после загрузки: {e}")
+    
+    logger.info("✅ Файл загружен на Яндекс.Диск")
+    return True
+
+
+# ========== ФАЙЛЫ В ПАПКЕ ФИНАНСЫ (OAuth) ==========
+
+def _oauth_headers():
+    return {"Authorization": f"OAuth {YANDEX_TOKEN}"}
+
+
+async def list_folder_async(path):
+    """Имена вложенных папок: [имя, ...] (папки нет — пустой список)"""
+    async def fetch():
+        params = {"path": path, "fields": "_embedded.items.name,_embedded.items.type", "limit": 1000}
+        response = await get_async_client().get(FOLDER_URL, headers=_oauth_headers(), params=params, timeout=15)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        items = response.json().get("_embedded", {}).get("items", [])
+        return [item["name"] for item in items if item.get("type") == "dir"]
 
+    return await retry_async(fetch, META_RETRY, yandex_breaker, f"Список {path}", "list")
 
-def get_period():
-    """Определить период по дню месяца"""
-    day = datetime.now().day
+
+async def get_resource_meta_async(path):
+    """md5/modified/revision/size файла по пути (None — файла нет)"""
+    async def fetch():
+        params = {"path": path, "fields": ",".join(META_FIELDS)}
+        response = await get_async_client().get(FOLDER_URL, headers=_oauth_headers(), params=params, timeout=15)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        return {field: data.get(field) for field in META_FIELDS}
+
+    return await retry_async(fetch, META_RETRY, yandex_breaker, f"Метаданные {path}", "meta")
+
+
+async def download_resource_async(path):
+    """Содержимое файла по пути (bytes)"""
+    client = get_async_client()
+
+    async def fetch():
+        response = await client.get(f"{FOLDER_URL}/download", headers=_oauth_headers(), params={"path": path}, timeout=30)
+        response.raise_for_status()
+        buffer = bytearray()
+        async with client.stream("GET", response.json()["href"], timeout=60) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                buffer += chunk
+        return bytes(buffer)
+
+    return await retry_async(fetch, TRANSFER_RETRY, yandex_breaker, f"Скачивание {path}", "download")
+
+
+async def upload_resource_async(path, data):
+    """Записать файл по пути (перезаписывая существующий)"""
+    client = get_async_client()
+
+    async def send():
+        params = {"path": path, "overwrite": "true"}
+        response = await client.get(UPLOAD_URL, headers=_oauth_headers(), params=params, timeout=30)
+        response.raise_for_status()
+        upload_response = await client.put(response.json()["href"], content=data, timeout=60)
+        upload_response.raise_for_status()
+
+    await retry_async(send, TRANSFER_RETRY, yandex_breaker, f"Загрузка {path}", "upload")
+
+
+def get_period(when=None):
+    """Определить период по дню месяца (по умолчанию — сегодняшнему)"""
+    day = (when or datetime.now()).day
     if day <= 9: 
         return "25-9"
     elif day <= 24: 
@@ -113,344 +340,297 @@ def find_last_data_row(worksheet):
     return 1
 
 
-def add_expense(category, amount, payer, payment_method):
-    """Добавить расход"""
+def _find_sheet(wb, sheet_name):
+    """Найти лист по имени (с запасными вариантами)"""
+    return _pick_sheet(wb.sheetnames, sheet_name)
+
+
+def _pick_sheet(sheetnames, sheet_name):
+    """Выбрать лист из списка имён (с запасными вариантами)"""
+    for name in [sheet_name, sheet_name.lower(), "Лист1", "budget", "Sheet1"]:
+        if name in sheetnames:
+            return name
+    
+    fallback = sheetnames[0]  # первый доступный лист
+    logger.info(f"Лист {sheet_name} не найден, используем: {fallback}")
+    return fallback
+
+
+# ========== УКАЗАТЕЛИ НА ПОСЛЕДНЮЮ СТРОКУ ==========
+# Для каждой открытой книги помним последнюю строку с данными на каждом листе,
+# чтобы не проходить лист снизу вверх от max_row при каждой записи и удалении.
+# Указатели сохраняются в метаданные кэша вместе с MD5 копии, к которой относятся.
+
+_tail_rows = weakref.WeakKeyDictionary()  # книга → {лист: последняя строка с данными}
+
+
+def last_data_row(wb, ws):
+    """Последняя строка с данными: обратный проход только при первом обращении к листу"""
+    tails = _tail_rows.setdefault(wb, {})
+    if ws.title not in tails:
+        tails[ws.title] = find_last_data_row(ws)
+    return tails[ws.title]
+
+
+def _set_last_row(wb, ws, row):
+    _tail_rows.setdefault(wb, {})[ws.title] = row
+
+
+def _last_row_above(ws, row):
+    """Последняя строка с данными выше row"""
+    for r in range(row - 1, 1, -1):
+        if ws.cell(row=r, column=1).value:
+            return r
+    return 1
+
+
+def _stored_tails():
+    """Сохранённые указатели, если они относятся к текущей локальной копии"""
+    tails = _load_cache_meta().get("tails") or {}
+    if tails.get("stamp") == local_copy.md5:
+        return tails.get("rows", {})
+    return {}
+
+
+def _save_tails(rows):
+    meta = _load_cache_meta()
+    meta["tails"] = {"stamp": local_copy.md5, "rows": dict(rows)}
+    _save_cache_meta(meta)
+
+
+# ========== ЛОКАЛЬНАЯ КОПИЯ КНИГИ ==========
+
+def load_local_workbook():
+    """Открыть локальную копию книги для изменения"""
+    with WORKBOOK_SECONDS.time(operation="load"), span("parse", op="openpyxl"):
+        wb = load_workbook(local_copy.stream())
+    _tail_rows[wb] = {name: row for name, row in _stored_tails().items() if name in wb.sheetnames}
+    return wb
+
+
+def save_local_workbook(wb):
+    """Сохранить книгу в буфер и подменить локальную копию целиком"""
+    buffer = io.BytesIO()
+    with WORKBOOK_SECONDS.time(operation="save"), span("save", op="openpyxl"):
+        wb.save(buffer)
+    # Локальная копия теперь расходится с облаком
+    invalidate_cache()
+    local_copy.replace(buffer.getbuffer())
+    _save_tails(_tail_rows.get(wb, {}))
+
+
+def local_version():
+    """MD5 облачной версии, которой соответствует локальная копия (или None)"""
+    return _load_cache_meta().get("md5")
+
+
+def append_entries_fast(entries):
+    """
+    Быстрый путь записи: строки вписываются прямо в XML листов локальной копии,
+    без загрузки книги в openpyxl. Возвращает [(лист, номер строки), ...]
+    или None, если книгу придётся менять через openpyxl
+    """
     try:
-        if not download_from_yandex():
-            return "❌ Не удалось скачать файл"
-        
-        wb = load_workbook(LOCAL_EXCEL_PATH)
-        
-        # Ищем лист с расходами
-        sheet_name = None
-        for name in ["Расходы", "расходы", "Лист1", "budget", "Sheet1"]:
-            if name in wb.sheetnames:
-                sheet_name = name
-                break
-        
-        if not sheet_name:
-            sheet_name = wb.sheetnames[0]  # первый доступный лист
-            logger.info(f"Лист расходов не найден, используем: {sheet_name}")
-        
-        ws = wb[sheet_name]
-        
-        # Очищаем от эмодзи
-        category_clean = clean_text(category)
-        payer_clean = clean_text(payer)
-        method_clean = clean_text(payment_method)
-        
-        # Находим последнюю строку с данными
-        last_row = find_last_data_row(ws)
-        new_row = last_row + 1
-        
-        # Добавляем данные
-        ws.cell(row=new_row, column=1, value=get_date())        # A - Дата
-        ws.cell(row=new_row, column=2, value=category_clean)    # B - Категория
-        ws.cell(row=new_row, column=3, value="")                # C - Подкат
-        ws.cell(row=new_row, column=4, value=float(amount))     # D - Сумма
-        ws.cell(row=new_row, column=5, value=payer_clean)       # E - Кто
-        ws.cell(row=new_row, column=6, value=get_period())      # F - Период
-        ws.cell(row=new_row, column=7, value=method_clean)      # G - Способ
-        
-        # Сохраняем файл
-        wb.save(LOCAL_EXCEL_PATH)
-        
-        if upload_to_yandex():
-            return f"✅ Расход записан: {amount:,.0f} ₽, {category_clean}"
-        else:
-            return "⚠️ Расход записан локально, но не загружен в облако"
-            
-    except Exception as e:
-        logger.error(f"Ошибка добавления расхода: {e}")
-        return f"❌ Ошибка: {str(e)}"
+        with WORKBOOK_SECONDS.time(operation="patch"), span("save", op="xml_patch"):
+            data, written, tails = append_rows(
+                local_copy.data,
+                [(entry["sheet"], entry["values"]) for entry in entries],
+                _pick_sheet, _stored_tails()
+            )
+    except (XlsxPatchError, zipfile.BadZipFile) as e:
+        logger.warning(f"⚠️ Быстрая запись недоступна, используем openpyxl: {e}")
+        return None
+    
+    # Локальная копия теперь расходится с облаком
+    invalidate_cache()
+    local_copy.replace(data)
+    _save_tails(tails)
+    return written
 
 
-def add_income(source, amount, payer):
-    """Добавить доход"""
+def update_summary_sheet(summary=None, months=None):
+    """
+    Перед загрузкой в облако: записать в локальную копию лист Сводка.
+    Без summary итоги считаются проходом по книге
+    """
+    started = time.perf_counter()
     try:
-        if not download_from_yandex():
-            return "❌ Не удалось скачать файл"
-        
-        wb = load_workbook(LOCAL_EXCEL_PATH)
-        
-        # Ищем лист с доходами
-        sheet_name = None
-        for name in ["Доходы", "доходы", "Лист1", "budget", "Sheet1"]:
-            if name in wb.sheetnames:
-                sheet_name = name
-                break
-        
-        if not sheet_name:
-            sheet_name = wb.sheetnames[0]  # первый доступный лист
-            logger.info(f"Лист доходов не найден, используем: {sheet_name}")
-        
-        ws = wb[sheet_name]
-        
-        # Очищаем от эмодзи
-        source_clean = clean_text(source)
-        
-        # Находим последнюю строку с данными
-        last_row = find_last_data_row(ws)
-        new_row = last_row + 1
-        
-        # Добавляем данные
-        ws.cell(row=new_row, column=1, value=get_date())        # A - Дата
-        ws.cell(row=new_row, column=2, value=source_clean)      # B - Источник
-        ws.cell(row=new_row, column=3, value=float(amount))     # C - Сумма
-        ws.cell(row=new_row, column=4, value=get_period())      # D - Период
-        
-        # Сохраняем файл
-        wb.save(LOCAL_EXCEL_PATH)
-        
-        if upload_to_yandex():
-            return f"✅ Доход записан: {amount:,.0f} ₽, {source_clean}"
-        else:
-            return "⚠️ Доход записан локально"
-            
+        with span("save", op="summary_sheet"):
+            if summary is None:
+                summary, months = scan_summary(local_copy.stream())
+            try:
+                data = write_summary(local_copy.data, summary, months)
+            except XlsxPatchError:
+                # Листа ещё нет: один раз создаём его через openpyxl
+                wb = load_local_workbook()
+                wb.create_sheet(SUMMARY_SHEET)
+                save_local_workbook(wb)
+                data = write_summary(local_copy.data, summary, months)
+        WORKBOOK_SECONDS.observe(time.perf_counter() - started, operation="summary_sheet")
     except Exception as e:
-        logger.error(f"Ошибка добавления дохода: {e}")
-        return f"❌ Ошибка: {str(e)}"
+        # Сводка не обязательна: без неё статистика просто считается по листам
+        logger.warning(f"⚠️ Лист {SUMMARY_SHEET} не обновлён: {e}")
+        return False
+
+    tails = _stored_tails()
+    invalidate_cache()
+    local_copy.replace(data)
+    _save_tails(tails)
+    return True
+
+
+def append_entries(wb, entries):
+    """Дописать строки журнала в книгу, вернуть [(лист, номер строки), ...]"""
+    written = []
+    for entry in entries:
+        ws = wb[_find_sheet(wb, entry["sheet"])]
+        new_row = last_data_row(wb, ws) + 1
+        for column, value in enumerate(entry["values"], start=1):
+            ws.cell(row=new_row, column=column, value=value)
+        if entry["values"] and entry["values"][0]:
+            _set_last_row(wb, ws, new_row)
+        written.append((ws.title, new_row))
+    return written
+
+
+# ========== ЖУРНАЛ ЗАПИСЕЙ ==========
+
+journal = WriteJournal(JOURNAL_PATH)
+
+
+# ========== ЗАПИСЬ И УДАЛЕНИЕ ==========
+
+def expense_values(category, amount, payer, payment_method):
+    """Строка листа расходов (эмодзи убраны)"""
+    return [
+        get_date(),                     # A - Дата
+        clean_text(category),           # B - Категория
+        "",                             # C - Подкат
+        float(amount),                  # D - Сумма
+        clean_text(payer),              # E - Кто
+        get_period(),                   # F - Период
+        clean_text(payment_method)      # G - Способ
+    ]
+
+
+def income_values(source, amount):
+    """Строка листа доходов (эмодзи убраны)"""
+    return [
+        get_date(),                     # A - Дата
+        clean_text(source),             # B - Источник
+        float(amount),                  # C - Сумма
+        get_period()                    # D - Период
+    ]
+
+
+def pending_deleted_message(sheet_name, entry):
+    """Текст ответа для записи, убранной из журнала"""
+    values = entry["values"]
+    amount = values[3] if sheet_name == "Расходы" else values[2]
+    return deleted_message(sheet_name, values[0], values[1], amount)
 
 
-def delete_last(sheet_name):
+def deleted_message(sheet_name, date, category, amount):
+    """Текст ответа об удалённой записи"""
+    if sheet_name == "Расходы":
+        return f"✅ Удалён расход: {date} | {category} | {amount:,.0f} ₽"
+    else:
+        return f"✅ Удалён доход: {date} | {category} | {amount:,.0f} ₽"
+
+
+def delete_last_row(wb, sheet_name):
     """
-    Удалить последнюю запись из указанного листа
-    sheet_name: "Расходы" или "Доходы"
+    Удалить последнюю строку листа в книге
+    Возвращает (текст ответа, (лист, номер удалённой строки) или None)
     """
+    # Находим лист
+    target_sheet = None
+    for name in [sheet_name, sheet_name.lower(), "Лист1", "budget", "Sheet1"]:
+        if name in wb.sheetnames:
+            target_sheet = name
+            break
+    
+    if not target_sheet:
+        return f"❌ Лист {sheet_name} не найден", None
+    
+    ws = wb[target_sheet]
+    
+    # Находим последнюю строку с данными
+    last_row = last_data_row(wb, ws)
+    
+    if last_row <= 1:
+        return "❌ Нет записей для удаления", None
+    
+    # Сохраняем данные для сообщения
+    date = ws.cell(row=last_row, column=1).value
+    category = ws.cell(row=last_row, column=2).value
+    amount = ws.cell(row=last_row, column=4).value
+    
+    # 🔧 Преобразование суммы в число для форматирования
     try:
-        if not download_from_yandex():
-            return "❌ Не удалось скачать файл"
-        
-        wb = load_workbook(LOCAL_EXCEL_PATH)
-        
-        # Находим лист
-        target_sheet = None
-        for name in [sheet_name, sheet_name.lower(), "Лист1", "budget", "Sheet1"]:
-            if name in wb.sheetnames:
-                target_sheet = name
-                break
-        
-        if not target_sheet:
-            return f"❌ Лист {sheet_name} не найден"
-        
-        ws = wb[target_sheet]
-        
-        # Находим последнюю строку с данными
-        last_row = find_last_data_row(ws)
-        
-        if last_row <= 1:
-            return "❌ Нет записей для удаления"
-        
-        # Сохраняем данные для сообщения
-        date = ws.cell(row=last_row, column=1).value
-        category = ws.cell(row=last_row, column=2).value
-        amount = ws.cell(row=last_row, column=4).value
-        
-        # 🔧 Преобразование суммы в число для форматирования
-        try:
-            if amount is None:
-                amount_float = 0
-            else:
-                # Если это строка, убираем пробелы и заменяем запятую на точку
-                if isinstance(amount, str):
-                    # Убираем все пробелы и заменяем запятую на точку
-                    amount = amount.replace(' ', '').replace(',', '.')
-                    # Если есть символ рубля, убираем его
-                    amount = amount.replace('₽', '').replace('руб', '').strip()
-                amount_float = float(amount)
-                logger.info(f"Сумма для удаления преобразована: {amount} -> {amount_float}")
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Не удалось преобразовать сумму '{amount}' в число: {e}")
+        if amount is None:
             amount_float = 0
-        
-        # Удаляем строку
-        ws.delete_rows(last_row)
-        
-        # Сохраняем файл
-        wb.save(LOCAL_EXCEL_PATH)
-        
-        if upload_to_yandex():
-            if sheet_name == "Расходы":
-                return f"✅ Удалён расход: {date} | {category} | {amount_float:,.0f} ₽"
-            else:
-                return f"✅ Удалён доход: {date} | {category} | {amount_float:,.0f} ₽"
         else:
-            return "⚠️ Запись удалена локально"
-            
-    except Exception as e:
-        logger.error(f"Ошибка удаления: {e}")
-        return f"❌ Ошибка удаления: {str(e)}"
+            # Если это строка, убираем пробелы и заменяем запятую на точку
+            if isinstance(amount, str):
+                # Убираем все пробелы и заменяем запятую на точку
+                amount = amount.replace(' ', '').replace(',', '.')
+                # Если есть символ рубля, убираем его
+                amount = amount.replace('₽', '').replace('руб', '').strip()
+            amount_float = float(amount)
+            logger.info(f"Сумма для удаления преобразована: {amount} -> {amount_float}")
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Не удалось преобразовать сумму '{amount}' в число: {e}")
+        amount_float = 0
+    
+    # Удаляем строку
+    ws.delete_rows(last_row)
+    _set_last_row(wb, ws, _last_row_above(ws, last_row))
+    
+    return deleted_message(sheet_name, date, category, amount_float), (target_sheet, last_row)
 
 
 # ========== НОВЫЕ ФУНКЦИИ СТАТИСТИКИ ==========
 
-def get_statistics(by_categories=False, balance=False, period=None):
-    """
-    Получение статистики из Excel файла
+def format_statistics(summary, by_categories, balance, period):
+    """Текст статистики по готовым итогам книги (LedgerSummary)"""
+    result = []
     
-    Параметры:
-    - by_categories: True - расходы по категориям
-    - balance: True - баланс (доходы - расходы)
-    - period: "current" - текущий период (10-24)
-             "previous" - предыдущий период (25-9)
-             "all" - за всё время
-    """
-    try:
-        if not download_from_yandex():
-            return "❌ Не удалось скачать файл"
-        
-        wb = load_workbook(LOCAL_EXCEL_PATH, data_only=True)
-        
-        result = []
-        
-        # ===== СТАТИСТИКА ПО КАТЕГОРИЯМ РАСХОДОВ =====
-        if by_categories:
-            sheet_name = None
-            for name in ["Расходы", "расходы", "Лист1", "budget"]:
-                if name in wb.sheetnames:
-                    sheet_name = name
-                    break
-            
-            if sheet_name:
-                ws = wb[sheet_name]
-                
-                # Собираем суммы по категориям
-                categories = {}
-                total = 0
-                
-                for row in range(2, ws.max_row + 1):
-                    cat = ws.cell(row=row, column=2).value  # Категория
-                    amount = ws.cell(row=row, column=4).value  # Сумма
-                    
-                    if cat and amount:
-                        try:
-                            # Преобразуем в число, если это строка
-                            if isinstance(amount, str):
-                                amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                            amount_val = float(amount)
-                            categories[cat] = categories.get(cat, 0) + amount_val
-                            total += amount_val
-                        except (ValueError, TypeError):
-                            continue
-                
-                # Сортируем по убыванию
-                sorted_cats = sorted(categories.items(), key=lambda x: x[1], reverse=True)
-                
-                for cat, amt in sorted_cats[:10]:  # Топ-10
-                    percent = (amt / total * 100) if total > 0 else 0
-                    result.append(f"{cat}: {amt:,.0f} ₽ ({percent:.1f}%)")
-                
-                result.append(f"\n💰 Всего расходов: {total:,.0f} ₽")
-            else:
-                result.append("❌ Лист с расходами не найден")
-        
-        # ===== БАЛАНС (ДОХОДЫ - РАСХОДЫ) =====
-        elif balance:
-            income_total = 0
-            expense_total = 0
+    # ===== СТАТИСТИКА ПО КАТЕГОРИЯМ РАСХОДОВ =====
+    if by_categories:
+        if summary.sheets["expenses"]:
+            total = summary.categorized_total
             
-            # Считаем доходы
-            income_sheet = None
-            for name in ["Доходы", "доходы"]:
-                if name in wb.sheetnames:
-                    income_sheet = name
-                    break
+            # Сортируем по убыванию
+            sorted_cats = sorted(summary.categories.items(), key=lambda x: x[1], reverse=True)
             
-            if income_sheet:
-                ws = wb[income_sheet]
-                for row in range(2, ws.max_row + 1):
-                    amount = ws.cell(row=row, column=3).value  # Сумма в колонке C
-                    if amount:
-                        try:
-                            if isinstance(amount, str):
-                                amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                            income_total += float(amount)
-                        except (ValueError, TypeError):
-                            pass
+            for cat, amt in sorted_cats[:10]:  # Топ-10
+                percent = (amt / total * 100) if total > 0 else 0
+                result.append(f"{cat}: {amt:,.0f} ₽ ({percent:.1f}%)")
             
-            # Считаем расходы
-            expense_sheet = None
-            for name in ["Расходы", "расходы"]:
-                if name in wb.sheetnames:
-                    expense_sheet = name
-                    break
-            
-            if expense_sheet:
-                ws = wb[expense_sheet]
-                for row in range(2, ws.max_row + 1):
-                    amount = ws.cell(row=row, column=4).value  # Сумма в колонке D
-                    if amount:
-                        try:
-                            if isinstance(amount, str):
-                                amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                            expense_total += float(amount)
-                        except (ValueError, TypeError):
-                            pass
-            
-            balance_total = income_total - expense_total
-            
-            result.append(f"💵 Доходы: {income_total:,.0f} ₽")
-            result.append(f"💰 Расходы: {expense_total:,.0f} ₽")
-            result.append(f"📊 Баланс: {balance_total:,.0f} ₽")
-        
-        # ===== СТАТИСТИКА ЗА ПЕРИОД =====
-        elif period:
-            sheet_name = None
-            for name in ["Расходы", "расходы"]:
-                if name in wb.sheetnames:
-                    sheet_name = name
-                    break
+            result.append(f"\n💰 Всего расходов: {total:,.0f} ₽")
+        else:
+            result.append("❌ Лист с расходами не найден")
+    
+    # ===== БАЛАНС (ДОХОДЫ - РАСХОДЫ) =====
+    elif balance:
+        result.append(f"💵 Доходы: {summary.income_total:,.0f} ₽")
+        result.append(f"💰 Расходы: {summary.expense_total:,.0f} ₽")
+        result.append(f"📊 Баланс: {summary.balance:,.0f} ₽")
+    
+    # ===== СТАТИСТИКА ЗА ПЕРИОД =====
+    elif period:
+        if summary.sheets["expenses"]:
+            period_total = summary.period_total(period)
+            target_period = PERIOD_LABELS.get(period)
             
-            if sheet_name:
-                ws = wb[sheet_name]
-                
-                period_map = {
-                    "current": "10-24",
-                    "previous": "25-9"
-                }
-                
-                target_period = period_map.get(period) if period != "all" else None
-                period_total = 0
-                
-                for row in range(2, ws.max_row + 1):
-                    row_period = ws.cell(row=row, column=6).value  # Период
-                    amount = ws.cell(row=row, column=4).value  # Сумма
-                    
-                    if period == "all" or (target_period and row_period == target_period):
-                        if amount:
-                            try:
-                                if isinstance(amount, str):
-                                    amount = amount.replace(' ', '').replace(',', '.').replace('₽', '').strip()
-                                period_total += float(amount)
-                            except (ValueError, TypeError):
-                                pass
-                
-                if period == "all":
-                    result.append(f"📅 Всего расходов за всё время: {period_total:,.0f} ₽")
-                elif target_period == "10-24":
-                    result.append(f"📅 Расходы за текущий период (10-24): {period_total:,.0f} ₽")
-                elif target_period == "25-9":
-                    result.append(f"📅 Расходы за предыдущий период (25-9): {period_total:,.0f} ₽")
-            else:
-                result.append("❌ Лист с расходами не найден")
-        
-        return "\n".join(result) if result else "❌ Нет данных для отображения"
-        
-    except Exception as e:
-        logger.error(f"Ошибка получения статистики: {e}")
-        return f"❌ Ошибка при подсчете статистики: {str(e)}"
-
-
-def get_categories_summary():
-    """Краткий обзор расходов по категориям (для быстрого отображения)"""
-    return get_statistics(by_categories=True)
-
-
-def get_balance_summary():
-    """Краткий обзор баланса"""
-    return get_statistics(balance=True)
-
-
-def get_period_summary(period_type="current"):
-    """Краткий обзор за период"""
-    return get_statistics(period=period_type)
+            if period == "all":
+                result.append(f"📅 Всего расходов за всё время: {period_total:,.0f} ₽")
+            elif target_period == "10-24":
+                result.append(f"📅 Расходы за текущий период (10-24): {period_total:,.0f} ₽")
+            elif target_period == "25-9":
+                result.append(f"📅 Расходы за предыдущий период (25-9): {period_total:,.0f} ₽")
+        else:
+            result.append("❌ Лист с расходами не найден")
+    
+    return "\n".join(result) if result else "❌ Нет данных для отображения"